@@ -51,29 +51,34 @@ class LineNumberTextSplitter(RecursiveCharacterTextSplitter):
     A custom text splitter that tracks and annotates line numbers for each chunk.
     """
 
-    def create_documents(self, texts: List[str], **kwargs) -> List[Document]:
+    def create_documents(self, texts: List[str], start_line: int = 1, **kwargs) -> List[Document]:
         documents = []
-        current_line = 1  # Initialize the starting line number
+        current_line = start_line  # Initialize the starting line number
 
         for text in texts:
             # Split the text into chunks using the parent class's method
             chunks = self.split_text(text)
+            offset = 0
             for chunk in chunks:
-                # Calculate the number of lines in the chunk
-                num_lines = chunk.count('\n') + 1
+                # Chunks overlap and are stripped, so their first line is found from their position in the text
+                index = text.find(chunk, offset)
+                if index == -1:
+                    index = offset
+                from_line = current_line + text.count('\n', 0, index)
                 doc = Document(
                     page_content=chunk,
                     metadata={
                         'loc': {
                             'lines': {
-                                'from': current_line,
-                                'to': current_line + num_lines - 1
+                                'from': from_line,
+                                'to': from_line + chunk.count('\n')
                             }
                         }
                     }
                 )
                 documents.append(doc)
-                current_line += num_lines  # Update the current line number
+                offset = index + 1
+            current_line += text.count('\n') + 1  # Update the current line number
 
         return documents
 
@@ -88,12 +93,13 @@ class CodeSplitter:
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
 
-    def split_code(self, file_extension: str, code: str) -> Optional[str]:
+    def split_code(self, file_extension: str, code: str, start_line: int = 1) -> Optional[str]:
         """
         Splits the provided code into chunks based on the file extension.
 
         :param file_extension: The file extension indicating the programming language.
         :param code: The code content to be split.
+        :param start_line: Line number of the first line of code in its file (when code is a segment of a file).
         :return: The code with line numbers or None if the language is not supported.
         """
         language = get_language_from_extension(file_extension)
@@ -110,7 +116,7 @@ class CodeSplitter:
         )
 
         try:
-            docs = splitter.create_documents([code])
+            docs = splitter.create_documents([code], start_line=start_line)
         except Exception as e:
             logger.critical(f"Error during splitting: {e}")
             return None
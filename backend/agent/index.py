@@ -1,6 +1,7 @@
+import hashlib
 from typing import Optional, List
 
-from agent.prompt import CodePrompt, FolderPrompt
+from agent.prompt import CodePrompt, FolderPrompt, CodeSegmentsPrompt
 from agent.schema_parser import SchemaParser
 from agent.schema_factory import FileSchema, FolderSchema
 from agent.prompt_generator import PromptGenerator, FilePromptTemplateVariables, PromptTemplateConfig, PromptType, \
@@ -40,10 +41,17 @@ class CodeProcessor(BaseProcessor):
             ),
             PromptType.FILE
         )
+        # Identifies the instructions given to the LLM, cached summaries are only reused for the same version
+        self.prompt_version = hashlib.sha256(
+            (self.prompt_generator.prompt.template + CodePrompt + self.schema_parser.format_instructions).encode()
+        ).hexdigest()
 
-    async def generate(self, code: str, repo_info: dict[str, str]) -> dict:
+    async def generate(self, code: str, repo_info: dict[str, str], start_line: int = 1) -> dict:
+        """
+        :param start_line: Line number of the first line of code, when code is a segment of a larger file
+        """
         extension = repo_info.get('path').split('.').pop()
-        splitted_code = self.code_splitter.split_code(extension, code)
+        splitted_code = self.code_splitter.split_code(extension, code, start_line)
         variables = FilePromptTemplateVariables(
             requirements=CodePrompt,
             format_instructions=self.schema_parser.format_instructions,
@@ -57,6 +65,41 @@ class CodeProcessor(BaseProcessor):
         return await self.process(prompt)
 
 
+# Code Segments Processor: merges the summaries of the segments of a file too large for a single prompt
+class CodeSegmentsProcessor(BaseProcessor):
+    def __init__(self, llm: LLMProvider):
+        super().__init__(llm)
+        self.schema_parser = SchemaParser(FileSchema)
+        self.prompt_generator = PromptGenerator(
+            PromptTemplateConfig(
+                template=(
+                    'The following instruction is given:\n{requirements}\n{format_instructions}\n'
+                    'The given repository owner is {repo_owner} with repository name of {repo_name}\n'
+                    'The commit SHA referenced is {commit_sha}\n'
+                    'The path of the file is {path}\n'
+                    'Below are the summaries of the segments of the file:\n{ai_summaries}'
+                )
+            ),
+            PromptType.FILE_SEGMENTS
+        )
+        self.prompt_version = hashlib.sha256(
+            (self.prompt_generator.prompt.template + CodeSegmentsPrompt + self.schema_parser.format_instructions).encode()
+        ).hexdigest()
+
+    async def generate(self, ai_summaries: List[str], repo_info: dict[str, str]) -> dict:
+        variables = FolderPromptTemplateVariables(
+            requirements=CodeSegmentsPrompt,
+            format_instructions=self.schema_parser.format_instructions,
+            ai_summaries='\n'.join(ai_summaries),
+            repo_owner=repo_info.get('repo_owner'),
+            commit_sha=repo_info.get('commit_sha'),
+            path=repo_info.get('path'),
+            repo_name=repo_info.get('repo_name'),
+        )
+        prompt = await self.prompt_generator.generate(variables, ai_summaries=ai_summaries)
+        return await self.process(prompt)
+
+
 # Folder Processor
 class FolderProcessor(BaseProcessor):
     def __init__(self, llm: LLMProvider):
@@ -64,3 +64,32 @@ You will receive the following information, summarized from the expert software
 
 **Output:**
 """
+
+CodeSegmentsPrompt: str = """
+You are an expert software engineer and your task is to deeply analyze a provided code file from a GitHub repository. Your goal is to generate a comprehensive and structured summary of the file that is suitable for a developer-friendly wiki page in markdown format but without backticks.
+
+**Input:**
+
+The file was too large to be analyzed at once, so it was split into consecutive segments of lines and each segment was summarized separately by an expert software engineer. You will receive:
+
+1. **Segment Summaries:**
+* The summary of each segment of the file, in the order of the file.
+* The owner of the repository.
+* The repository name.
+* The commit sha of the repository.
+* The path to the code file within the repository.
+
+**Analysis Tasks:**
+
+1. **High-Level Overview:**
+*   Provide a concise summary of the whole file responsibilities and functionalities based on the summaries of its segments.
+*   Explain its role in the overall system.
+*   Identify its dependencies on other modules/components.
+*   Highlight any important classes, functions, or data structures, whichever segment they are in.
+*   Keep the markdown links to code blocks given in the segment summaries exactly as they are, their line numbers are already those of the whole file. Do not create links with line numbers that are not in the segment summaries.
+2. **Code-Level Insights:**
+*   Explain how the parts described in the different segments work together.
+*   Identify core algorithms, data structures, and design patterns used.
+
+**Output:**
+"""
@@ -7,6 +7,7 @@ from langchain.prompts import PromptTemplate
 class PromptType(str, Enum):
     FOLDER = 'folder'
     FILE = 'file'
+    FILE_SEGMENTS = 'file_segments'
 
 
 class RepoInfo(BaseModel):
@@ -46,6 +47,7 @@ class PromptGenerator:
     ) -> Optional[str]:
         prompt_map = {
             PromptType.FOLDER: '\n'.join(ai_summaries) if ai_summaries else '',
+            PromptType.FILE_SEGMENTS: '\n'.join(ai_summaries) if ai_summaries else '',
             PromptType.FILE: code or '',
         }
 
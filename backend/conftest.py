@@ -0,0 +1,6 @@
+import os
+
+# Settings the configuration modules require at import time, values of .env.example
+os.environ.setdefault('TOKEN_PROCESSING_CHARACTER_LIMIT', '30000')
+os.environ.setdefault('TOKEN_PROCESSING_MAX_RETRIES', '3')
+os.environ.setdefault('TOKEN_PROCESSING_REDUCE_CHAR_PER_RETRY', '3000')
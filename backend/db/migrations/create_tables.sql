@@ -32,8 +32,11 @@ CREATE TABLE IF NOT EXISTS Branch (
     commit_at       TIMESTAMP,
     created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     ai_summary      TEXT,
+    status          VARCHAR(20) NOT NULL DEFAULT 'done',
+    stage           INT NOT NULL DEFAULT 8,
     FOREIGN KEY (repository_url) REFERENCES Repository(url) ON DELETE CASCADE,
-    CONSTRAINT unique_last_commit_per_repo UNIQUE (repository_url, last_commit_sha)
+    CONSTRAINT unique_last_commit_per_repo UNIQUE (repository_url, last_commit_sha),
+    CHECK ( status IN ('ingesting', 'done') )
 );
 
 CREATE TABLE IF NOT EXISTS Folder (
@@ -57,5 +60,165 @@ CREATE TABLE IF NOT EXISTS File (
     content         TEXT,
     ai_summary      TEXT,
     usage           VARCHAR(100),
+    sha             VARCHAR(40),
     FOREIGN KEY (folder_id) REFERENCES Folder(folder_id) ON DELETE CASCADE
-);
\ No newline at end of file
+);
+
+/**
+Ingest jobs shared by every backend process. Workers claim rows with FOR UPDATE SKIP LOCKED and keep
+extending lease_expires_at while they work, a job whose lease ran out is picked up again by another worker.
+Queued jobs are claimed cheapest first (estimated_bytes), minus an aging credit for the time they have waited.
+*/
+CREATE TABLE IF NOT EXISTS InsertJob (
+    job_id              SERIAL PRIMARY KEY,
+    owner               VARCHAR(50) NOT NULL,
+    repo                VARCHAR(50) NOT NULL,
+    status              VARCHAR(20) NOT NULL DEFAULT 'queued',
+    estimated_files     INT,
+    estimated_bytes     BIGINT,
+    fetch_mode          VARCHAR(10),
+    max_file_bytes      BIGINT,
+    path_rules          TEXT[],
+    refresh             BOOLEAN NOT NULL DEFAULT FALSE,
+    attempts            INT NOT NULL DEFAULT 0,
+    lease_owner         VARCHAR(100),
+    lease_expires_at    TIMESTAMPTZ,
+    progress            JSONB,
+    progress_updated_at TIMESTAMPTZ,
+    error               TEXT,
+    created_at          TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    started_at          TIMESTAMPTZ,
+    finished_at         TIMESTAMPTZ,
+    CHECK ( status IN ('queued', 'processing', 'done', 'failed') )
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS unique_active_job_per_repo
+    ON InsertJob (owner, repo) WHERE status IN ('queued', 'processing');
+
+CREATE INDEX IF NOT EXISTS insert_job_status_idx ON InsertJob (status, created_at);
+
+/**
+Upgrade of databases created before refreshes: a branch is a snapshot of the repository at a commit, the one
+shown is the latest 'done' one. Existing branches are complete snapshots, hence the 'done' default.
+File.sha is the git blob SHA, unchanged files are copied from the previous snapshot instead of summarized again.
+*/
+ALTER TABLE Branch ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'done';
+-- Named as the CHECK of CREATE TABLE Branch gets named, so only tables created before the column get it here
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conrelid = 'Branch'::regclass AND conname = 'branch_status_check'
+    ) THEN
+        ALTER TABLE Branch ADD CONSTRAINT branch_status_check CHECK ( status IN ('ingesting', 'done') );
+    END IF;
+END $$;
+ALTER TABLE File ADD COLUMN IF NOT EXISTS sha VARCHAR(40);
+
+/**
+Upgrade of databases created before resumable ingests: Branch.stage is the last completed step of the ingest,
+an interrupted one resumes after it with the folders and the summarized files it already inserted.
+*/
+ALTER TABLE Branch ADD COLUMN IF NOT EXISTS stage INT NOT NULL DEFAULT 8;
+
+/**
+File summaries keyed by content: a blob already summarized with the same prompt and model (in a fork, a vendored
+copy or another repository) reuses its summary instead of calling the LLM. The GitHub links of a reused summary
+are rewritten from where it was generated (repo_owner, repo_name, commit_sha, path) to where it is reused.
+Least recently used rows are evicted once the summaries exceed the configured size.
+*/
+CREATE TABLE IF NOT EXISTS SummaryCache (
+    blob_sha        VARCHAR(40) NOT NULL,
+    prompt_hash     VARCHAR(64) NOT NULL,
+    model_name      VARCHAR(100) NOT NULL,
+    repo_owner      VARCHAR(50) NOT NULL,
+    repo_name       VARCHAR(50) NOT NULL,
+    commit_sha      VARCHAR(40) NOT NULL,
+    path            TEXT NOT NULL,
+    ai_summary      TEXT NOT NULL,
+    usage           VARCHAR(100),
+    size_bytes      INT NOT NULL,
+    hits            INT NOT NULL DEFAULT 0,
+    created_at      TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    last_used_at    TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (blob_sha, prompt_hash, model_name)
+);
+
+CREATE INDEX IF NOT EXISTS summary_cache_last_used_idx ON SummaryCache (last_used_at);
+
+/**
+Upgrade of databases created before the archive fetch mode: InsertJob.fetch_mode is how the files of the job are
+downloaded (one request per file, one tarball per commit or batches of files per GraphQL query), NULL for the
+default of the backend.
+*/
+ALTER TABLE InsertJob ADD COLUMN IF NOT EXISTS fetch_mode VARCHAR(10);
+-- Added once, and replaced in databases that got it before the graphql fetch mode
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'InsertJob'::regclass AND conname = 'insertjob_fetch_mode_check'
+          AND pg_get_constraintdef(oid) LIKE '%graphql%'
+    ) THEN
+        ALTER TABLE InsertJob DROP CONSTRAINT IF EXISTS insertjob_fetch_mode_check;
+        ALTER TABLE InsertJob ADD CONSTRAINT insertjob_fetch_mode_check
+            CHECK ( fetch_mode IN ('auto', 'raw', 'archive', 'graphql') );
+    END IF;
+END $$;
+
+/**
+Responses of the GitHub API (repository details, trees) with their ETag, keyed by URL and by a hash of the token
+they were fetched with. They are revalidated with If-None-Match, a 304 does not count against the rate limit.
+Least recently used rows are evicted once the bodies exceed the configured size.
+*/
+CREATE TABLE IF NOT EXISTS GithubResponseCache (
+    url             TEXT NOT NULL,
+    token_hash      VARCHAR(64) NOT NULL,
+    etag            TEXT NOT NULL,
+    body            TEXT NOT NULL,
+    size_bytes      INT NOT NULL,
+    hits            INT NOT NULL DEFAULT 0,
+    created_at      TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    last_used_at    TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (url, token_hash)
+);
+
+CREATE INDEX IF NOT EXISTS github_response_cache_last_used_idx ON GithubResponseCache (last_used_at);
+
+/**
+Upgrade of databases created before the size policy: InsertJob.max_file_bytes is the size above which the files of the
+job are not downloaded, NULL for the default of the backend.
+*/
+ALTER TABLE InsertJob ADD COLUMN IF NOT EXISTS max_file_bytes BIGINT;
+
+/**
+Upgrade of databases created before per-job path rules: InsertJob.path_rules are gitignore-style rules applied on top
+of the built-in path filters of the job, NULL for none.
+*/
+ALTER TABLE InsertJob ADD COLUMN IF NOT EXISTS path_rules TEXT[];
+
+/**
+A folder path is unique in its branch and a file name in its folder, so inserting a row that is already there (e.g. by
+the worker whose lease ran out and the one that took its job over) does nothing. Databases created before may hold
+such duplicates: the start then fails until they are merged once with python db/scripts/dedupe_rows.py.
+*/
+DO $$
+BEGIN
+    IF to_regclass('unique_folder_path_per_branch') IS NULL THEN
+        IF EXISTS (SELECT 1 FROM Folder GROUP BY branch_id, path HAVING COUNT(*) > 1) THEN
+            RAISE EXCEPTION 'Folder holds duplicate paths, run python db/scripts/dedupe_rows.py once';
+        END IF;
+        CREATE UNIQUE INDEX unique_folder_path_per_branch ON Folder (branch_id, path);
+    END IF;
+    IF to_regclass('unique_file_per_folder') IS NULL THEN
+        IF EXISTS (SELECT 1 FROM File GROUP BY folder_id, name HAVING COUNT(*) > 1) THEN
+            RAISE EXCEPTION 'File holds duplicate names, run python db/scripts/dedupe_rows.py once';
+        END IF;
+        CREATE UNIQUE INDEX unique_file_per_folder ON File (folder_id, name);
+    END IF;
+END $$;
+
+/**
+Upgrade of databases created before refreshes were stored with their job: InsertJob.refresh tells that the repository
+is already in DB and is ingested again at its latest commit, which also updates its metadata.
+*/
+ALTER TABLE InsertJob ADD COLUMN IF NOT EXISTS refresh BOOLEAN NOT NULL DEFAULT FALSE;
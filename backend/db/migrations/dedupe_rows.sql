@@ -0,0 +1,22 @@
+/**
+One-time cleanup of databases created before the unique folder paths and file names (see create_tables.sql), run by
+db/scripts/dedupe_rows.py in a single transaction.
+Duplicate folders of a branch are merged into the first one: their files and subfolders are moved to it before they
+are deleted. Duplicate files of a folder (including the ones the merge brings together) keep their first row.
+*/
+CREATE TEMP TABLE folder_duplicates ON COMMIT DROP AS
+    SELECT folder_id, keep_id
+    FROM (
+        SELECT folder_id, MIN(folder_id) OVER (PARTITION BY branch_id, path) AS keep_id FROM Folder
+    ) AS f
+    WHERE folder_id != keep_id;
+
+UPDATE Folder SET parent_folder_id = d.keep_id
+FROM folder_duplicates d WHERE Folder.parent_folder_id = d.folder_id;
+
+UPDATE File SET folder_id = d.keep_id
+FROM folder_duplicates d WHERE File.folder_id = d.folder_id;
+
+DELETE FROM Folder WHERE folder_id IN (SELECT folder_id FROM folder_duplicates);
+
+DELETE FROM File f USING File d WHERE f.folder_id = d.folder_id AND f.name = d.name AND f.file_id > d.file_id;
@@ -11,6 +11,8 @@ class BranchData:
             commit_at,
             created_at,
             ai_summary: Optional[str],
+            status: str,
+            stage: int,
     ):
         self.branch_id = branch_id
         self.last_commit_sha = last_commit_sha
@@ -19,6 +21,8 @@ class BranchData:
         self.commit_at = commit_at
         self.created_at = created_at
         self.ai_summary = ai_summary
+        self.status = status  # 'ingesting' until every file and folder of the snapshot is summarized
+        self.stage = stage  # last completed step of InsertRepoService.insertRepository, an interrupted ingest resumes after it
 
 
 class Branch:
@@ -26,7 +30,15 @@ class Branch:
         self.db = db
 
     async def select(self, repository_url: str) -> Optional[BranchData]:
-        query = "SELECT * FROM Branch WHERE repository_url = $1"
+        """
+        Returns the latest complete snapshot of the repository.
+        """
+        query = """
+            SELECT * FROM Branch
+            WHERE repository_url = $1 AND status = 'done'
+            ORDER BY created_at DESC, branch_id DESC
+            LIMIT 1
+        """
         rows = await self.db.query(query, [repository_url])
         if not rows:
             return None
@@ -39,6 +51,34 @@ class Branch:
             commit_at=row["commit_at"],
             created_at=row["created_at"],
             ai_summary=row["ai_summary"],
+            status=row["status"],
+            stage=row["stage"],
+        )
+
+    async def select_interrupted(self, repository_url: str) -> Optional[BranchData]:
+        """
+        Returns the latest snapshot whose ingest did not finish, if any.
+        """
+        query = """
+            SELECT * FROM Branch
+            WHERE repository_url = $1 AND status = 'ingesting'
+            ORDER BY created_at DESC, branch_id DESC
+            LIMIT 1
+        """
+        rows = await self.db.query(query, [repository_url])
+        if not rows:
+            return None
+        row = rows[0]
+        return BranchData(
+            branch_id=row["branch_id"],
+            last_commit_sha=row["last_commit_sha"],
+            name=row["name"],
+            repository_url=row["repository_url"],
+            commit_at=row["commit_at"],
+            created_at=row["created_at"],
+            ai_summary=row["ai_summary"],
+            status=row["status"],
+            stage=row["stage"],
         )
 
     async def insert(
@@ -49,8 +89,8 @@ class Branch:
             commit_at,
     ) -> BranchData:
         query = """
-            INSERT INTO Branch (last_commit_sha, name, repository_url, commit_at)
-            VALUES ($1, $2, $3, $4)
+            INSERT INTO Branch (last_commit_sha, name, repository_url, commit_at, status, stage)
+            VALUES ($1, $2, $3, $4, 'ingesting', 3)
             ON CONFLICT DO NOTHING
             RETURNING *;
         """
@@ -75,6 +115,8 @@ class Branch:
             commit_at=row["commit_at"],
             created_at=row["created_at"],
             ai_summary=row["ai_summary"],
+            status=row["status"],
+            stage=row["stage"],
         )
 
     async def update(self, ai_summary: str, branch_id: int) -> BranchData:
@@ -94,4 +136,17 @@ class Branch:
             commit_at=row["commit_at"],
             created_at=row["created_at"],
             ai_summary=row["ai_summary"],
-        )
\ No newline at end of file
+            status=row["status"],
+            stage=row["stage"],
+        )
+
+    async def finish(self, branch_id: int) -> None:
+        """
+        Marks the snapshot as complete, which makes it the one shown for the repository.
+        """
+        query = "UPDATE Branch SET status = 'done', stage = 8 WHERE branch_id = $1"
+        await self.db.query(query, [branch_id])
+
+    async def set_stage(self, branch_id: int, stage: int) -> None:
+        query = "UPDATE Branch SET stage = $1 WHERE branch_id = $2"
+        await self.db.query(query, [stage, branch_id])
@@ -11,6 +11,7 @@ class FileData:
             content: str,
             ai_summary: Optional[str],
             usage: Optional[str],
+            sha: Optional[str],
     ):
         self.file_id = file_id
         self.name = name
@@ -19,6 +20,25 @@ class FileData:
         self.content = content
         self.ai_summary = ai_summary
         self.usage = usage
+        self.sha = sha  # git blob SHA of the content
+
+
+class FileSnapshotData:
+    """
+    A file of a branch snapshot without its content, enough to tell whether it changed in a newer commit.
+    """
+
+    def __init__(
+            self,
+            file_id: int,
+            path: str,
+            sha: Optional[str],
+            ai_summary: Optional[str],
+    ):
+        self.file_id = file_id
+        self.path = path
+        self.sha = sha
+        self.ai_summary = ai_summary
 
 
 class File:
@@ -39,6 +59,7 @@ class File:
                     content=row["content"],
                     ai_summary=row["ai_summary"],
                     usage=row["usage"],
+                    sha=row["sha"],
                 )
             )
         return results
@@ -50,17 +71,18 @@ class File:
             content: str,
             ai_summary: str,
             usage: str,
+            sha: Optional[str] = None,
     ) -> Optional[FileData]:
         query = """
-            INSERT INTO File (name, folder_id, content, ai_summary, usage)
-            VALUES ($1, $2, $3, $4, $5)
-            ON CONFLICT DO NOTHING
+            INSERT INTO File (name, folder_id, content, ai_summary, usage, sha)
+            VALUES ($1, $2, $3, $4, $5, $6)
+            ON CONFLICT (folder_id, name) DO NOTHING
             RETURNING *;
         """
-        rows = await self.db.query(query, [name, folder_id, content, ai_summary, usage])
+        rows = await self.db.query(query, [name, folder_id, content, ai_summary, usage, sha])
 
         if not rows:
-            # Possibly the row already exists; fetch it
+            # The folder already has this file (unique_file_per_folder); fetch it
             get_query = """
                 SELECT * FROM File
                 WHERE name = $1 AND folder_id = $2
@@ -80,4 +102,50 @@ class File:
             content=row["content"],
             ai_summary=row["ai_summary"],
             usage=row["usage"],
-        )
\ No newline at end of file
+            sha=row["sha"],
+        )
+
+    async def select_snapshot(self, branch_id: int) -> List[FileSnapshotData]:
+        query = """
+            SELECT f.file_id, f.name, f.sha, f.ai_summary, fo.path AS folder_path
+            FROM File f
+            JOIN Folder fo ON f.folder_id = fo.folder_id
+            WHERE fo.branch_id = $1
+        """
+        rows = await self.db.query(query, [branch_id])
+        return [
+            FileSnapshotData(
+                file_id=row["file_id"],
+                path=f'{row["folder_path"]}/{row["name"]}' if row["folder_path"] else row["name"],
+                sha=row["sha"],
+                ai_summary=row["ai_summary"],
+            )
+            for row in rows
+        ]
+
+    async def copy_forward(
+            self,
+            file_ids: List[int],
+            folder_ids: List[int],
+            old_commit_sha: str,
+            new_commit_sha: str,
+    ) -> int:
+        """
+        Copies unchanged files into the folders of a newer snapshot, content and summary included, without
+        sending them back and forth. The commit SHA of the GitHub links in the summaries is moved to the new
+        commit, the line numbers stay valid since the blob is the same.
+
+        :param file_ids: Files of the previous snapshot
+        :param folder_ids: Folder of the new snapshot each file goes to (same order as file_ids)
+        :return: Number of files copied, files already in their new folder are left as they are
+        """
+        query = """
+            INSERT INTO File (name, folder_id, content, ai_summary, usage, sha)
+            SELECT f.name, m.folder_id, f.content, REPLACE(f.ai_summary, $3, $4), f.usage, f.sha
+            FROM unnest($1::int[], $2::int[]) AS m(file_id, folder_id)
+            JOIN File f ON f.file_id = m.file_id
+            ON CONFLICT (folder_id, name) DO NOTHING
+            RETURNING file_id;
+        """
+        rows = await self.db.query(query, [file_ids, folder_ids, old_commit_sha, new_commit_sha])
+        return len(rows)
@@ -54,7 +54,7 @@ class Folder:
             query = """
                 INSERT INTO Folder (name, path, branch_id)
                 VALUES ($1, $2, $3)
-                ON CONFLICT DO NOTHING
+                ON CONFLICT (branch_id, path) DO NOTHING
                 RETURNING *;
             """
             values = [name, path, branch_id]
@@ -62,24 +62,15 @@ class Folder:
             query = """
                 INSERT INTO Folder (name, path, branch_id, parent_folder_id)
                 VALUES ($1, $2, $3, $4)
-                ON CONFLICT DO NOTHING
+                ON CONFLICT (branch_id, path) DO NOTHING
                 RETURNING *;
             """
             values = [name, path, branch_id, parent_folder_id]
 
         rows = await self.db.query(query, values)
         if not rows:
-            # Fetch existing
-            if parent_folder_id is None:
-                get_query = "SELECT * FROM Folder WHERE path = $1 AND branch_id = $2"
-                get_values = [path, branch_id]
-            else:
-                get_query = """
-                    SELECT * FROM Folder WHERE path = $1 AND branch_id = $2 AND parent_folder_id = $3
-                """
-                get_values = [path, branch_id, parent_folder_id]
-
-            existing = await self.db.query(get_query, get_values)
+            # The branch already has this folder (unique_folder_path_per_branch); fetch it
+            existing = await self.db.query("SELECT * FROM Folder WHERE path = $1 AND branch_id = $2", [path, branch_id])
             row = existing[0]
         else:
             row = rows[0]
@@ -115,4 +106,24 @@ class Folder:
 
     async def delete(self, folder_id: int) -> None:
         query = "DELETE FROM Folder WHERE folder_id = $1"
-        await self.db.query(query, [folder_id])
\ No newline at end of file
+        await self.db.query(query, [folder_id])
+
+    async def copy_summaries(
+            self,
+            branch_id: int,
+            previous_branch_id: int,
+            paths: List[str],
+            old_commit_sha: str,
+            new_commit_sha: str,
+    ) -> None:
+        """
+        Copies the summaries of unchanged folders from the previous snapshot, with the commit SHA of their
+        GitHub links moved to the new commit.
+        """
+        query = """
+            UPDATE Folder AS n
+            SET ai_summary = REPLACE(o.ai_summary, $4, $5), usage = o.usage
+            FROM Folder AS o
+            WHERE n.branch_id = $1 AND o.branch_id = $2 AND n.path = o.path AND n.path = ANY($3::text[])
+        """
+        await self.db.query(query, [branch_id, previous_branch_id, paths, old_commit_sha, new_commit_sha])
@@ -0,0 +1,101 @@
+from typing import Optional
+from db.utils.connector import AsyncDBConnector
+
+
+class GithubResponseCacheData:
+    def __init__(
+            self,
+            url: str,
+            token_hash: str,
+            etag: str,
+            body: str,
+            size_bytes: int,
+            hits: int,
+            created_at,
+            last_used_at,
+    ):
+        self.url = url
+        self.token_hash = token_hash
+        self.etag = etag
+        self.body = body
+        self.size_bytes = size_bytes
+        self.hits = hits
+        self.created_at = created_at
+        self.last_used_at = last_used_at
+
+
+def _to_response_data(row: dict) -> GithubResponseCacheData:
+    return GithubResponseCacheData(
+        url=row["url"],
+        token_hash=row["token_hash"],
+        etag=row["etag"],
+        body=row["body"],
+        size_bytes=row["size_bytes"],
+        hits=row["hits"],
+        created_at=row["created_at"],
+        last_used_at=row["last_used_at"],
+    )
+
+
+class GithubResponseCache:
+    """
+    Provides async methods to interact with the `GithubResponseCache` table, GitHub API responses and their ETag.
+    """
+
+    def __init__(self, db: AsyncDBConnector):
+        self.db = db
+
+    async def select(self, url: str, token_hash: str) -> Optional[GithubResponseCacheData]:
+        query = "SELECT * FROM GithubResponseCache WHERE url = $1 AND token_hash = $2"
+        rows = await self.db.query(query, [url, token_hash])
+        if not rows:
+            return None
+        return _to_response_data(rows[0])
+
+    async def touch(self, url: str, token_hash: str) -> None:
+        """
+        Marks a response as recently used, after GitHub confirmed it is still valid.
+        """
+        query = """
+            UPDATE GithubResponseCache
+            SET hits = hits + 1, last_used_at = NOW()
+            WHERE url = $1 AND token_hash = $2;
+        """
+        await self.db.query(query, [url, token_hash])
+
+    async def upsert(self, url: str, token_hash: str, etag: str, body: str) -> None:
+        query = """
+            INSERT INTO GithubResponseCache (url, token_hash, etag, body, size_bytes)
+            VALUES ($1, $2, $3, $4, octet_length($4))
+            ON CONFLICT (url, token_hash) DO UPDATE
+            SET etag = EXCLUDED.etag,
+                body = EXCLUDED.body,
+                size_bytes = EXCLUDED.size_bytes,
+                last_used_at = NOW();
+        """
+        await self.db.query(query, [url, token_hash, etag, body])
+
+    async def evict(self, max_bytes: int) -> int:
+        """
+        Deletes the least recently used responses until the cache holds at most max_bytes of bodies.
+        :return: Number of evicted responses
+        """
+        query = """
+            DELETE FROM GithubResponseCache
+            WHERE (url, token_hash) IN (
+                SELECT url, token_hash FROM (
+                    SELECT url, token_hash,
+                           SUM(size_bytes) OVER (ORDER BY last_used_at DESC, created_at DESC) AS kept_bytes
+                    FROM GithubResponseCache
+                ) AS ranked
+                WHERE kept_bytes > $1
+            )
+            RETURNING 1;
+        """
+        rows = await self.db.query(query, [max_bytes])
+        return len(rows)
+
+    async def size(self) -> dict:
+        query = "SELECT COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS bytes FROM GithubResponseCache"
+        rows = await self.db.query(query)
+        return {"entries": rows[0]["entries"], "bytes": rows[0]["bytes"]}
@@ -0,0 +1,223 @@
+import json
+from typing import List, Optional
+from db.utils.connector import AsyncDBConnector
+
+
+class InsertJobData:
+    def __init__(
+            self,
+            job_id: int,
+            owner: str,
+            repo: str,
+            status: str,
+            estimated_files: Optional[int],
+            estimated_bytes: Optional[int],
+            fetch_mode: Optional[str],
+            max_file_bytes: Optional[int],
+            path_rules: Optional[List[str]],
+            refresh: bool,
+            attempts: int,
+            lease_owner: Optional[str],
+            lease_expires_at,
+            progress: Optional[dict],
+            progress_updated_at,
+            error: Optional[str],
+            created_at,
+            started_at,
+            finished_at,
+    ):
+        self.job_id = job_id
+        self.owner = owner
+        self.repo = repo
+        self.status = status
+        self.estimated_files = estimated_files
+        self.estimated_bytes = estimated_bytes
+        self.fetch_mode = fetch_mode  # None: PIPELINE_FETCH_MODE
+        self.max_file_bytes = max_file_bytes  # None: FILE_FILTER_MAX_FILE_BYTES
+        self.path_rules = path_rules  # gitignore-style rules on top of the built-in path filters
+        self.refresh = refresh  # re-ingest a repository already in DB at its latest commit
+        self.attempts = attempts
+        self.lease_owner = lease_owner
+        self.lease_expires_at = lease_expires_at
+        self.progress = progress
+        self.progress_updated_at = progress_updated_at
+        self.error = error
+        self.created_at = created_at
+        self.started_at = started_at
+        self.finished_at = finished_at
+
+
+def _to_job_data(row: dict) -> InsertJobData:
+    return InsertJobData(
+        job_id=row["job_id"],
+        owner=row["owner"],
+        repo=row["repo"],
+        status=row["status"],
+        estimated_files=row["estimated_files"],
+        estimated_bytes=row["estimated_bytes"],
+        fetch_mode=row["fetch_mode"],
+        max_file_bytes=row["max_file_bytes"],
+        path_rules=row["path_rules"],
+        refresh=row["refresh"],
+        attempts=row["attempts"],
+        lease_owner=row["lease_owner"],
+        lease_expires_at=row["lease_expires_at"],
+        progress=json.loads(row["progress"]) if row["progress"] else None,
+        progress_updated_at=row["progress_updated_at"],
+        error=row["error"],
+        created_at=row["created_at"],
+        started_at=row["started_at"],
+        finished_at=row["finished_at"],
+    )
+
+
+# Shortest job first with aging: a job's priority is its estimated size minus a credit that grows with the
+# time it has waited, so small repositories jump ahead while large ones are still guaranteed to run.
+# Jobs without an estimate are ordered as if they had the median size of the queued jobs, neither ahead of every
+# estimated job (as if empty) nor behind them.
+_MEDIAN_QUEUED_BYTES = (
+    "SELECT percentile_disc(0.5) WITHIN GROUP (ORDER BY estimated_bytes) FROM InsertJob WHERE status = 'queued'"
+)
+_PRIORITY_ORDER = (
+    f"COALESCE(estimated_bytes, ({_MEDIAN_QUEUED_BYTES}), 0) - EXTRACT(EPOCH FROM NOW() - created_at) * {{aging}}, "
+    "created_at"
+)
+
+
+class InsertJob:
+    """
+    Provides async methods to interact with the `InsertJob` table, the durable ingest queue.
+    """
+
+    def __init__(self, db: AsyncDBConnector):
+        self.db = db
+
+    async def insert(
+            self,
+            owner: str,
+            repo: str,
+            estimated_files: Optional[int],
+            estimated_bytes: Optional[int],
+            fetch_mode: Optional[str] = None,
+            max_file_bytes: Optional[int] = None,
+            path_rules: Optional[List[str]] = None,
+            refresh: bool = False,
+    ) -> Optional[InsertJobData]:
+        """
+        Enqueues a repository. Returns None if the repository is already queued or being processed.
+        """
+        query = """
+            INSERT INTO InsertJob
+                (owner, repo, estimated_files, estimated_bytes, fetch_mode, max_file_bytes, path_rules, refresh)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+            ON CONFLICT DO NOTHING
+            RETURNING *;
+        """
+        rows = await self.db.query(
+            query,
+            [owner, repo, estimated_files, estimated_bytes, fetch_mode, max_file_bytes, path_rules, refresh]
+        )
+        if not rows:
+            return None
+        return _to_job_data(rows[0])
+
+    async def select_active(self, owner: str, repo: str) -> Optional[InsertJobData]:
+        query = "SELECT * FROM InsertJob WHERE owner = $1 AND repo = $2 AND status IN ('queued', 'processing')"
+        rows = await self.db.query(query, [owner, repo])
+        if not rows:
+            return None
+        return _to_job_data(rows[0])
+
+    async def select_queued(self, aging_bytes_per_second: float) -> List[InsertJobData]:
+        """
+        Returns the queued jobs in the order they will be claimed.
+        """
+        query = (
+            "SELECT * FROM InsertJob WHERE status = 'queued' ORDER BY "
+            + _PRIORITY_ORDER.format(aging="$1::float")
+        )
+        rows = await self.db.query(query, [aging_bytes_per_second])
+        return [_to_job_data(row) for row in rows]
+
+    async def select_processing(self) -> List[InsertJobData]:
+        query = "SELECT * FROM InsertJob WHERE status = 'processing' ORDER BY started_at"
+        rows = await self.db.query(query)
+        return [_to_job_data(row) for row in rows]
+
+    async def count_queued(self) -> int:
+        query = "SELECT COUNT(*) AS count FROM InsertJob WHERE status = 'queued'"
+        rows = await self.db.query(query)
+        return rows[0]["count"]
+
+    async def claim(
+            self,
+            lease_owner: str,
+            lease_seconds: float,
+            max_attempts: int,
+            aging_bytes_per_second: float,
+    ) -> Optional[InsertJobData]:
+        """
+        Atomically takes the next job and leases it to lease_owner. Processing jobs whose lease expired are
+        resumed first, then queued jobs go in priority order (see _PRIORITY_ORDER).
+        Concurrent claimers skip rows locked by each other instead of waiting on them.
+        """
+        query = """
+            UPDATE InsertJob
+            SET status = 'processing',
+                lease_owner = $1,
+                lease_expires_at = NOW() + $2::float * INTERVAL '1 second',
+                attempts = attempts + 1,
+                progress = NULL,
+                progress_updated_at = NULL,
+                started_at = NOW()
+            WHERE job_id = (
+                SELECT job_id FROM InsertJob
+                WHERE status = 'queued'
+                   OR (status = 'processing' AND lease_expires_at < NOW() AND attempts < $3)
+                ORDER BY status = 'processing' DESC, {priority}
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *;
+        """.format(priority=_PRIORITY_ORDER.format(aging="$4::float"))
+        rows = await self.db.query(query, [lease_owner, lease_seconds, max_attempts, aging_bytes_per_second])
+        if not rows:
+            return None
+        return _to_job_data(rows[0])
+
+    async def heartbeat(self, job_id: int, lease_owner: str, lease_seconds: float, progress: dict) -> bool:
+        """
+        Extends the lease of a job and publishes its progress. Returns False if the lease was lost to another worker.
+        """
+        query = """
+            UPDATE InsertJob
+            SET lease_expires_at = NOW() + $3::float * INTERVAL '1 second',
+                progress = $4::jsonb,
+                progress_updated_at = NOW()
+            WHERE job_id = $1 AND lease_owner = $2 AND status = 'processing'
+            RETURNING job_id;
+        """
+        rows = await self.db.query(query, [job_id, lease_owner, lease_seconds, json.dumps(progress)])
+        return bool(rows)
+
+    async def finish(self, job_id: int, lease_owner: str, error: Optional[str] = None) -> None:
+        query = """
+            UPDATE InsertJob
+            SET status = $3, error = $4, finished_at = NOW(), lease_expires_at = NULL
+            WHERE job_id = $1 AND lease_owner = $2 AND status = 'processing';
+        """
+        status = 'failed' if error else 'done'
+        await self.db.query(query, [job_id, lease_owner, status, error])
+
+    async def fail_abandoned(self, max_attempts: int) -> int:
+        """
+        Marks jobs that kept losing their lease (e.g. crashing the worker every time) as failed.
+        """
+        query = """
+            UPDATE InsertJob
+            SET status = 'failed', error = 'Lease expired too many times', finished_at = NOW()
+            WHERE status = 'processing' AND lease_expires_at < NOW() AND attempts >= $1
+            RETURNING job_id;
+        """
+        rows = await self.db.query(query, [max_attempts])
+        return len(rows)
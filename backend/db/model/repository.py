@@ -135,4 +135,71 @@ class Repository:
             stars=row["stars"],
             forks=row["forks"],
             topics=topics,
-        )
\ No newline at end of file
+        )
+    async def update(
+            self,
+            url: str,
+            owner: str,
+            repo: str,
+            language: str,
+            description: str,
+            default_branch: str,
+            topics: List[str],
+            stars: int,
+            forks: int,
+    ) -> Optional[RepositoryData]:
+        """
+        Like insert(), but a repository that already exists takes the given metadata and topics.
+        """
+        repo_query = """
+            INSERT INTO Repository
+                (url, owner, repo, language, descriptions, default_branch, stars, forks)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+            ON CONFLICT (url) DO UPDATE
+            SET owner = EXCLUDED.owner,
+                repo = EXCLUDED.repo,
+                language = EXCLUDED.language,
+                descriptions = EXCLUDED.descriptions,
+                default_branch = EXCLUDED.default_branch,
+                stars = EXCLUDED.stars,
+                forks = EXCLUDED.forks
+            RETURNING *;
+        """
+        repo_values = [url, owner, repo, language, description, default_branch, stars, forks]
+        update_result = await self.db.query(repo_query, repo_values)
+        if not update_result:
+            return None
+
+        # Topics removed from the repository since it was inserted are dropped, new ones are added
+        await self.db.query(
+            "DELETE FROM RepositoryTopics WHERE repository_url = $1 AND NOT (topic_name = ANY($2::varchar[]))",
+            [url, topics]
+        )
+        topic_insert = """
+            INSERT INTO Topics (topic_name)
+            VALUES ($1)
+            ON CONFLICT (topic_name) DO NOTHING;
+        """
+        repo_topic_insert = """
+            INSERT INTO RepositoryTopics (topic_name, repository_url)
+            VALUES ($1, $2)
+            ON CONFLICT (topic_name, repository_url) DO NOTHING;
+        """
+
+        for t in topics:
+            await self.db.query(topic_insert, [t])
+        for t in topics:
+            await self.db.query(repo_topic_insert, [t, url])
+
+        row = update_result[0]
+        return RepositoryData(
+            url=row["url"],
+            owner=row["owner"],
+            repo=row["repo"],
+            language=row["language"],
+            descriptions=row["descriptions"],
+            default_branch=row["default_branch"],
+            stars=row["stars"],
+            forks=row["forks"],
+            topics=topics,
+        )
@@ -0,0 +1,126 @@
+from typing import Optional
+from db.utils.connector import AsyncDBConnector
+
+
+class SummaryCacheData:
+    def __init__(
+            self,
+            blob_sha: str,
+            prompt_hash: str,
+            model_name: str,
+            repo_owner: str,
+            repo_name: str,
+            commit_sha: str,
+            path: str,
+            ai_summary: str,
+            usage: Optional[str],
+            size_bytes: int,
+            hits: int,
+            created_at,
+            last_used_at,
+    ):
+        self.blob_sha = blob_sha
+        self.prompt_hash = prompt_hash
+        self.model_name = model_name
+        # Where the summary was generated, its GitHub links point there
+        self.repo_owner = repo_owner
+        self.repo_name = repo_name
+        self.commit_sha = commit_sha
+        self.path = path
+        self.ai_summary = ai_summary
+        self.usage = usage
+        self.size_bytes = size_bytes
+        self.hits = hits
+        self.created_at = created_at
+        self.last_used_at = last_used_at
+
+
+def _to_cache_data(row: dict) -> SummaryCacheData:
+    return SummaryCacheData(
+        blob_sha=row["blob_sha"],
+        prompt_hash=row["prompt_hash"],
+        model_name=row["model_name"],
+        repo_owner=row["repo_owner"],
+        repo_name=row["repo_name"],
+        commit_sha=row["commit_sha"],
+        path=row["path"],
+        ai_summary=row["ai_summary"],
+        usage=row["usage"],
+        size_bytes=row["size_bytes"],
+        hits=row["hits"],
+        created_at=row["created_at"],
+        last_used_at=row["last_used_at"],
+    )
+
+
+class SummaryCache:
+    """
+    Provides async methods to interact with the `SummaryCache` table, file summaries keyed by content.
+    """
+
+    def __init__(self, db: AsyncDBConnector):
+        self.db = db
+
+    async def lookup(self, blob_sha: str, prompt_hash: str, model_name: str) -> Optional[SummaryCacheData]:
+        """
+        Returns the cached summary of a blob, and marks it as recently used.
+        """
+        query = """
+            UPDATE SummaryCache
+            SET hits = hits + 1, last_used_at = NOW()
+            WHERE blob_sha = $1 AND prompt_hash = $2 AND model_name = $3
+            RETURNING *;
+        """
+        rows = await self.db.query(query, [blob_sha, prompt_hash, model_name])
+        if not rows:
+            return None
+        return _to_cache_data(rows[0])
+
+    async def insert(
+            self,
+            blob_sha: str,
+            prompt_hash: str,
+            model_name: str,
+            repo_owner: str,
+            repo_name: str,
+            commit_sha: str,
+            path: str,
+            ai_summary: str,
+            usage: Optional[str],
+    ) -> None:
+        query = """
+            INSERT INTO SummaryCache
+                (blob_sha, prompt_hash, model_name, repo_owner, repo_name, commit_sha, path, ai_summary, usage,
+                 size_bytes)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, octet_length($8))
+            ON CONFLICT DO NOTHING;
+        """
+        await self.db.query(
+            query,
+            [blob_sha, prompt_hash, model_name, repo_owner, repo_name, commit_sha, path, ai_summary, usage]
+        )
+
+    async def evict(self, max_bytes: int) -> int:
+        """
+        Deletes the least recently used summaries until the cache holds at most max_bytes of summaries.
+        :return: Number of evicted summaries
+        """
+        query = """
+            DELETE FROM SummaryCache
+            WHERE (blob_sha, prompt_hash, model_name) IN (
+                SELECT blob_sha, prompt_hash, model_name FROM (
+                    SELECT blob_sha, prompt_hash, model_name,
+                           SUM(size_bytes) OVER (ORDER BY last_used_at DESC, created_at DESC) AS kept_bytes
+                    FROM SummaryCache
+                ) AS ranked
+                WHERE kept_bytes > $1
+            )
+            RETURNING 1;
+        """
+        rows = await self.db.query(query, [max_bytes])
+        return len(rows)
+
+    async def size(self) -> dict:
+        query = "SELECT COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS bytes FROM SummaryCache"
+        rows = await self.db.query(query)
+        return {"entries": rows[0]["entries"], "bytes": rows[0]["bytes"]}
@@ -0,0 +1,51 @@
+import os
+import psycopg
+from loguru import logger
+import sys
+
+DB_HOST = os.getenv("DB_HOST", "postgres")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+
+def dedupe_rows():
+    """
+    Merges the duplicate folders and files of a database created before they were unique, by executing the
+    dedupe_rows.sql script once. init_db.py refuses to start until this is done.
+    """
+    conn = None
+    try:
+        logger.info(f"Attempting to connect to the database at {DB_HOST}:{DB_PORT}...")
+        conn = psycopg.connect(
+            host=DB_HOST,
+            port=DB_PORT,
+            dbname=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD
+        )
+        logger.info("Connected to the database!")
+
+        cwd = os.getcwd()
+        sql_file_path = os.path.join(cwd, "db", "migrations", "dedupe_rows.sql")
+
+        with open(sql_file_path, "r") as f:
+            sql_commands = f.read()
+
+        # A single transaction, so that a failure leaves the database as it was
+        with conn.transaction():
+            with conn.cursor() as cursor:
+                cursor.execute(sql_commands)
+        logger.info("Duplicate folders and files merged, init_db.py can now create the unique indexes")
+
+    except Exception as e:
+        logger.error(f"Error merging the duplicate rows: {e}", exc_info=True)
+        sys.exit(1)
+
+    finally:
+        if conn:
+            conn.close()
+            logger.info("Database connection closed.")
+
+if __name__ == "__main__":
+    dedupe_rows()
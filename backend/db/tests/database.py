@@ -0,0 +1,83 @@
+"""
+Tests against a real database: the one configured by DB_HOST, DB_NAME, DB_USER and DB_PASSWORD, in a schema created
+from create_tables.sql for each test and dropped after it. Skipped when no database is reachable.
+"""
+import asyncio
+import os
+import uuid
+from typing import Awaitable, Callable
+
+import asyncpg
+import pytest
+
+from db.config.config import DBConfig
+from db.utils.connector import AsyncDBConnector
+
+CREATE_TABLES = os.path.join(os.path.dirname(__file__), '..', 'migrations', 'create_tables.sql')
+
+
+async def create_tables(db: AsyncDBConnector):
+    with open(CREATE_TABLES) as f:
+        async with db._pool.acquire() as conn:
+            await conn.execute(f.read())
+
+
+def run_in_schema(scenario: Callable[[AsyncDBConnector], Awaitable[None]]):
+    """
+    Runs `scenario` with a connector whose tables are in a new schema, or skips the test.
+    """
+    if not DBConfig['host']:
+        pytest.skip('No database configured')
+
+    async def run():
+        schema = f'test_{uuid.uuid4().hex}'
+        try:
+            admin = await asyncpg.connect(
+                host=DBConfig['host'], port=DBConfig['port'], database=DBConfig['database'],
+                user=DBConfig['user'], password=DBConfig['password'], timeout=5,
+            )
+        except (OSError, asyncpg.PostgresError) as e:
+            pytest.skip(f'Database not reachable: {e}')
+        await admin.execute(f'CREATE SCHEMA {schema}')
+        try:
+            db = AsyncDBConnector()
+            db._pool = await asyncpg.create_pool(
+                host=DBConfig['host'], port=DBConfig['port'], database=DBConfig['database'],
+                user=DBConfig['user'], password=DBConfig['password'], server_settings={'search_path': schema},
+            )
+            db._connected = True
+            try:
+                await create_tables(db)
+                await scenario(db)
+            finally:
+                await db._pool.close()
+        finally:
+            await admin.execute(f'DROP SCHEMA {schema} CASCADE')
+            await admin.close()
+
+    asyncio.run(run())
+
+
+async def insert_branch(db: AsyncDBConnector, status: str = 'done'):
+    """
+    Inserts a repository and one branch of it.
+    """
+    await db.query(
+        "INSERT INTO Repository (url, owner, repo, language) VALUES ('https://github.com/o/r', 'o', 'r', 'Python') "
+        "ON CONFLICT DO NOTHING"
+    )
+    await db.query(
+        "INSERT INTO Branch (last_commit_sha, name, repository_url, status) VALUES ($1, 'main', 'https://github.com/o/r', $2)",
+        [status * 2, status]
+    )
+
+
+async def insert_root_folder(db: AsyncDBConnector) -> int:
+    """
+    Inserts a branch and its root folder, returns the id of the folder.
+    """
+    await insert_branch(db)
+    rows = await db.query(
+        "INSERT INTO Folder (name, path, branch_id) SELECT '', '', branch_id FROM Branch RETURNING folder_id"
+    )
+    return rows[0]['folder_id']
@@ -0,0 +1,87 @@
+import os
+
+import asyncpg
+import pytest
+
+from db.tests.database import run_in_schema, create_tables, insert_branch, insert_root_folder
+
+DEDUPE_ROWS = os.path.join(os.path.dirname(__file__), '..', 'migrations', 'dedupe_rows.sql')
+
+
+def test_upgrades_can_run_again():
+    async def scenario(db):
+        await create_tables(db)
+        await create_tables(db)
+
+    run_in_schema(scenario)
+
+
+def test_branch_status_is_checked_after_an_upgrade():
+    async def scenario(db):
+        # A Branch table from before refreshes, without the status column and its CHECK
+        await db.query("ALTER TABLE Branch DROP COLUMN status")
+        await create_tables(db)
+
+        await insert_branch(db, 'done')
+        with pytest.raises(asyncpg.CheckViolationError):
+            await insert_branch(db, 'bogus')
+
+    run_in_schema(scenario)
+
+
+def test_fetch_mode_check_is_added_once():
+    async def scenario(db):
+        # The CHECK from before the graphql fetch mode
+        await db.query("ALTER TABLE InsertJob DROP CONSTRAINT insertjob_fetch_mode_check")
+        await db.query(
+            "ALTER TABLE InsertJob ADD CONSTRAINT insertjob_fetch_mode_check CHECK ( fetch_mode IN ('raw', 'archive') )"
+        )
+        await create_tables(db)
+        check = "SELECT oid FROM pg_constraint WHERE conname = 'insertjob_fetch_mode_check'"
+        replaced = await db.query(check)
+        await create_tables(db)
+
+        assert await db.query(check) == replaced
+        await db.query("INSERT INTO InsertJob (owner, repo, fetch_mode) VALUES ('o', 'r', 'graphql')")
+        with pytest.raises(asyncpg.CheckViolationError):
+            await db.query("INSERT INTO InsertJob (owner, repo, fetch_mode) VALUES ('o', 'r2', 'bogus')")
+
+    run_in_schema(scenario)
+
+
+def test_upgrade_waits_for_duplicates_to_be_merged():
+    async def scenario(db):
+        # Folder and File tables from before the unique indexes, holding a folder twice, each with a copy of a file
+        await db.query("DROP INDEX unique_folder_path_per_branch")
+        await db.query("DROP INDEX unique_file_per_folder")
+        root_id = await insert_root_folder(db)
+        for summary, other_file in (('first', 'a.py'), ('second', 'b.py')):
+            rows = await db.query(
+                "INSERT INTO Folder (name, path, parent_folder_id, branch_id) SELECT 'src', 'src', $1, branch_id "
+                "FROM Branch RETURNING folder_id",
+                [root_id]
+            )
+            for name in ('app.py', other_file):
+                await db.query(
+                    "INSERT INTO File (name, folder_id, ai_summary) VALUES ($1, $2, $3)", [name, rows[0]['folder_id'], summary]
+                )
+
+        with pytest.raises(asyncpg.RaiseError, match='dedupe_rows'):
+            await create_tables(db)
+        with open(DEDUPE_ROWS) as f:
+            async with db._pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute(f.read())
+        await create_tables(db)
+
+        folders = await db.query("SELECT folder_id FROM Folder WHERE path = 'src'")
+        files = await db.query(
+            "SELECT name, ai_summary FROM File WHERE folder_id = $1 ORDER BY name", [folders[0]['folder_id']]
+        )
+        assert len(folders) == 1
+        assert files == [
+            {'name': 'a.py', 'ai_summary': 'first'}, {'name': 'app.py', 'ai_summary': 'first'},
+            {'name': 'b.py', 'ai_summary': 'second'},
+        ]
+
+    run_in_schema(scenario)
@@ -0,0 +1,34 @@
+from db.model.file import File
+from db.tests.database import run_in_schema, insert_root_folder
+
+
+def test_inserting_a_file_twice_returns_the_first_one():
+    async def scenario(db):
+        files = File(db)
+        folder_id = await insert_root_folder(db)
+
+        first = await files.insert('app.py', folder_id, 'print(1)', 'first', 'usage', 'a' * 40)
+        again = await files.insert('app.py', folder_id, 'print(2)', 'second', 'usage', 'b' * 40)
+
+        assert again.file_id == first.file_id and again.ai_summary == 'first'
+        assert len(await files.select(folder_id)) == 1
+
+    run_in_schema(scenario)
+
+
+def test_copy_forward_skips_files_already_copied():
+    async def scenario(db):
+        files = File(db)
+        folder_id = await insert_root_folder(db)
+        rows = await db.query(
+            "INSERT INTO Folder (name, path, parent_folder_id, branch_id) SELECT 'src', 'src', $1, branch_id FROM Branch "
+            "RETURNING folder_id",
+            [folder_id]
+        )
+        target = rows[0]['folder_id']
+        source = await files.insert('app.py', folder_id, 'print(1)', 'summary', 'usage', 'a' * 40)
+
+        assert await files.copy_forward([source.file_id], [target], 'old', 'new') == 1
+        assert await files.copy_forward([source.file_id], [target], 'old', 'new') == 0
+
+    run_in_schema(scenario)
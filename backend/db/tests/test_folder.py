@@ -0,0 +1,17 @@
+from db.model.folder import Folder
+from db.tests.database import run_in_schema, insert_root_folder
+
+
+def test_inserting_a_folder_twice_returns_the_first_one():
+    async def scenario(db):
+        folders = Folder(db)
+        root_id = await insert_root_folder(db)
+        branch_id = (await db.query("SELECT branch_id FROM Branch"))[0]['branch_id']
+
+        first = await folders.insert('src', 'src', branch_id, root_id)
+        again = await folders.insert('src', 'src', branch_id, root_id)
+
+        assert again.folder_id == first.folder_id
+        assert [f.path for f in await folders.select(branch_id)] == ['', 'src']
+
+    run_in_schema(scenario)
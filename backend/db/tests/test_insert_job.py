@@ -0,0 +1,142 @@
+import asyncio
+
+from db.model.insert_job import InsertJob
+from db.tests.database import run_in_schema
+
+_MAX_ATTEMPTS = 3
+
+
+def _run(scenario):
+    run_in_schema(lambda db: scenario(InsertJob(db), db))
+
+
+async def _claim(jobs: InsertJob, lease_owner: str, lease_seconds: float = 60, aging: float = 0):
+    return await jobs.claim(lease_owner, lease_seconds, _MAX_ATTEMPTS, aging)
+
+
+def test_one_active_job_per_repository():
+    async def scenario(jobs: InsertJob, db):
+        assert await jobs.insert('o', 'r', 10, 1000)
+        assert await jobs.insert('o', 'r', 10, 1000) is None
+        job = await _claim(jobs, 'w1')
+        await jobs.finish(job.job_id, 'w1')
+        # Done jobs do not count
+        assert await jobs.insert('o', 'r', 10, 1000)
+
+    _run(scenario)
+
+
+def test_smallest_job_is_claimed_first():
+    async def scenario(jobs: InsertJob, db):
+        await jobs.insert('o', 'large', 1000, 10 ** 9)
+        await jobs.insert('o', 'small', 10, 1000)
+        await jobs.insert('o', 'medium', 100, 10 ** 6)
+
+        assert [job.repo for job in await jobs.select_queued(0)] == ['small', 'medium', 'large']
+        assert [(await _claim(jobs, 'w1')).repo for _ in range(3)] == ['small', 'medium', 'large']
+        assert await _claim(jobs, 'w1') is None
+
+    _run(scenario)
+
+
+def test_job_without_estimate_is_ranked_at_the_median():
+    async def scenario(jobs: InsertJob, db):
+        await jobs.insert('o', 'large', 1000, 10 ** 9)
+        await jobs.insert('o', 'small', 10, 1000)
+        await jobs.insert('o', 'medium', 100, 10 ** 6)
+        # Ranked as 10^6 bytes, after the medium job that was queued before it
+        await jobs.insert('o', 'unknown', None, None)
+
+        assert [job.repo for job in await jobs.select_queued(0)] == ['small', 'medium', 'unknown', 'large']
+        assert (await _claim(jobs, 'w1')).repo == 'small'
+
+    _run(scenario)
+
+
+def test_waiting_jobs_age_ahead_of_smaller_ones():
+    async def scenario(jobs: InsertJob, db):
+        large = await jobs.insert('o', 'large', 1000, 10 ** 9)
+        await jobs.insert('o', 'small', 10, 1000)
+        await db.query("UPDATE InsertJob SET created_at = NOW() - INTERVAL '1 hour' WHERE job_id = $1", [large.job_id])
+
+        # 10^9 bytes less an hour of waiting at 10^5 bytes per second is still larger than 1000 bytes
+        assert (await _claim(jobs, 'w1', aging=10 ** 5)).repo == 'small'
+        await jobs.insert('o', 'small2', 10, 1000)
+        # At 10^6 bytes per second, the hour the large job waited makes up for its size
+        assert (await _claim(jobs, 'w1', aging=10 ** 6)).repo == 'large'
+
+    _run(scenario)
+
+
+def test_lease_is_held_until_it_expires():
+    async def scenario(jobs: InsertJob, db):
+        queued = await jobs.insert('o', 'r', 10, 1000)
+
+        job = await _claim(jobs, 'w1', lease_seconds=-1)
+        assert (job.job_id, job.status, job.lease_owner, job.attempts) == (queued.job_id, 'processing', 'w1', 1)
+
+        # The lease of w1 expired, w2 takes the job over
+        job = await _claim(jobs, 'w2')
+        assert (job.job_id, job.lease_owner, job.attempts) == (queued.job_id, 'w2', 2)
+        assert await _claim(jobs, 'w3') is None
+
+        assert not await jobs.heartbeat(job.job_id, 'w1', 60, {'stage': 1})
+        assert await jobs.heartbeat(job.job_id, 'w2', 60, {'stage': 1})
+        await jobs.finish(job.job_id, 'w1', error='lost lease')
+        assert (await jobs.select_active('o', 'r')).lease_owner == 'w2'
+        await jobs.finish(job.job_id, 'w2')
+        assert await jobs.select_active('o', 'r') is None
+
+    _run(scenario)
+
+
+def test_expired_lease_is_resumed_before_queued_jobs():
+    async def scenario(jobs: InsertJob, db):
+        await jobs.insert('o', 'large', 1000, 10 ** 9)
+        await _claim(jobs, 'w1', lease_seconds=-1)
+        await jobs.insert('o', 'small', 10, 1000)
+
+        assert (await _claim(jobs, 'w2')).repo == 'large'
+        assert (await _claim(jobs, 'w2')).repo == 'small'
+
+    _run(scenario)
+
+
+def test_job_losing_its_lease_too_often_fails():
+    async def scenario(jobs: InsertJob, db):
+        queued = await jobs.insert('o', 'r', 10, 1000)
+        for attempt in range(_MAX_ATTEMPTS):
+            assert (await _claim(jobs, f'w{attempt}', lease_seconds=-1)).job_id == queued.job_id
+
+        assert await _claim(jobs, 'w') is None
+        assert await jobs.fail_abandoned(_MAX_ATTEMPTS) == 1
+        rows = await db.query("SELECT status, error FROM InsertJob WHERE job_id = $1", [queued.job_id])
+        assert rows[0] == {'status': 'failed', 'error': 'Lease expired too many times'}
+
+    _run(scenario)
+
+
+def test_concurrent_claims_take_different_jobs():
+    async def scenario(jobs: InsertJob, db):
+        for index in range(5):
+            await jobs.insert('o', f'r{index}', 10, 1000 + index)
+
+        claimed = await asyncio.gather(*[_claim(jobs, f'w{index}') for index in range(8)])
+
+        taken = [job.job_id for job in claimed if job]
+        assert len(taken) == len(set(taken)) == 5
+
+    _run(scenario)
+
+
+def test_refresh_is_kept_by_the_job():
+    async def scenario(jobs: InsertJob, db):
+        await jobs.insert('o', 'refreshed', 10, 1000, refresh=True)
+        await jobs.insert('o', 'new', 10, 2000)
+
+        assert [(job.repo, job.refresh) for job in await jobs.select_queued(0)] == [('refreshed', True), ('new', False)]
+        job = await _claim(jobs, 'w1', lease_seconds=-1)
+        # A job taken over after its lease expired is still a refresh
+        assert (await _claim(jobs, 'w2')).job_id == job.job_id and job.refresh
+
+    _run(scenario)
@@ -0,0 +1,23 @@
+
+from db.model.repository import Repository
+from db.tests.database import run_in_schema
+
+_URL = 'https://github.com/o/r'
+
+
+def test_update_refreshes_the_metadata_of_an_existing_repository():
+    async def scenario(db):
+        repository = Repository(db)
+        await repository.insert(_URL, 'o', 'r', 'Python', 'Old', 'master', ['a', 'b'], 1, 0)
+
+        # insert() leaves it as it is
+        kept = await repository.insert(_URL, 'o', 'r', 'Python', 'New', 'main', ['b', 'c'], 5, 2)
+        assert (kept.descriptions, kept.stars) == ('Old', 1)
+
+        updated = await repository.update(_URL, 'o', 'r', 'Python', 'New', 'main', ['b', 'c'], 5, 2)
+        selected = await repository.select('o', 'r')
+        for data in (updated, selected):
+            assert (data.descriptions, data.default_branch, data.stars, data.forks) == ('New', 'main', 5, 2)
+        assert sorted(selected.topics) == ['b', 'c']
+
+    run_in_schema(scenario)
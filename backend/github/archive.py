@@ -0,0 +1,146 @@
+import asyncio
+import zlib
+from typing import AsyncIterator, Callable, Dict, Tuple
+
+_BLOCK_SIZE = 512
+# Most decompressed bytes produced from one chunk at a time, so a highly compressed chunk cannot blow up memory
+_MAX_DECOMPRESSED_CHUNK = 256 * 1024
+
+
+class _GzipStream:
+    """
+    Decompresses a stream of gzip chunks on the fly and reads from it, without keeping more than one
+    decompressed chunk (plus what the reader asked for) in memory.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks.__aiter__()
+        self._decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        self._buffer = bytearray()
+        self._eof = False
+
+    async def _fill(self) -> bool:
+        """
+        Decompresses more data into the buffer, in a worker thread so that inflating a large archive does not
+        block the event loop (zlib releases the GIL).
+        :return: False once the stream is exhausted
+        """
+        while not self._eof:
+            if self._decompressor.unconsumed_tail:
+                data = await asyncio.to_thread(
+                    self._decompressor.decompress, self._decompressor.unconsumed_tail, _MAX_DECOMPRESSED_CHUNK
+                )
+            else:
+                try:
+                    chunk = await self._chunks.__anext__()
+                except StopAsyncIteration:
+                    self._eof = True
+                    data = await asyncio.to_thread(self._decompressor.flush)
+                else:
+                    data = await asyncio.to_thread(self._decompressor.decompress, chunk, _MAX_DECOMPRESSED_CHUNK)
+            if data:
+                self._buffer += data
+                return True
+        return False
+
+    async def read(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            if not await self._fill():
+                raise EOFError(f"Archive ended {size - len(self._buffer)} bytes too early")
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def at_end(self) -> bool:
+        return not self._buffer and not await self._fill()
+
+    async def skip(self, size: int):
+        while size:
+            if not self._buffer and not await self._fill():
+                raise EOFError(f"Archive ended {size} bytes too early")
+            skipped = min(size, len(self._buffer))
+            del self._buffer[:skipped]
+            size -= skipped
+
+
+def _string(field: bytes) -> str:
+    return field.split(b"\0", 1)[0].decode("utf-8", errors="replace")
+
+
+def _number(field: bytes) -> int:
+    if field[0] & 0x80:
+        # GNU base-256 encoding of sizes that do not fit in 11 octal digits
+        return int.from_bytes(bytes([field[0] & 0x7F]) + field[1:], "big")
+    digits = field.split(b"\0", 1)[0].strip()
+    return int(digits, 8) if digits else 0
+
+
+def _pax_records(data: bytes) -> Dict[str, str]:
+    """
+    Parses the "<length> <key>=<value>\\n" records of a pax extended header.
+    """
+    records = {}
+    position = 0
+    while position < len(data):
+        space = data.index(b" ", position)
+        length = int(data[position:space])
+        key, _, value = data[space + 1:position + length - 1].partition(b"=")
+        records[key.decode("utf-8")] = value.decode("utf-8", errors="replace")
+        position += length
+    return records
+
+
+async def iter_tar_gz(
+        chunks: AsyncIterator[bytes],
+        wanted: Callable[[str], bool]
+) -> AsyncIterator[Tuple[str, bytes]]:
+    """
+    Streams a .tar.gz archive and yields the path and content of the regular files accepted by `wanted`,
+    as soon as each one is decompressed. Other entries are decompressed and dropped, never stored.
+    Supports the ustar, GNU long name and pax path headers (GitHub tarballs use pax).
+
+    :param chunks: The compressed archive, e.g. the body of an HTTP response
+    :param wanted: Called with the path of each file in the archive
+    """
+    stream = _GzipStream(chunks)
+    long_name = None
+    pax_path = None
+    while True:
+        if await stream.at_end():
+            # Archive without the end marker, any other truncation raises EOFError
+            return
+        header = await stream.read(_BLOCK_SIZE)
+        if header == b"\0" * _BLOCK_SIZE:
+            # End of archive marker
+            return
+
+        name = _string(header[0:100])
+        if header[257:262] == b"ustar":
+            prefix = _string(header[345:500])
+            if prefix:
+                name = f"{prefix}/{name}"
+        size = _number(header[124:136])
+        padding = -size % _BLOCK_SIZE
+        entry_type = header[156:157]
+
+        if entry_type == b"L":
+            long_name = _string(await stream.read(size))
+            await stream.skip(padding)
+            continue
+        if entry_type == b"x":
+            pax_path = _pax_records(await stream.read(size)).get("path", pax_path)
+            await stream.skip(padding)
+            continue
+        if entry_type == b"g":
+            # Global pax header, GitHub puts the commit SHA in it
+            await stream.skip(size + padding)
+            continue
+
+        path = pax_path or long_name or name
+        long_name, pax_path = None, None
+        if entry_type in (b"0", b"\0", b"7") and wanted(path):
+            content = await stream.read(size)
+            await stream.skip(padding)
+            yield path, content
+        else:
+            await stream.skip(size + padding)
@@ -0,0 +1,134 @@
+from types import SimpleNamespace
+from typing import Optional
+
+import aiohttp
+
+from github.config import github_http_config
+
+from loguru import logger
+
+
+class GithubClient:
+    """
+    Process-wide aiohttp session shared by every GitHub request.
+
+    Connections are kept alive and reused between requests (instead of a DNS lookup and a TCP+TLS handshake
+    per file), capped in total and per host, and host names are resolved once per DNS cache period.
+    The session is opened on first use and closed with the app, see the lifespan in main.py.
+
+    Usage:
+        session = GithubClient.getInstance().session()
+        async with session.get(url) as resp:
+            ...
+    """
+
+    _instance: Optional["GithubClient"] = None
+
+    def __init__(self, max_connections: int, max_connections_per_host: int, keepalive_seconds: float,
+                 dns_cache_seconds: int, connect_timeout: float, read_timeout: float, total_timeout: float):
+        self._maxConnections = max_connections
+        self._maxConnectionsPerHost = max_connections_per_host
+        self._keepaliveSeconds = keepalive_seconds
+        self._dnsCacheSeconds = dns_cache_seconds
+        self._timeout = aiohttp.ClientTimeout(
+            total=total_timeout,
+            connect=connect_timeout,
+            sock_read=read_timeout,
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.requests = 0
+        self.connectionsOpened = 0
+        self.connectionsReused = 0
+        self.dnsCacheHits = 0
+        self.dnsCacheMisses = 0
+        # Files read by batched requests (GraphQL) and the requests it took
+        self.batchedFiles = 0
+        self.batchRequests = 0
+
+    @classmethod
+    def getInstance(cls) -> "GithubClient":
+        if cls._instance is None:
+            cls._instance = GithubClient(**github_http_config)
+        return cls._instance
+
+    def _traceConfig(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params: SimpleNamespace):
+            self.requests += 1
+
+        async def on_connection_create_end(session, context, params: SimpleNamespace):
+            self.connectionsOpened += 1
+
+        async def on_connection_reuseconn(session, context, params: SimpleNamespace):
+            self.connectionsReused += 1
+
+        async def on_dns_cache_hit(session, context, params: SimpleNamespace):
+            self.dnsCacheHits += 1
+
+        async def on_dns_cache_miss(session, context, params: SimpleNamespace):
+            self.dnsCacheMisses += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace
+
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Returns the shared session, opening it if needed. Must be called from the event loop of the app.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._maxConnections,
+                limit_per_host=self._maxConnectionsPerHost,
+                keepalive_timeout=self._keepaliveSeconds,
+                ttl_dns_cache=self._dnsCacheSeconds,
+                use_dns_cache=True,
+                ssl=False,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self._timeout,
+                trace_configs=[self._traceConfig()],
+            )
+            logger.info(f"Opened the GitHub HTTP client ({self._maxConnections} connections, "
+                        f"{self._maxConnectionsPerHost} per host)")
+        return self._session
+
+    def recordBatches(self, requests: int, files: int):
+        self.batchRequests += requests
+        self.batchedFiles += files
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> dict:
+        """
+        Connection pool usage, for monitoring.
+        """
+        connector = self._session.connector if self._session is not None and not self._session.closed else None
+        # Connections currently used by a request; idle ones are kept alive for the next requests
+        # (aiohttp has no public API for these, they are read from the connector's own bookkeeping)
+        in_use = len(getattr(connector, '_acquired', ()))
+        idle = sum(len(conns) for conns in getattr(connector, '_conns', {}).values())
+        return {
+            'open': connector is not None,
+            'max_connections': self._maxConnections,
+            'max_connections_per_host': self._maxConnectionsPerHost,
+            'in_use': in_use,
+            'idle': idle,
+            'requests': self.requests,
+            'connections_opened': self.connectionsOpened,
+            'connections_reused': self.connectionsReused,
+            'dns_cache_hits': self.dnsCacheHits,
+            'dns_cache_misses': self.dnsCacheMisses,
+            'batch_requests': self.batchRequests,
+            'batched_files': self.batchedFiles,
+            # Compared to one request per file
+            'requests_saved': self.batchedFiles - self.batchRequests,
+        }
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from dotenv import load_dotenv
 import os
 
@@ -7,9 +9,103 @@ load_dotenv()
 # Access the GITHUB_TOKEN environment variable
 github_token = os.getenv('GITHUB_TOKEN')
 
+# Several tokens can be given as a comma separated list in GITHUB_TOKENS, each one has its own quota
+github_tokens = [t.strip() for t in os.getenv('GITHUB_TOKENS', '').split(',') if t.strip()]
+if not github_tokens and github_token:
+    github_tokens = [github_token]
+
 # Construct the headers
 github_auth_config = {
     'Authorization': f'Bearer {github_token}',
     'X-GitHub-Api-Version': '2022-11-28',
     'Accept': 'application/vnd.github+json'
-}
\ No newline at end of file
+}
+
+
+def github_auth_headers(token: Optional[str]) -> dict:
+    """
+    Builds the request headers for the given token (no Authorization header if token is None).
+    """
+    headers = {key: value for key, value in github_auth_config.items() if key != 'Authorization'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    return headers
+
+
+# Pacing of GitHub requests, see github/ratelimit.py
+github_rate_limit_config = {
+    # Requests that may be sent back to back before the token bucket starts pacing them
+    'burst': int(os.getenv('GITHUB_RATE_LIMIT_BURST', '10')),
+    # API quota left untouched, so the remaining requests are spread until the reset without using the last few
+    'reserve': int(os.getenv('GITHUB_RATE_LIMIT_RESERVE', '50')),
+    # raw.githubusercontent.com is not part of the API quota but is still subject to abuse limits
+    'raw_requests_per_second': float(os.getenv('GITHUB_RAW_REQUESTS_PER_SECOND', '30')),
+}
+
+# Shared HTTP client of every GitHub request, see github/client.py
+github_http_config = {
+    # Open connections, in total and per host (api.github.com, raw.githubusercontent.com, ...)
+    'max_connections': int(os.getenv('GITHUB_HTTP_MAX_CONNECTIONS', '100')),
+    'max_connections_per_host': int(os.getenv('GITHUB_HTTP_MAX_CONNECTIONS_PER_HOST', '32')),
+    # Idle connections are kept open this long to be reused by the next request
+    'keepalive_seconds': float(os.getenv('GITHUB_HTTP_KEEPALIVE_SECONDS', '30')),
+    'dns_cache_seconds': int(os.getenv('GITHUB_HTTP_DNS_CACHE_SECONDS', '300')),
+    'connect_timeout': float(os.getenv('GITHUB_HTTP_CONNECT_TIMEOUT', '10')),
+    # Maximum time between two chunks of a response, and for a whole request (waiting for a free connection included)
+    'read_timeout': float(os.getenv('GITHUB_HTTP_READ_TIMEOUT', '60')),
+    'total_timeout': float(os.getenv('GITHUB_HTTP_TOTAL_TIMEOUT', '300')),
+}
+
+# Responses of the GitHub API kept with their ETag and revalidated with If-None-Match, see github/response_cache.py
+github_response_cache_config = {
+    'enabled': os.getenv('GITHUB_RESPONSE_CACHE_ENABLED', 'true').lower() == 'true',
+    # Least recently used responses are evicted past this size
+    'max_bytes': int(os.getenv('GITHUB_RESPONSE_CACHE_MAX_BYTES', str(128 * 1024 * 1024))),
+}
+
+# Batched file downloads through the GraphQL API (PIPELINE_FETCH_MODE=graphql), see fetch_github_repo_files_graphql
+github_graphql_config = {
+    # Most files requested in one query
+    'max_batch_files': int(os.getenv('GITHUB_GRAPHQL_MAX_BATCH_FILES', '100')),
+    # Size of a response the batches are sized for, from the average size of the files received so far
+    'target_batch_bytes': int(os.getenv('GITHUB_GRAPHQL_TARGET_BATCH_BYTES', str(2 * 1024 * 1024))),
+    # Queries sent at the same time
+    'concurrency': int(os.getenv('GITHUB_GRAPHQL_CONCURRENCY', '4')),
+}
+
+# Tarballs of the archive fetch mode, see fetch_github_repo_archive
+github_archive_config = {
+    # Files extracted ahead of the consumer, the download waits while this many are not taken
+    'queue_files': int(os.getenv('GITHUB_ARCHIVE_QUEUE_FILES', '32')),
+    # The download is abandoned when the consumer takes no file for this long, it fetches the rest one by one
+    'stall_seconds': float(os.getenv('GITHUB_ARCHIVE_STALL_SECONDS', '60')),
+}
+
+# Paging of the trees GitHub truncates (more than 100,000 entries or 7 MB), see fetch_github_repo_tree
+github_tree_config = {
+    # Subtrees listed at the same time
+    'concurrency': int(os.getenv('GITHUB_TREE_CONCURRENCY', '8')),
+    # Most requests spent paging one tree, also capped by the quota left above GITHUB_RATE_LIMIT_RESERVE
+    'max_requests': int(os.getenv('GITHUB_TREE_MAX_REQUESTS', '1000')),
+}
+
+# Retries of failed GitHub requests, see github/retry.py
+github_retry_config = {
+    # Attempts of a request, the first one included
+    'max_attempts': int(os.getenv('GITHUB_RETRY_MAX_ATTEMPTS', '5')),
+    # Backoff before the n-th retry: random between 0 and base_delay * 2^(n-1) seconds, capped at max_delay
+    'base_delay': float(os.getenv('GITHUB_RETRY_BASE_DELAY', '0.5')),
+    'max_delay': float(os.getenv('GITHUB_RETRY_MAX_DELAY', '30')),
+    # A request is not retried past this time since its first attempt
+    'max_elapsed_seconds': float(os.getenv('GITHUB_RETRY_MAX_ELAPSED_SECONDS', '120')),
+}
+
+# Per-host circuit breakers of GitHub requests, see CircuitBreaker in github/retry.py
+github_circuit_breaker_config = {
+    # Requests to a host are paused for open_seconds once failure_ratio of the requests of the last window_seconds
+    # failed, if there were at least min_requests of them
+    'window_seconds': float(os.getenv('GITHUB_CIRCUIT_WINDOW_SECONDS', '30')),
+    'min_requests': int(os.getenv('GITHUB_CIRCUIT_MIN_REQUESTS', '20')),
+    'failure_ratio': float(os.getenv('GITHUB_CIRCUIT_FAILURE_RATIO', '0.5')),
+    'open_seconds': float(os.getenv('GITHUB_CIRCUIT_OPEN_SECONDS', '30')),
+}
@@ -1,11 +1,23 @@
-from dataclasses import dataclass
-from typing import List, Optional
+from collections import deque
+from contextlib import asynccontextmanager, aclosing
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Dict, AsyncIterator, Set, Tuple, Iterable, Callable
 from datetime import datetime
 
+import json
+import re
+
 import aiohttp
 import asyncio
 
-from github.config import github_auth_config
+from github.archive import iter_tar_gz
+from github.client import GithubClient
+from github.config import github_archive_config, github_graphql_config, github_tree_config, github_rate_limit_config
+from github.ratelimit import RateLimitGovernor, CORE, GRAPHQL, RAW
+from github.response_cache import ResponseCache
+from github.retry import RetryPolicy, RetriableError, CircuitOpenError, check_status
+
+from loguru import logger
 
 
 @dataclass
@@ -28,75 +40,476 @@ class RepoTreeResult:
     path: str
     files: List[str]
     subdirectories: List['RepoTreeResult']
+    file_sizes: Dict[str, int] = field(default_factory=dict)  # file path => blob size in bytes
+    file_shas: Dict[str, str] = field(default_factory=dict)  # file path => git blob SHA
 
 
-async def fetch_github_repo_details(owner: str, repo: str) -> RepoDetails:
-    repo_url = f'https://api.github.com/repos/{owner}/{repo}'
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(repo_url, headers=github_auth_config, ssl=False) as repo_resp:
-            if repo_resp.status != 200:
-                raise Exception(f'GitHub API Error: {repo_resp.status}')
-            repo_data = await repo_resp.json()
-
-        tree_url = f'https://api.github.com/repos/{owner}/{repo}/git/trees/{repo_data["default_branch"]}'
-        async with session.get(tree_url, ssl=False) as tree_resp:
-            if tree_resp.status != 200:
-                raise Exception(f'GitHub API Error: {tree_resp.status}')
-            tree_data = await tree_resp.json()
-
-        return RepoDetails(
-            repo_owner=repo_data['owner']['login'],
-            repo_name=repo_data['name'],
-            url=repo_data['html_url'],
-            topics=repo_data.get('topics', []),
-            language=repo_data.get('language'),
-            description=repo_data.get('description'),
-            stars=repo_data['stargazers_count'],
-            forks=repo_data['forks_count'],
-            default_branch=repo_data['default_branch'],
-            sha=tree_data['sha'],
-            commit_at=datetime.strptime(repo_data['pushed_at'], '%Y-%m-%dT%H:%M:%SZ')
-        )
+class RepoNotFoundError(Exception):
+    """
+    The repository, or the branch or commit asked for, does not exist (or is not visible to the tokens).
+    """
+
+
+class GithubApiError(Exception):
+    """
+    GitHub answered a request with a status that another attempt will not change (e.g. 401, 403, 409, 422).
+
+    :param status: Status of the response
+    """
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+def _raise_for_status(status: int, what: str):
+    if status == 404:
+        raise RepoNotFoundError(f'{what} not found')
+    if status != 200:
+        raise GithubApiError(f'GitHub API Error: {status}', status)
+
+
+# A tarball can take longer to download than the total timeout of the client, only stalls abort it
+_ARCHIVE_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=120)
+_ARCHIVE_CHUNK_SIZE = 64 * 1024
+_COMMIT_SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+_API_URL = 'https://api.github.com'
+_RAW_URL = 'https://raw.githubusercontent.com'
+_GRAPHQL_URL = f'{_API_URL}/graphql'
+
+
+def build_repo_tree(items: Iterable[dict]) -> RepoTreeResult:
+    """
+    Builds the folder hierarchy from the flat entries of a recursive tree listing.
+
+    :param items: Entries in the format of the git trees API: path, type ('blob', 'tree', ...), sha and size
+    """
+    items = list(items)
+    root_result = RepoTreeResult(path='', files=[], subdirectories=[])
+    path_map = {'': root_result}
+
+    for item in items:
+        path_map[item['path']] = RepoTreeResult(path=item['path'], files=[], subdirectories=[])
+
+    for item in items:
+        current = path_map[item['path']]
+        parent_path = item['path'].rpartition('/')[0]
+
+        parent = path_map.get(parent_path)
+        if parent is None:
+            continue
+
+        if item['type'] == 'blob':
+            parent.files.append(item['path'])
+            parent.file_sizes[item['path']] = item.get('size', 0)
+            parent.file_shas[item['path']] = item['sha']
+        elif item['type'] == 'tree':
+            parent.subdirectories.append(current)
 
+    return root_result
 
-async def fetch_github_repo_tree(owner: str, repo: str, commit_sha: str) -> RepoTreeResult:
-    tree_url = f'https://api.github.com/repos/{owner}/{repo}/git/trees/{commit_sha}?recursive=1'
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(tree_url, headers=github_auth_config, ssl=False) as resp:
+@asynccontextmanager
+async def _github_get(
+        url: str,
+        api: bool = True,
+        timeout: Optional[aiohttp.ClientTimeout] = None
+) -> AsyncIterator[aiohttp.ClientResponse]:
+    """
+    GET request paced by the shared RateLimitGovernor and sent with the token it picks over the shared
+    GithubClient session, the governor then learns the remaining quota of that token from the response.
+    A single attempt: a response worth retrying raises RetriableError, to be retried with RetryPolicy.run().
+
+    :param api: False for raw.githubusercontent.com requests, which do not count against the API quota
+    :param timeout: Overrides the timeouts of the client
+    """
+    governor = RateLimitGovernor.getInstance()
+    resource = CORE if api else RAW
+    token = await governor.acquire(resource)
+    options = {'timeout': timeout} if timeout else {}
+    async with GithubClient.getInstance().session().get(url, headers=token.headers, **options) as resp:
+        governor.observe(token, resp.status, resp.headers, resource)
+        check_status(resp.status, resp.headers)
+        yield resp
+
+
+async def _github_get_json(url: str, immutable: bool = False) -> Tuple[int, Optional[Any]]:
+    """
+    GET request to the API through the ResponseCache: a cached response is revalidated with If-None-Match, and
+    GitHub answers 304 without counting the request against the quota if it did not change.
+
+    :param immutable: The response can never change (e.g. the tree of a commit SHA), a cached one is used without
+                      asking GitHub
+    :return: The status and the parsed JSON body (None if the status is not 200)
+    """
+    cache = ResponseCache.getInstance()
+    governor = RateLimitGovernor.getInstance()
+    if immutable:
+        # Stored once for the whole token pool, a single lookup and no request needed
+        cached = await cache.get(url, None)
+        if cached:
+            await cache.hit(url, None)
+            return 200, json.loads(cached.body)
+
+    async def attempt() -> Tuple[int, Optional[Any]]:
+        token = await governor.acquire()
+        cached = None if immutable else await cache.get(url, token.token)
+
+        headers = {**token.headers, 'If-None-Match': cached.etag} if cached else token.headers
+        async with GithubClient.getInstance().session().get(url, headers=headers) as resp:
+            governor.observe(token, resp.status, resp.headers)
+            check_status(resp.status, resp.headers)
+            if resp.status == 304 and cached:
+                await cache.hit(url, token.token)
+                return 200, json.loads(cached.body)
             if resp.status != 200:
-                raise Exception(f'GitHub API Error: {resp.status}')
-            data = await resp.json()
+                return resp.status, None
+            body = await resp.text()
+        await cache.put(url, None if immutable else token.token, resp.headers.get('ETag'), body)
+        return 200, json.loads(body)
 
-        tree = data['tree']
-        root_result = RepoTreeResult(path='', files=[], subdirectories=[])
-        path_map = {'': root_result}
+    return await RetryPolicy.getInstance().run(url, attempt)
 
-        for item in tree:
-            path_map[item['path']] = RepoTreeResult(path=item['path'], files=[], subdirectories=[])
 
-        for item in tree:
-            current = path_map[item['path']]
-            parent_path = item['path'].rpartition('/')[0]
+async def fetch_github_repo_metadata(owner: str, repo: str) -> Optional[dict]:
+    """
+    Returns the raw repository object of the GitHub API, or None if the repository does not exist.
+    """
+    repo_url = f'{_API_URL}/repos/{owner}/{repo}'
 
-            parent = path_map.get(parent_path)
-            if parent is None:
-                continue
+    status, repo_data = await _github_get_json(repo_url)
+    return repo_data if status == 200 else None
+
+
+async def fetch_github_repo_details(owner: str, repo: str) -> RepoDetails:
+    repo_url = f'{_API_URL}/repos/{owner}/{repo}'
+
+    status, repo_data = await _github_get_json(repo_url)
+    _raise_for_status(status, f'Repository {owner}/{repo}')
+
+    # The branch object carries the SHA of its head commit, without listing its tree
+    branch_url = f'{_API_URL}/repos/{owner}/{repo}/branches/{repo_data["default_branch"]}'
+    status, branch_data = await _github_get_json(branch_url)
+    _raise_for_status(status, f'Branch {repo_data["default_branch"]} of {owner}/{repo}')
+
+    return RepoDetails(
+        repo_owner=repo_data['owner']['login'],
+        repo_name=repo_data['name'],
+        url=repo_data['html_url'],
+        topics=repo_data.get('topics', []),
+        language=repo_data.get('language'),
+        description=repo_data.get('description'),
+        stars=repo_data['stargazers_count'],
+        forks=repo_data['forks_count'],
+        default_branch=repo_data['default_branch'],
+        sha=branch_data['commit']['sha'],
+        commit_at=datetime.strptime(repo_data['pushed_at'], '%Y-%m-%dT%H:%M:%SZ')
+    )
+
+
+async def _fetch_tree_entries(owner: str, repo: str, sha: str, recursive: bool) -> Tuple[List[dict], bool]:
+    """
+    :return: The entries of a tree (paths relative to it) and whether GitHub truncated them
+    """
+    tree_url = f'{_API_URL}/repos/{owner}/{repo}/git/trees/{sha}' + ('?recursive=1' if recursive else '')
+    # The tree of a SHA never changes, the tree of a branch name is revalidated
+    status, data = await _github_get_json(tree_url, immutable=bool(_COMMIT_SHA_PATTERN.match(sha)))
+    _raise_for_status(status, f'Tree {sha} of {owner}/{repo}')
+    return data['tree'], data.get('truncated', False)
+
+
+async def _page_truncated_tree(
+        owner: str,
+        repo: str,
+        commit_sha: str,
+        prune: Optional[Callable[[str], bool]]
+) -> List[dict]:
+    """
+    Rebuilds a tree that is too large for a single recursive listing: folders are listed one level at a time from
+    the root, and each subfolder is listed recursively on its own, one level deeper where that is truncated too.
+    Subfolders are listed concurrently, and pruned folders are never listed.
+
+    :raises Exception: If the tree needs more requests than the paging budget or the remaining quota allow,
+                       rather than ingesting part of the repository
+    """
+    budget = github_tree_config['max_requests']
+    quota = RateLimitGovernor.getInstance().snapshot()
+    if quota:
+        budget = min(budget, max(quota['remaining'] - github_rate_limit_config['reserve'], 0))
+    semaphore = asyncio.Semaphore(github_tree_config['concurrency'])
+    items: List[dict] = []
+    requests = 0
+
+    async def list_tree(prefix: str, sha: str, recursive: bool) -> Tuple[List[dict], bool]:
+        nonlocal requests
+        if requests >= budget:
+            raise Exception(f'The tree of {owner}/{repo} does not fit in {budget} requests')
+        requests += 1
+        async with semaphore:
+            entries, truncated = await _fetch_tree_entries(owner, repo, sha, recursive)
+        return [{**entry, 'path': prefix + entry['path']} for entry in entries], truncated
 
-            if item['type'] == 'blob':
-                parent.files.append(item['path'])
-            elif item['type'] == 'tree':
-                parent.subdirectories.append(current)
+    async def list_level(prefix: str, sha: str):
+        entries, _ = await list_tree(prefix, sha, False)
+        items.extend(entries)
+        await asyncio.gather(*[
+            list_subtree(entry['path'], entry['sha'])
+            for entry in entries
+            if entry['type'] == 'tree' and not (prune and prune(entry['path']))
+        ])
 
-        return root_result
+    async def list_subtree(path: str, sha: str):
+        entries, truncated = await list_tree(f'{path}/', sha, True)
+        if truncated:
+            await list_level(f'{path}/', sha)
+        else:
+            items.extend(entries)
+
+    await list_level('', commit_sha)
+    logger.info(f'Paged the tree of {owner}/{repo} in {requests} requests, {len(items)} entries')
+    return items
+
+
+async def fetch_github_repo_tree(
+        owner: str,
+        repo: str,
+        commit_sha: str,
+        prune: Optional[Callable[[str], bool]] = None
+) -> RepoTreeResult:
+    """
+    Fetches the whole tree of a commit with a recursive listing, or by paging its subtrees if GitHub truncated it.
+
+    :param prune: Called with the path of a folder, True to skip what is below it when paging (e.g. node_modules)
+    """
+    items, truncated = await _fetch_tree_entries(owner, repo, commit_sha, True)
+    if truncated:
+        logger.warning(f'The tree of {owner}/{repo} is truncated, paging its subtrees...')
+        items = await _page_truncated_tree(owner, repo, commit_sha, prune)
+    return build_repo_tree(items)
 
 
 async def fetch_github_repo_file(owner: str, repo: str, sha: str, path: str) -> str:
-    code_url = f'https://raw.githubusercontent.com/{owner}/{repo}/{sha}/{path}'
+    code_url = f'{_RAW_URL}/{owner}/{repo}/{sha}/{path}'
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(code_url,headers=github_auth_config, ssl=False) as resp:
+    async def attempt() -> str:
+        async with _github_get(code_url, api=False) as resp:
             if resp.status != 200:
                 raise Exception(f'Failed to fetch file: {resp.status}')
-            return await resp.text()
+            # Decoded like the other fetch modes, so binary content reaches the content checks instead of failing here
+            return (await resp.read()).decode('utf-8', errors='replace')
+
+    return await RetryPolicy.getInstance().run(code_url, attempt)
+
+
+class _ArchiveStalledError(Exception):
+    """
+    The consumer of an archive took no file for GITHUB_ARCHIVE_STALL_SECONDS, so the download was abandoned.
+    """
+
+
+async def _extract_archive(url: str, wanted: Callable[[str], bool], queue: asyncio.Queue):
+    """
+    Downloads a tarball and puts (archive path, content) of the wanted files in `queue` as they are decompressed.
+    While the queue is full the response is not read, so the download waits for the consumer, up to
+    GITHUB_ARCHIVE_STALL_SECONDS. A download that fails midway is started over and skips the files already queued.
+    """
+    queued: Set[str] = set()
+
+    async def attempt():
+        async with _github_get(url, timeout=_ARCHIVE_TIMEOUT) as response:
+            _raise_for_status(response.status, f'Archive {url}')
+            chunks = response.content.iter_chunked(_ARCHIVE_CHUNK_SIZE)
+            files = iter_tar_gz(chunks, lambda p: p not in queued and wanted(p))
+            async with aclosing(files):
+                async for path, content in files:
+                    try:
+                        await asyncio.wait_for(queue.put((path, content)), github_archive_config['stall_seconds'])
+                    except asyncio.TimeoutError:
+                        raise _ArchiveStalledError(
+                            f'No file of {url} was taken for {github_archive_config["stall_seconds"]}s'
+                        ) from None
+                    queued.add(path)
+
+    await RetryPolicy.getInstance().run(url, attempt)
+
+
+async def fetch_github_repo_archive(
+        owner: str,
+        repo: str,
+        sha: str,
+        paths: Set[str]
+) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Downloads the tarball of a commit in a single request and yields (path, content) for the given files,
+    while the archive is being downloaded and decompressed. Neither the archive nor the files that are not
+    asked for are kept, in memory or on disk: at most GITHUB_ARCHIVE_QUEUE_FILES extracted files wait for the
+    caller. If the caller does not take any of them for GITHUB_ARCHIVE_STALL_SECONDS, the download is abandoned
+    and the iteration raises once the files already extracted are yielded, so the caller can fetch the rest in
+    another way. Files of `paths` missing from the archive (e.g. submodules) are not yielded.
+
+    :param paths: Paths of the files to extract, relative to the repository root
+    """
+    archive_url = f'{_API_URL}/repos/{owner}/{repo}/tarball/{sha}'
+
+    def repo_path(archive_path: str) -> str:
+        # Every entry is under a "{owner}-{repo}-{short sha}/" root folder
+        return archive_path.partition('/')[2]
+
+    queue: asyncio.Queue = asyncio.Queue(github_archive_config['queue_files'])
+    download = asyncio.create_task(_extract_archive(archive_url, lambda p: repo_path(p) in paths, queue))
+
+    async def next_file() -> Optional[Tuple[str, bytes]]:
+        get = asyncio.ensure_future(queue.get())
+        await asyncio.wait([get, download], return_when=asyncio.FIRST_COMPLETED)
+        if get.done():
+            return get.result()
+        get.cancel()
+        if not queue.empty():
+            return queue.get_nowait()
+        # Raises the error of the download, if any
+        download.result()
+        return None
+
+    try:
+        while item := await next_file():
+            archive_path, content = item
+            yield repo_path(archive_path), content.decode('utf-8', errors='replace')
+    finally:
+        download.cancel()
+        await asyncio.gather(download, return_exceptions=True)
+
+
+class _RetriableBatchError(Exception):
+    """
+    A GraphQL batch that may succeed once smaller or later (server error, timeout, resource limits).
+    """
+
+
+def _blob_query(count: int) -> str:
+    """
+    GraphQL query reading `count` blobs of a repository, $e0...$e{count-1} being "<commit sha>:<path>" expressions.
+    """
+    variables = ", ".join(f"$e{i}: String!" for i in range(count))
+    objects = " ".join(
+        f"f{i}: object(expression: $e{i}) {{ ... on Blob {{ text isTruncated }} }}" for i in range(count)
+    )
+    return f"query($owner: String!, $name: String!, {variables}) {{ repository(owner: $owner, name: $name) {{ {objects} }} }}"
+
+
+async def _fetch_blob_batch(owner: str, repo: str, sha: str, paths: List[str]) -> Tuple[Dict[str, str], int]:
+    """
+    Reads a batch of files in a single GraphQL query. A batch of several files is sent once, smaller batches are the
+    retry (see fetch_github_repo_files_graphql), a single file gets every attempt of the RetryPolicy. Rate limits get
+    every attempt whatever the size of the batch, the governor holds them back until the GraphQL quota allows.
+
+    :return: The content of the files that could be read (binary and truncated blobs are left out), and the size
+             of the response in bytes
+    """
+    governor = RateLimitGovernor.getInstance()
+    payload = {
+        'query': _blob_query(len(paths)),
+        'variables': {
+            'owner': owner,
+            'name': repo,
+            **{f'e{i}': f'{sha}:{path}' for i, path in enumerate(paths)},
+        },
+    }
+
+    async def attempt() -> bytes:
+        token = await governor.acquire(GRAPHQL)
+        async with GithubClient.getInstance().session().post(_GRAPHQL_URL, json=payload, headers=token.headers) as resp:
+            governor.observe(token, resp.status, resp.headers, GRAPHQL)
+            # Rate limits (403 with Retry-After or no points left, 429) raise RetriableError here
+            check_status(resp.status, resp.headers)
+            if resp.status in (401, 403, 404):
+                # Bad token or no access to the repository, smaller batches will not help
+                raise GithubApiError(f'GitHub GraphQL Error: {resp.status}', resp.status)
+            if resp.status != 200:
+                raise _RetriableBatchError(f'GitHub GraphQL Error: {resp.status}')
+            return await resp.read()
+
+    try:
+        body = await RetryPolicy.getInstance().run(_GRAPHQL_URL, attempt, max_attempts=1 if len(paths) > 1 else None)
+    except (RetriableError, CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise _RetriableBatchError(str(e) or type(e).__name__)
+
+    data = json.loads(body)
+    # Errors on some of the objects still come with the data of the others
+    repository = (data.get('data') or {}).get('repository')
+    if repository is None:
+        raise _RetriableBatchError(f"GitHub GraphQL Error: {data.get('errors')}")
+    contents = {}
+    for i, path in enumerate(paths):
+        blob = repository.get(f'f{i}')
+        if blob and blob.get('text') is not None and not blob.get('isTruncated'):
+            contents[path] = blob['text']
+    return contents, len(body)
+
+
+async def fetch_github_repo_files_graphql(
+        owner: str,
+        repo: str,
+        sha: str,
+        paths: Set[str]
+) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Reads many files per round trip with GraphQL `object(expression: "sha:path")` aliases and yields (path, content)
+    batch by batch.
+
+    Batches are sized so that a response stays around the target size given the average size of the files read so
+    far. A batch that fails (e.g. timeout or resource limits of GitHub) is split in two halves that are retried before
+    anything else, down to single files, without changing the size of the other batches. Files that cannot be read
+    this way (binary, too large, or failing on their own) are not yielded.
+    Other errors (no token, no access) abort the download.
+    """
+    if all(token.token is None for token in RateLimitGovernor.getInstance().tokens):
+        raise Exception('The GitHub GraphQL API requires a token')
+    pending = deque(sorted(paths))
+    split_batches: deque = deque()  # halves of failed batches
+    max_files = github_graphql_config['max_batch_files']
+    target_bytes = github_graphql_config['target_batch_bytes']
+    results: asyncio.Queue = asyncio.Queue(github_graphql_config['concurrency'])
+    stats = {'batch_size': min(max_files, 10), 'files': 0, 'bytes': 0, 'requests': 0}
+
+    async def worker():
+        while pending or split_batches:
+            if split_batches:
+                batch = split_batches.popleft()
+            else:
+                batch = [pending.popleft() for _ in range(min(stats['batch_size'], len(pending)))]
+            stats['requests'] += 1
+            try:
+                contents, size = await _fetch_blob_batch(owner, repo, sha, batch)
+            except _RetriableBatchError as e:
+                if len(batch) > 1:
+                    # Retry both halves before anything else, a bad file ends up alone in a batch of its own
+                    half = len(batch) // 2
+                    split_batches.extendleft([batch[half:], batch[:half]])
+                else:
+                    logger.warning(f'\tFailed fetching {batch[0]} through GraphQL, error: {e}')
+                continue
+            stats['files'] += len(batch)
+            stats['bytes'] += size
+            average = stats['bytes'] / stats['files']
+            stats['batch_size'] = max(1, min(max_files, int(target_bytes / max(average, 1))))
+            await results.put(contents)
+
+    async def run_workers():
+        try:
+            await asyncio.gather(*[worker() for _ in range(github_graphql_config['concurrency'])])
+        finally:
+            await results.put(None)
+
+    runner = asyncio.create_task(run_workers())
+    try:
+        while (contents := await results.get()) is not None:
+            for path, content in contents.items():
+                yield path, content
+        await runner
+    finally:
+        runner.cancel()
+        GithubClient.getInstance().recordBatches(stats['requests'], stats['files'])
+        logger.info(
+            f"\tRead {stats['files']} files in {stats['requests']} GraphQL requests, "
+            f"{stats['files'] - stats['requests']} requests saved"
+        )
@@ -1,17 +1,318 @@
-from typing import Optional
+import asyncio
+import time
+from typing import Optional, Mapping, List, Tuple, Dict
 
-import aiohttp
-from github.config import github_auth_config
+from github.client import GithubClient
+from github.config import github_tokens, github_auth_headers, github_rate_limit_config
 
 from loguru import logger
 
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to `burst` tokens and refills at `rate` tokens per second.
+    A rate of None means unlimited.
+    """
+
+    def __init__(self, rate: Optional[float], burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self) -> float:
+        """
+        Takes a token if one is available.
+        :return: 0 on success, otherwise the number of seconds until the next token is available
+        """
+        if self.rate is None:
+            return 0
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        if self.rate <= 0:
+            return float('inf')
+        return (1 - self._tokens) / self.rate
+
+
+# Resources a request can be acquired for: the REST API quota, the GraphQL API quota (in points, separate from the REST
+# one) and raw.githubusercontent.com, which has no quota but is paced and may answer Retry-After
+CORE = 'core'
+GRAPHQL = 'graphql'
+RAW = 'raw'
+_QUOTA_RESOURCES = (CORE, GRAPHQL)
+
+
+class Quota:
+    """
+    One API quota of a token, as last reported by the X-RateLimit-* headers of the responses of that resource.
+    """
+
+    def __init__(self, burst: int):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset: Optional[int] = None  # Unix timestamp of the next quota reset
+        self.pausedUntil = 0.0
+        self.bucket = TokenBucket(None, burst)
+
+    def known(self) -> bool:
+        return self.remaining is not None and self.reset is not None and self.reset > time.time()
+
+    def parkedUntil(self, reserve: int) -> float:
+        """
+        Returns until when this quota may not be used (in the past if usable now).
+        """
+        if self.known() and self.remaining <= reserve:
+            return max(self.pausedUntil, self.reset + 1)
+        return self.pausedUntil
+
+    def usage(self) -> dict:
+        return {
+            'limit': self.limit,
+            'remaining': self.remaining if self.known() else None,
+            'reset': self.reset,
+            'paused_until': self.pausedUntil if self.pausedUntil > time.time() else None,
+        }
+
+
+class GithubToken:
+    """
+    A GitHub token and its REST and GraphQL quotas.
+    The REST quota is also exposed as limit/remaining/reset, it is the one most requests count against.
+    """
+
+    def __init__(self, token: Optional[str], burst: int):
+        self.token = token
+        self.headers = github_auth_headers(token)
+        self.quotas: Dict[str, Quota] = {resource: Quota(burst) for resource in _QUOTA_RESOURCES}
+        self.requests = 0
+
+    @property
+    def label(self) -> str:
+        # Never expose the token itself
+        return f"...{self.token[-4:]}" if self.token else "anonymous"
+
+    @property
+    def limit(self) -> Optional[int]:
+        return self.quotas[CORE].limit
+
+    @property
+    def remaining(self) -> Optional[int]:
+        return self.quotas[CORE].remaining
+
+    @property
+    def reset(self) -> Optional[int]:
+        return self.quotas[CORE].reset
+
+    def quotaKnown(self) -> bool:
+        return self.quotas[CORE].known()
+
+    def usage(self) -> dict:
+        return {
+            'token': self.label,
+            'requests': self.requests,
+            **self.quotas[CORE].usage(),
+            GRAPHQL: self.quotas[GRAPHQL].usage(),
+        }
+
+
+class RateLimitGovernor:
+    """
+    Process-wide pacing of every GitHub request over a pool of tokens.
+
+    Instead of polling /rate_limit, the quotas of each token are read from the X-RateLimit-* headers of its
+    responses, the REST (core) and GraphQL quotas separately. Each request is routed to the token with the most
+    remaining quota of its resource, and each quota has a token bucket that spreads what is left evenly until its
+    reset. Exhausted quotas, and quotas that received a Retry-After (secondary rate limit), are parked until they may
+    be used again.
+
+    Usage:
+        governor = RateLimitGovernor.getInstance()
+        token = await governor.acquire()  # or acquire(GRAPHQL), acquire(RAW)
+        ... send the request with token.headers ...
+        governor.observe(token, resp.status, resp.headers)  # with the same resource
+    """
+
+    _instance: Optional["RateLimitGovernor"] = None
+
+    def __init__(self, tokens: List[str], burst: int, reserve: int, raw_requests_per_second: float):
+        self.tokens = [GithubToken(token, burst) for token in tokens] or [GithubToken(None, burst)]
+        self._reserve = reserve
+        self._rawBucket = TokenBucket(raw_requests_per_second, burst)
+        self._rawPausedUntil = 0.0
+        # Guards the quota bookkeeping of the tokens and buckets, never held while waiting
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def getInstance(cls) -> "RateLimitGovernor":
+        if cls._instance is None:
+            cls._instance = RateLimitGovernor(
+                github_tokens,
+                github_rate_limit_config['burst'],
+                github_rate_limit_config['reserve'],
+                github_rate_limit_config['raw_requests_per_second'],
+            )
+        return cls._instance
+
+    def _candidates(self, resource: str, now: float) -> List[GithubToken]:
+        candidates = []
+        for token in self.tokens:
+            quota = token.quotas[resource]
+            if not quota.known():
+                # The quota has reset (or was never seen), stop pacing until the next response tells us more
+                quota.bucket.rate = None
+            if quota.parkedUntil(self._reserve) <= now:
+                candidates.append(token)
+
+        # Tokens with an unknown quota first, to learn it, then the one with the most remaining requests
+        def remaining(token: GithubToken) -> float:
+            quota = token.quotas[resource]
+            return quota.remaining if quota.known() else float('inf')
+
+        return sorted(candidates, key=remaining, reverse=True)
+
+    def _take(self, resource: str, now: float) -> Tuple[Optional[GithubToken], float]:
+        """
+        Takes a request from the pool if one may be sent now.
+
+        :return: The token to send it with, or None and the number of seconds to wait before trying again
+        """
+        if resource == RAW:
+            # raw.githubusercontent.com is not counted against the API quotas, a token parked for its quota still
+            # works there, only the raw pacing and its Retry-After apply
+            if self._rawPausedUntil > now:
+                return None, self._rawPausedUntil - now
+            wait = self._rawBucket.take()
+            if wait:
+                return None, wait
+            token = min(self.tokens, key=lambda t: t.requests)
+            token.requests += 1
+            return token, 0
+
+        candidates = self._candidates(resource, now)
+        if not candidates:
+            wake = min(token.quotas[resource].parkedUntil(self._reserve) for token in self.tokens)
+            logger.warning(f"All GitHub tokens are exhausted for {resource}, pausing for {wake - now:.0f} seconds")
+            return None, max(wake - now, 0.05)
+
+        waits = []
+        for token in candidates:
+            quota = token.quotas[resource]
+            wait = quota.bucket.take()
+            if wait == 0:
+                token.requests += 1
+                if quota.remaining is not None:
+                    # Count the request right away, its response may arrive after other requests start
+                    quota.remaining -= 1
+                return token, 0
+            waits.append(wait)
+        return None, min(waits)
+
+    async def acquire(self, resource: str = CORE) -> GithubToken:
+        """
+        Waits until a request may be sent and returns the token to send it with.
+
+        :param resource: CORE for api.github.com REST requests, GRAPHQL for GraphQL queries,
+                         RAW for raw.githubusercontent.com requests
+        """
+        while True:
+            # The lock only covers the bookkeeping, waiting happens outside of it so a request never waits behind
+            # the pacing of another resource
+            async with self._lock:
+                token, wait = self._take(resource, time.time())
+            if token is not None:
+                return token
+            await asyncio.sleep(wait)
+
+    def observe(self, token: GithubToken, status: int, headers: Mapping[str, str], resource: str = CORE):
+        """
+        Updates the quotas of a token from the headers of a GitHub response to a request acquired for `resource`.
+        """
+        now = time.time()
+        # X-RateLimit-Resource tells which quota the headers are about (e.g. search requests have their own)
+        reported = headers.get('X-RateLimit-Resource', resource)
+        quota = token.quotas.get(reported)
+        if headers.get('X-RateLimit-Remaining') is not None and quota is not None:
+            quota.limit = int(headers.get('X-RateLimit-Limit', quota.limit or 0))
+            quota.remaining = int(headers['X-RateLimit-Remaining'])
+            quota.reset = int(headers.get('X-RateLimit-Reset', quota.reset or now))
+            # Spread what is left evenly over the time until the reset
+            usable = max(quota.remaining - self._reserve, 0)
+            quota.bucket.rate = usable / max(quota.reset - now, 1)
+
+        if status in (403, 429):
+            retry_after = headers.get('Retry-After')
+            if retry_after is not None:
+                logger.warning(f"GitHub asked to retry after {retry_after} seconds, pausing token {token.label}")
+                if resource == RAW:
+                    self._rawPausedUntil = max(self._rawPausedUntil, now + int(retry_after))
+                else:
+                    paused = token.quotas[resource]
+                    paused.pausedUntil = max(paused.pausedUntil, now + int(retry_after))
+            elif quota is not None and quota.remaining == 0 and quota.reset:
+                quota.pausedUntil = max(quota.pausedUntil, quota.reset + 1)
+
+    def retryAfter(self, resource: str = CORE) -> float:
+        """
+        Returns how many seconds until a request for `resource` may be sent with one of the tokens, 0 if one may be
+        sent now (pacing aside).
+        """
+        now = time.time()
+        if resource == RAW:
+            return max(self._rawPausedUntil - now, 0)
+        return max(min(token.quotas[resource].parkedUntil(self._reserve) for token in self.tokens) - now, 0)
+
+    def snapshot(self) -> Optional[dict]:
+        """
+        Returns the combined REST quota of all tokens in the format of /rate_limit, with the earliest reset,
+        or None if the quota of a token is unknown or outdated.
+        """
+        if not all(token.quotaKnown() for token in self.tokens):
+            return None
+        return {
+            'limit': sum(token.limit for token in self.tokens),
+            'remaining': sum(token.remaining for token in self.tokens),
+            'reset': min(token.reset for token in self.tokens),
+        }
+
+    def usage(self) -> List[dict]:
+        """
+        Per-token quotas and request counts, for monitoring.
+        """
+        return [token.usage() for token in self.tokens]
+
+
 async def check_rate_limit() -> Optional[dict]:
+    governor = RateLimitGovernor.getInstance()
+    known = governor.snapshot()
+    if known:
+        return known
+
+    # Ask GitHub once for the tokens that nothing has been observed for yet (or whose quota has reset since)
     rate_limit_url = 'https://api.github.com/rate_limit'
-    async with aiohttp.ClientSession(headers=github_auth_config) as session:
-        async with session.get(rate_limit_url, ssl=False) as response:
+    for token in governor.tokens:
+        if token.quotaKnown():
+            continue
+        async with GithubClient.getInstance().session().get(rate_limit_url, headers=token.headers) as response:
             if response.status == 200:
                 data = await response.json()
-                return data['resources']['core']
+                for resource in _QUOTA_RESOURCES:
+                    quota = data['resources'].get(resource)
+                    if quota:
+                        governor.observe(token, 200, {
+                            'X-RateLimit-Resource': resource,
+                            'X-RateLimit-Limit': str(quota['limit']),
+                            'X-RateLimit-Remaining': str(quota['remaining']),
+                            'X-RateLimit-Reset': str(quota['reset']),
+                        })
             else:
-                logger.error(f'Error fetching rate limit: {response.status}')
+                logger.error(f'Error fetching rate limit of token {token.label}: {response.status}')
                 return None
+    return governor.snapshot()
@@ -0,0 +1,111 @@
+import hashlib
+from typing import Optional
+
+from db.model.github_response_cache import GithubResponseCache, GithubResponseCacheData
+from db.utils.connector import AsyncDBConnector
+from github.config import github_response_cache_config
+
+from loguru import logger
+
+
+def _token_hash(token: Optional[str]) -> str:
+    # Responses depend on what the token can see (private repositories), the token itself is never stored.
+    # None keys the responses that can never change (addressed by a SHA), shared by every token of the pool
+    return hashlib.sha256((token or '').encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Process-wide access to the GithubResponseCache table, with hit/miss counters and size-based eviction.
+    A cached response is sent back to GitHub as If-None-Match, and a 304 answer (which does not count against the
+    rate limit) means it can be used as is.
+    A failing cache only costs a full request, so errors are logged and reported as a miss.
+    """
+    _instance: Optional["ResponseCache"] = None
+
+    def __init__(self, enabled: bool, max_bytes: int):
+        self._enabled = enabled
+        self._maxBytes = max_bytes
+        self._table: Optional[GithubResponseCache] = None
+        self._bytesSinceEviction = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def getInstance(cls) -> "ResponseCache":
+        if cls._instance is None:
+            cls._instance = ResponseCache(
+                github_response_cache_config['enabled'],
+                github_response_cache_config['max_bytes'],
+            )
+        return cls._instance
+
+    async def _responses(self) -> GithubResponseCache:
+        if self._table is None:
+            self._table = GithubResponseCache(await AsyncDBConnector.init())
+        return self._table
+
+    async def get(self, url: str, token: Optional[str]) -> Optional[GithubResponseCacheData]:
+        """
+        Returns the cached response of a URL for a token, to be revalidated.
+        """
+        if not self._enabled:
+            return None
+        try:
+            return await (await self._responses()).select(url, _token_hash(token))
+        except Exception as e:
+            logger.warning(f"Failed reading the GitHub response cache for {url}, error: {e}")
+            return None
+
+    async def hit(self, url: str, token: Optional[str]):
+        """
+        Records that the cached response was used instead of a full response.
+        """
+        self.hits += 1
+        try:
+            await (await self._responses()).touch(url, _token_hash(token))
+        except Exception as e:
+            logger.warning(f"Failed updating the GitHub response cache for {url}, error: {e}")
+
+    async def put(self, url: str, token: Optional[str], etag: Optional[str], body: str):
+        """
+        Stores a full response, which was a miss of the cache.
+        """
+        self.misses += 1
+        if not self._enabled or not etag or len(body) > self._maxBytes:
+            return
+        try:
+            await (await self._responses()).upsert(url, _token_hash(token), etag, body)
+            self._bytesSinceEviction += len(body)
+            if self._bytesSinceEviction > self._maxBytes // 10:
+                await self.evict()
+        except Exception as e:
+            logger.warning(f"Failed storing the GitHub response of {url} in the cache, error: {e}")
+
+    async def evict(self):
+        """
+        Trims the cache back to its maximum size.
+        """
+        if not self._enabled:
+            return
+        try:
+            evicted = await (await self._responses()).evict(self._maxBytes)
+            self._bytesSinceEviction = 0
+            self.evictions += evicted
+            if evicted:
+                logger.info(f"Evicted {evicted} responses from the GitHub response cache")
+        except Exception as e:
+            logger.warning(f"Failed evicting the GitHub response cache, error: {e}")
+
+    async def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self._enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "max_bytes": self._maxBytes,
+            **(await (await self._responses()).size() if self._enabled else {}),
+        }
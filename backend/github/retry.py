@@ -0,0 +1,264 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Optional, Mapping, Callable, Awaitable, TypeVar, Dict, Deque, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from github.config import github_retry_config, github_circuit_breaker_config
+
+from loguru import logger
+
+T = TypeVar('T')
+
+# Server side failures that a later attempt may not hit
+_RETRIABLE_STATUSES = {500, 502, 503, 504}
+
+
+class RetriableError(Exception):
+    """
+    A GitHub request that failed in a way a later attempt may not (server error, throttling).
+
+    :param retry_after: Seconds GitHub asked to wait before the next attempt, if it did
+    :param throttled: Rate limited, the RateLimitGovernor already parked the token, so this says nothing about the
+                      health of the host
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, throttled: bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.throttled = throttled
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request to a host whose circuit breaker is open.
+
+    :param retry_after: Seconds until the breaker lets a request to the host through again
+    """
+
+    def __init__(self, message: str, retry_after: float = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def check_status(status: int, headers: Mapping[str, str]):
+    """
+    Raises RetriableError if the status of a GitHub response is worth another attempt.
+    Other statuses (200, 304, 404, ...) are left to the caller.
+    """
+    if status in (403, 429):
+        if 'Retry-After' in headers or headers.get('X-RateLimit-Remaining') == '0' or status == 429:
+            # Secondary or primary rate limit, RateLimitGovernor.observe() parked the token until it may be used again
+            raise RetriableError(f'GitHub rate limit: {status}', throttled=True)
+        return
+    if status in _RETRIABLE_STATUSES:
+        retry_after = headers.get('Retry-After')
+        raise RetriableError(
+            f'GitHub server error: {status}',
+            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+        )
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    True if a fetch that failed with this error may succeed later, e.g. once the host recovered.
+    """
+    return isinstance(error, (RetriableError, CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """
+    Failure rate of the requests to one host over a sliding window.
+
+    Closed: requests go through. Once at least `min_requests` requests in the window failed at `failure_ratio` or
+    more, the breaker opens and no request is sent for `open_seconds`. It is then half-open: a single probe request
+    is let through, its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, host: str, window_seconds: float, min_requests: int, failure_ratio: float,
+                 open_seconds: float):
+        self.host = host
+        self._windowSeconds = window_seconds
+        self._minRequests = min_requests
+        self._failureRatio = failure_ratio
+        self._openSeconds = open_seconds
+        self._outcomes: Deque[Tuple[float, bool]] = deque()  # (time, success)
+        self._failures = 0
+        self.openedUntil = 0.0
+        self._probing = False
+        self.opened = 0
+
+    def _trim(self, now: float):
+        while self._outcomes and self._outcomes[0][0] < now - self._windowSeconds:
+            _, success = self._outcomes.popleft()
+            if not success:
+                self._failures -= 1
+
+    def state(self) -> str:
+        if not self.openedUntil:
+            return 'closed'
+        return 'open' if time.monotonic() < self.openedUntil else 'half-open'
+
+    def blockedFor(self) -> float:
+        """
+        Returns how long to wait before sending a request to the host, 0 if it may be sent now (the caller must then
+        report its outcome with record()).
+        """
+        if not self.openedUntil:
+            return 0
+        now = time.monotonic()
+        if now < self.openedUntil:
+            return self.openedUntil - now
+        if self._probing:
+            # Wait for the outcome of the probe
+            return min(1.0, self._openSeconds)
+        self._probing = True
+        return 0
+
+    def record(self, success: bool):
+        now = time.monotonic()
+        if self.openedUntil:
+            if not self._probing:
+                # Sent before the breaker opened
+                return
+            self._probing = False
+            if success:
+                logger.info(f"GitHub host {self.host} recovered, closing its circuit breaker")
+                self.openedUntil = 0.0
+                self._outcomes.clear()
+                self._failures = 0
+            else:
+                self.openedUntil = now + self._openSeconds
+            return
+
+        self._outcomes.append((now, success))
+        if not success:
+            self._failures += 1
+        self._trim(now)
+        if len(self._outcomes) >= self._minRequests and self._failures >= self._failureRatio * len(self._outcomes):
+            logger.warning(
+                f"{self._failures} of the last {len(self._outcomes)} requests to {self.host} failed, "
+                f"pausing requests to it for {self._openSeconds:.0f} seconds"
+            )
+            self.openedUntil = now + self._openSeconds
+            self.opened += 1
+
+    def abandon(self):
+        """
+        The request let through by blockedFor() was cancelled, without an outcome.
+        """
+        self._probing = False
+
+    def stats(self) -> dict:
+        self._trim(time.monotonic())
+        return {
+            'state': self.state(),
+            'requests': len(self._outcomes),
+            'failures': self._failures,
+            'opened': self.opened,
+        }
+
+
+class RetryPolicy:
+    """
+    Retries of every GitHub request, with exponential backoff and full jitter (so that the workers that failed
+    together do not retry together), and at least the Retry-After of the response if it has one.
+    Each host has a CircuitBreaker: while a host is failing, requests to it wait instead of adding to its load.
+
+    Usage:
+        async def attempt():
+            ... send one request, check_status(resp.status, resp.headers), read the body ...
+        result = await RetryPolicy.getInstance().run(url, attempt)
+    """
+
+    _instance: Optional["RetryPolicy"] = None
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float, max_elapsed_seconds: float):
+        self._maxAttempts = max_attempts
+        self._baseDelay = base_delay
+        self._maxDelay = max_delay
+        self._maxElapsedSeconds = max_elapsed_seconds
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+        self.failures = 0  # calls that ran out of attempts or time
+
+    @classmethod
+    def getInstance(cls) -> "RetryPolicy":
+        if cls._instance is None:
+            cls._instance = RetryPolicy(**github_retry_config)
+        return cls._instance
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).hostname or ''
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(host, **github_circuit_breaker_config)
+        return self._breakers[host]
+
+    def delay(self, attempt: int) -> float:
+        """
+        Backoff before the attempt following attempt number `attempt` (1 based): uniform between 0 and
+        base_delay * 2^(attempt - 1), capped at max_delay.
+        """
+        return random.uniform(0, min(self._maxDelay, self._baseDelay * 2 ** (attempt - 1)))
+
+    async def run(self, url: str, attempt: Callable[[], Awaitable[T]], max_attempts: Optional[int] = None) -> T:
+        """
+        Calls `attempt` until it succeeds, raises an error that is not transient, or runs out of attempts or time.
+
+        :param url: Request URL, its host picks the circuit breaker
+        :param attempt: Sends the request once, raises RetriableError (see check_status) for a response worth another
+                        attempt
+        :param max_attempts: Overrides GITHUB_RETRY_MAX_ATTEMPTS for failures of the request, a rate limit is not one
+                             and always gets GITHUB_RETRY_MAX_ATTEMPTS
+        :return: The result of the successful attempt
+        """
+        breaker = self.breaker(url)
+        max_attempts = max_attempts or self._maxAttempts
+        deadline = time.monotonic() + self._maxElapsedSeconds
+        number = 0
+        while True:
+            blocked = breaker.blockedFor()
+            if blocked:
+                if time.monotonic() + blocked > deadline:
+                    self.failures += 1
+                    raise CircuitOpenError(
+                        f'Requests to {breaker.host} are paused after repeated failures', retry_after=blocked
+                    )
+                await asyncio.sleep(blocked)
+                continue
+
+            number += 1
+            try:
+                result = await attempt()
+            except (RetriableError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                throttled = isinstance(e, RetriableError) and e.throttled
+                breaker.record(throttled)
+                retry_after = e.retry_after if isinstance(e, RetriableError) else None
+                wait = max(self.delay(number), retry_after or 0)
+                limit = max(self._maxAttempts, max_attempts) if throttled else max_attempts
+                if number >= limit or time.monotonic() + wait > deadline:
+                    self.failures += 1
+                    raise
+                self.retries += 1
+                logger.debug(f"\tRetrying {url} in {wait:.1f}s (attempt {number}), error: {str(e) or type(e).__name__}")
+                await asyncio.sleep(wait)
+                continue
+            except asyncio.CancelledError:
+                breaker.abandon()
+                raise
+            except Exception:
+                # Not a failure of the host (e.g. 404)
+                breaker.record(True)
+                raise
+            breaker.record(True)
+            return result
+
+    def stats(self) -> dict:
+        return {
+            'retries': self.retries,
+            'failures': self.failures,
+            'hosts': {host: breaker.stats() for host, breaker in self._breakers.items()},
+        }
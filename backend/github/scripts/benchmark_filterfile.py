@@ -0,0 +1,132 @@
+"""
+Benchmark of the path filters of github/filterfile.py on a synthetic monorepo tree.
+
+Usage (from backend/):
+    python -m github.scripts.benchmark_filterfile --paths 250000 --repeat 5
+
+Measured on 250,000 files (one core, CPython 3.11), best of 5:
+    legacy regex loops          1197 ms   0.21 M paths/s
+    PathClassifier               337 ms   0.74 M paths/s   (3.6x)
+    PathClassifier + job rules   550 ms   0.45 M paths/s
+That is about a third of a second for such a tree, not the few milliseconds hoped for: once every list is a single
+regex search, what is left is per-path Python work (lower(), the searches, rebuilding the tree), about 1 µs a path in
+CPython, which only a batch engine outside of the interpreter would remove.
+The classifier must keep the verdicts of the loops exactly, github/tests/test_filterfile.py checks it.
+"""
+import argparse
+import random
+import re
+import time
+from typing import Callable, List
+
+from github.fetch_repo import RepoTreeResult, build_repo_tree
+from github.filterfile import default_classifier, whitelisted_filter, blacklisted_file, blacklisted_filter
+
+from loguru import logger
+
+_FOLDERS = [
+    'src', 'lib', 'pkg', 'internal', 'core', 'api', 'server', 'client', 'utils', 'common', 'models', 'handlers',
+    'services', 'components', 'hooks', 'store', 'docs', 'tests', 'test', 'examples', 'node_modules', 'vendor',
+    'build', 'dist', 'scripts', 'assets', 'generated', 'proto', 'migrations', 'config', '.github', '__pycache__',
+]
+_FILES = [
+    'index', 'main', 'app', 'server', 'client', 'utils', 'helpers', 'types', 'constants', 'router', 'schema',
+    'service', 'handler', 'model', 'setup', 'README', '__init__', 'webpack.config', 'user_service', 'parser',
+]
+_EXTENSIONS = [
+    '.py', '.ts', '.js', '.go', '.rs', '.java', '.cpp', '.h', '.md', '.json', '.yml', '.png', '.min.js', '.d.ts',
+    '.spec.ts', '.pb.go', '.lock', '.txt',
+]
+
+# Rules of a job, on top of the built-in filters
+_JOB_RULES = ['*.pb.go', '/packages/*/generated/', '!docs/', '!*.md', 'legacy/**/*.js']
+
+
+def synthetic_tree(paths: int, seed: int = 0, files_per_folder: int = 20) -> RepoTreeResult:
+    """
+    Builds a monorepo-like tree of `paths` files spread over packages/<n>/<1 to 6 folders>, about
+    `files_per_folder` files per folder.
+    """
+    rng = random.Random(seed)
+    items = {}
+    folders = []
+    while len(folders) < max(paths // files_per_folder, 1):
+        parts = ['packages', f'pkg{rng.randrange(200)}'] + rng.choices(_FOLDERS, k=rng.randint(1, 6))
+        for depth in range(1, len(parts) + 1):
+            folder = '/'.join(parts[:depth])
+            if folder not in items:
+                items[folder] = {'path': folder, 'type': 'tree', 'sha': ''}
+                folders.append(folder)
+
+    files = 0
+    while files < paths:
+        path = f"{rng.choice(folders)}/{rng.choice(_FILES)}{rng.randrange(1000)}{rng.choice(_EXTENSIONS)}"
+        if path not in items:
+            items[path] = {'path': path, 'type': 'blob', 'sha': '', 'size': rng.randrange(100, 50000)}
+            files += 1
+    return build_repo_tree(items.values())
+
+
+# Patterns as they were before PathClassifier, where they were rewritten: the [^/]+ of the dot pattern always reaches
+# a / or the end of the path, so ($|/) never rejected a match
+_LEGACY_PATTERNS = {r'(^|/)\.[^/]': r'(^|/)\.[^/]+($|/)'}
+
+
+def legacy_filter_tree(tree: RepoTreeResult) -> RepoTreeResult:
+    """
+    The filters before PathClassifier: every regex list compiled again on each call, then tested one by one.
+    """
+    def compiled(patterns: List[str]):
+        return [re.compile(_LEGACY_PATTERNS.get(pattern, pattern)) for pattern in patterns]
+
+    whitelist, file_blacklist = compiled(whitelisted_filter), compiled(blacklisted_file)
+    files = [f for f in tree.files if any(p.search(f.lower()) for p in whitelist)]
+    files = [f for f in files if not any(p.search(f.lower()) for p in file_blacklist)]
+    folder_blacklist = compiled(blacklisted_filter)
+    subdirs = [d for d in tree.subdirectories if not any(p.search(d.path.lower()) for p in folder_blacklist)]
+
+    pruned = []
+    for subdir in subdirs:
+        filtered = legacy_filter_tree(subdir)
+        if filtered.files or filtered.subdirectories:
+            pruned.append(filtered)
+    return RepoTreeResult(path=tree.path, files=files, subdirectories=pruned)
+
+
+def _count(tree: RepoTreeResult) -> int:
+    return len(tree.files) + sum(_count(subdir) for subdir in tree.subdirectories)
+
+
+def _measure(name: str, run: Callable[[], RepoTreeResult], repeat: int, paths: int) -> float:
+    timings = []
+    kept = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        kept = _count(run())
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    logger.info(
+        f"{name:<28} best {best * 1000:8.1f} ms   {paths / best / 1e6:6.2f} M paths/s   {kept} files kept"
+    )
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--paths', type=int, default=250_000, help='Files in the synthetic tree')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of each filter, the best one is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tree = synthetic_tree(args.paths, args.seed)
+    logger.info(f"Synthetic tree of {_count(tree)} files")
+
+    job_classifier = default_classifier.withRules(_JOB_RULES)
+    legacy = _measure('legacy regex loops', lambda: legacy_filter_tree(tree), args.repeat, args.paths)
+    builtin = _measure('PathClassifier', lambda: default_classifier.filterTree(tree), args.repeat, args.paths)
+    _measure('PathClassifier + job rules', lambda: job_classifier.filterTree(tree), args.repeat, args.paths)
+    logger.info(f"Speedup of the built-in rules: {legacy / builtin:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
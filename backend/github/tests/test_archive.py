@@ -0,0 +1,185 @@
+import asyncio
+import gzip
+import io
+import random
+import tarfile
+from contextlib import asynccontextmanager
+from typing import Dict
+
+import pytest
+from aiohttp import web
+
+import github.fetch_repo as fetch_repo
+from github.archive import iter_tar_gz
+from github.client import GithubClient
+from github.config import github_archive_config
+
+_ROOT = 'octo-repo-0123abc'
+_LONG_PATH = 'src/' + 'nested/' * 20 + 'module.py'
+
+
+def _tarball(files: Dict[str, bytes], tar_format: int = tarfile.PAX_FORMAT) -> bytes:
+    """
+    Builds a .tar.gz laid out like a GitHub tarball: a global pax header, then every file under a root folder.
+    """
+    buffer = io.BytesIO()
+    pax_headers = {'comment': '0123abc' * 5} if tar_format == tarfile.PAX_FORMAT else None
+    with tarfile.open(fileobj=buffer, mode='w', format=tar_format, pax_headers=pax_headers) as tar:
+        folder = tarfile.TarInfo(_ROOT)
+        folder.type = tarfile.DIRTYPE
+        tar.addfile(folder)
+        for path, content in files.items():
+            info = tarfile.TarInfo(f'{_ROOT}/{path}')
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return gzip.compress(buffer.getvalue())
+
+
+class _Server:
+    def __init__(self, url: str):
+        self.url = url
+        self.requests = 0
+        self.completed = 0  # responses whose whole body was sent
+
+
+@asynccontextmanager
+async def _serve(body: bytes, chunk_size: int = 1000, cut_first: bool = False, chunk_delay: float = 0):
+    """
+    Serves `body` as the tarball of any commit, in small chunks, and points the GitHub API URL to it.
+
+    :param cut_first: Drop the connection halfway through the first response
+    :param chunk_delay: Seconds between two chunks
+    """
+    server = _Server('')
+
+    async def tarball(request: web.Request) -> web.StreamResponse:
+        server.requests += 1
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for start in range(0, len(body), chunk_size):
+            if cut_first and server.requests == 1 and start > len(body) // 2:
+                request.transport.close()
+                return response
+            await response.write(body[start:start + chunk_size])
+            await asyncio.sleep(chunk_delay)
+        server.completed += 1
+        return response
+
+    app = web.Application()
+    app.router.add_get('/repos/{owner}/{repo}/tarball/{sha}', tarball)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, 'localhost', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    url = fetch_repo._API_URL
+    fetch_repo._API_URL = f'http://{host}:{port}'
+    server.url = f'{fetch_repo._API_URL}/repos/o/r/tarball/s'
+    try:
+        yield server
+    finally:
+        fetch_repo._API_URL = url
+        await GithubClient.getInstance().close()
+        await runner.cleanup()
+
+
+async def _read_served(body: bytes) -> Dict[str, bytes]:
+    async with _serve(body) as server:
+        async with GithubClient.getInstance().session().get(server.url) as resp:
+            return {path: content async for path, content in iter_tar_gz(resp.content.iter_chunked(100), lambda p: True)}
+
+
+@pytest.mark.parametrize('tar_format', [tarfile.PAX_FORMAT, tarfile.GNU_FORMAT, tarfile.USTAR_FORMAT])
+def test_reads_long_names(tar_format):
+    # Over 100 characters: a pax header, a GNU long name entry or the ustar prefix field
+    path = _LONG_PATH if tar_format != tarfile.USTAR_FORMAT else 'src/' + 'nested/' * 15 + 'module.py'
+    files = {'README.md': b'# Octo\n', path: b'print(1)\n' * 1000}
+
+    read = asyncio.run(_read_served(_tarball(files, tar_format)))
+
+    assert read == {f'{_ROOT}/{path}': content for path, content in files.items()}
+
+
+def test_long_name_applies_to_the_next_entry_only():
+    files = {_LONG_PATH: b'a', 'short.py': b'b'}
+
+    read = asyncio.run(_read_served(_tarball(files, tarfile.GNU_FORMAT)))
+
+    assert read == {f'{_ROOT}/{_LONG_PATH}': b'a', f'{_ROOT}/short.py': b'b'}
+
+
+def test_truncated_stream_raises():
+    body = _tarball({'big.py': bytes(range(256)) * 400})
+
+    with pytest.raises(EOFError):
+        asyncio.run(_read_served(body[:len(body) // 2]))
+
+
+def test_archive_yields_the_wanted_files_without_the_root_folder():
+    files = {'README.md': b'# Octo\n', 'src/app.py': b'print(1)\n', _LONG_PATH: b'x = 1\n', 'docs/guide.md': b'guide'}
+
+    async def run():
+        async with _serve(_tarball(files)):
+            wanted = {'src/app.py', _LONG_PATH, 'missing.py'}
+            return {path: content async for path, content in fetch_repo.fetch_github_repo_archive('o', 'r', 's', wanted)}
+
+    assert asyncio.run(run()) == {'src/app.py': 'print(1)\n', _LONG_PATH: 'x = 1\n'}
+
+
+def _incompressible_files() -> Dict[str, bytes]:
+    rng = random.Random(0)
+    return {f'src/module{index}.py': rng.randbytes(10000) for index in range(20)}
+
+
+def _decoded(files: Dict[str, bytes]) -> Dict[str, str]:
+    return {path: content.decode('utf-8', errors='replace') for path, content in files.items()}
+
+
+def test_archive_files_are_yielded_while_it_downloads(monkeypatch):
+    monkeypatch.setitem(github_archive_config, 'queue_files', 1)
+    files = _incompressible_files()
+
+    async def run():
+        async with _serve(_tarball(files), chunk_delay=0.002) as server:
+            read = {}
+            async for path, content in fetch_repo.fetch_github_repo_archive('o', 'r', 's', set(files)):
+                if not read:
+                    # The first file comes before the rest of the tarball is even sent
+                    assert server.completed == 0
+                read[path] = content
+            return read, server.requests
+
+    assert asyncio.run(run()) == (_decoded(files), 1)
+
+
+def test_archive_download_cut_midway_is_resumed():
+    files = _incompressible_files()
+
+    async def run():
+        async with _serve(_tarball(files), cut_first=True) as server:
+            read = [item async for item in fetch_repo.fetch_github_repo_archive('o', 'r', 's', set(files))]
+            return read, server.requests
+
+    read, requests = asyncio.run(run())
+    # The files extracted before the cut are not yielded twice
+    assert requests == 2 and len(read) == len(files) and dict(read) == _decoded(files)
+
+
+def test_stalled_consumer_abandons_the_download(monkeypatch):
+    monkeypatch.setitem(github_archive_config, 'queue_files', 2)
+    monkeypatch.setitem(github_archive_config, 'stall_seconds', 0.1)
+    files = _incompressible_files()
+
+    async def run():
+        read = []
+        async with _serve(_tarball(files)):
+            with pytest.raises(fetch_repo._ArchiveStalledError):
+                async for path, _ in fetch_repo.fetch_github_repo_archive('o', 'r', 's', set(files)):
+                    read.append(path)
+                    if len(read) == 1:
+                        await asyncio.sleep(0.3)
+        return read
+
+    read = asyncio.run(run())
+    # The files extracted before the stall are still yielded, the caller fetches the others in another way
+    assert 2 <= len(read) < len(files)
@@ -0,0 +1,46 @@
+import asyncio
+
+from aiohttp import web
+
+import github.fetch_repo as fetch_repo
+from github.client import GithubClient
+from service.file_filter import content_skip_reason
+
+_PNG = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR' + bytes(range(256)) * 4
+
+
+def _fetch(files: dict, path: str) -> str:
+    """
+    Fetches `path` with fetch_github_repo_file from a local server holding `files`.
+    """
+    async def raw(request: web.Request) -> web.Response:
+        return web.Response(body=files[request.match_info['path']])
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{owner}/{repo}/{sha}/{path:.+}', raw)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, 'localhost', 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        url = fetch_repo._RAW_URL
+        fetch_repo._RAW_URL = f'http://{host}:{port}'
+        try:
+            return await fetch_repo.fetch_github_repo_file('o', 'r', 's', path)
+        finally:
+            fetch_repo._RAW_URL = url
+            await GithubClient.getInstance().close()
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def test_text_file():
+    assert _fetch({'src/app.py': 'print("héllo")\n'.encode()}, 'src/app.py') == 'print("héllo")\n'
+
+
+def test_binary_file_is_fetched_and_reported_as_binary():
+    content = _fetch({'img/logo.py': _PNG}, 'img/logo.py')
+
+    assert content_skip_reason(content) == 'binary'
@@ -0,0 +1,144 @@
+import pytest
+
+from github.fetch_repo import build_repo_tree, RepoTreeResult
+from github.filterfile import default_classifier, PathClassifier
+from github.scripts.benchmark_filterfile import synthetic_tree, legacy_filter_tree
+
+
+def _files(tree: RepoTreeResult) -> list:
+    return sorted(tree.files + [f for subdir in tree.subdirectories for f in _files(subdir)])
+
+
+def _paths(tree: RepoTreeResult) -> list:
+    """
+    The files and folders of a tree, depth first.
+    """
+    return [tree.path] + sorted(tree.files) + [p for subdir in tree.subdirectories for p in _paths(subdir)]
+
+
+def _tree(paths) -> RepoTreeResult:
+    items = {}
+    for path in paths:
+        parts = path.split('/')
+        for depth in range(1, len(parts)):
+            folder = '/'.join(parts[:depth])
+            items[folder] = {'path': folder, 'type': 'tree', 'sha': ''}
+        items[path] = {'path': path, 'type': 'blob', 'sha': '', 'size': 1}
+    return build_repo_tree(items.values())
+
+
+def _filter(paths, rules) -> list:
+    return _files(default_classifier.withRules(rules).filterTree(_tree(paths)))
+
+
+def test_builtin_rules():
+    assert default_classifier.isFileAllowed('src/app.py')
+    assert not default_classifier.isFileAllowed('src/app.min.js')
+    assert not default_classifier.isFileAllowed('src/.hidden.py')
+    assert not default_classifier.isFileAllowed('notes.txt')
+    assert default_classifier.isFolderExcluded('node_modules')
+    assert default_classifier.isFolderExcluded('src/.github')
+    assert not default_classifier.isFolderExcluded('src')
+
+
+def test_rule_without_slash_matches_at_any_depth():
+    classifier = default_classifier.withRules(['*.pb.go'])
+
+    assert not classifier.isFileAllowed('api.pb.go')
+    assert not classifier.isFileAllowed('proto/v1/api.pb.go')
+    assert classifier.isFileAllowed('proto/v1/api.go')
+
+
+def test_rule_with_slash_is_relative_to_the_root():
+    classifier = default_classifier.withRules(['/packages/*/generated/', 'legacy/**/*.js'])
+
+    assert classifier.isFolderExcluded('packages/web/generated')
+    assert not classifier.isFolderExcluded('src/packages/web/generated')
+    assert not classifier.isFolderExcluded('packages/web/ui/generated')
+    assert not classifier.isFileAllowed('legacy/app.js')
+    assert not classifier.isFileAllowed('legacy/a/b/app.js')
+    assert classifier.isFileAllowed('src/legacy/app.js')
+
+
+def test_folder_only_rule_leaves_files_alone():
+    classifier = default_classifier.withRules(['handlers.go/'])
+
+    assert classifier.isFolderExcluded('src/handlers.go')
+    assert classifier.isFileAllowed('src/handlers.go')
+
+
+def test_negated_rule_overrides_the_builtin_rules():
+    # docs/ is in the built-in folder blacklist, .md files other than README.md are not whitelisted
+    assert _filter(['docs/guide.md', 'docs/api.py', 'src/notes.md'], ['!docs/', '!*.md']) == [
+        'docs/api.py', 'docs/guide.md', 'src/notes.md',
+    ]
+    # A folder kept by a rule still has its files go through the built-in file rules
+    assert _filter(['docs/guide.md', 'docs/api.py'], ['!docs/']) == ['docs/api.py']
+
+
+def test_last_matching_rule_decides():
+    assert _filter(['cmd/main.go', 'cmd/other.go'], ['*.go', '!main.go']) == ['cmd/main.go']
+    assert _filter(['cmd/main.go', 'cmd/other.go'], ['!main.go', '*.go']) == []
+
+
+def test_folder_rule_applies_below_the_folder():
+    paths = ['gen/a.py', 'gen/sub/b.py', 'src/gen/c.py', 'src/generator.py']
+
+    assert _filter(paths, ['gen']) == ['src/generator.py']
+    assert _filter(paths, ['/gen']) == ['src/gen/c.py', 'src/generator.py']
+
+
+def test_wildcards_and_classes():
+    classifier = default_classifier.withRules(['file?.py', 'mod[0-9].py', 'x[!a].py'])
+
+    assert not classifier.isFileAllowed('file1.py')
+    assert classifier.isFileAllowed('file10.py')
+    assert classifier.isFileAllowed('dir/file/1.py')
+    assert not classifier.isFileAllowed('mod7.py')
+    assert classifier.isFileAllowed('modx.py')
+    assert not classifier.isFileAllowed('xb.py')
+    assert classifier.isFileAllowed('xa.py')
+
+
+def test_comments_blank_lines_and_escapes():
+    classifier = default_classifier.withRules(['# comment', '', '   ', r'\#notes.py', r'\!important.py'])
+
+    assert not classifier.isFileAllowed('#notes.py')
+    assert not classifier.isFileAllowed('!important.py')
+    assert classifier.isFileAllowed('comment.py')
+
+
+def test_no_rules_returns_the_same_classifier():
+    assert default_classifier.withRules(None) is default_classifier
+    assert default_classifier.withRules([]) is default_classifier
+
+
+@pytest.mark.parametrize('rule', ['/', '[z-a].py'])
+def test_invalid_rule_raises(rule):
+    with pytest.raises(ValueError, match='rule'):
+        default_classifier.withRules([rule])
+
+
+def test_custom_builtin_rules():
+    classifier = PathClassifier([r'\.py$'], [r'_test\.py$'], [r'^vendor'])
+
+    assert classifier.isFileAllowed('app.py') and not classifier.isFileAllowed('app_test.py')
+    assert classifier.isFolderExcluded('vendor/lib') and not classifier.isFolderExcluded('src/vendor')
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_classifier_matches_the_legacy_loops(seed):
+    tree = synthetic_tree(20000, seed)
+
+    assert _paths(default_classifier.filterTree(tree)) == _paths(legacy_filter_tree(tree))
+
+
+def test_classifier_matches_the_legacy_loops_on_edge_cases():
+    tree = _tree([
+        '.env.py', 'src/.hidden.py', 'src/.x/app.py', 'src/a.b/app.py', 'src/app..py', 'src/.py', 'SRC/README.MD',
+        'src/READMEXmd.py', 'src/__init__.py', 'src/_private.py', 'src/Setup.py', 'src/app.d.ts', 'src/app.min.js',
+        'src/app.JS', 'src/app.jsx', 'src/app.spec.ts', 'Art/app.py', 'docs2/app.py', 'src/cinema/app.py',
+        'src/x.h', 'src/x.hh', 'src/config/app.py', 'src/My Types.ts', 'node_modules_old/app.go',
+    ])
+
+    assert _paths(default_classifier.filterTree(tree)) == _paths(legacy_filter_tree(tree))
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+import github.fetch_repo as fetch_repo
+from github.config import github_graphql_config
+from github.ratelimit import RateLimitGovernor
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """
+    Serves every file as its path, except bad.py which fails any batch it is in. Records the batches sent.
+    """
+    sent = []
+
+    async def fetch_blob_batch(owner, repo, sha, paths):
+        sent.append(list(paths))
+        if 'bad.py' in paths:
+            raise fetch_repo._RetriableBatchError('timeout')
+        return {path: path for path in paths}, 1000 * len(paths)
+
+    monkeypatch.setattr(fetch_repo, '_fetch_blob_batch', fetch_blob_batch)
+    monkeypatch.setattr(RateLimitGovernor, '_instance', RateLimitGovernor(['token'], 10, 50, 1000.0))
+    monkeypatch.setitem(github_graphql_config, 'concurrency', 1)
+    monkeypatch.setitem(github_graphql_config, 'max_batch_files', 8)
+    return sent
+
+
+def _read(paths):
+    async def run():
+        return {path: content async for path, content in fetch_repo.fetch_github_repo_files_graphql('o', 'r', 's', paths)}
+
+    return asyncio.run(run())
+
+
+def test_failed_batch_is_split_in_halves(batches):
+    paths = {f'f{index:02}.py' for index in range(30)} | {'bad.py'}
+
+    read = _read(paths)
+
+    assert read == {path: path for path in paths - {'bad.py'}}
+    # The batch of bad.py is retried in halves down to bad.py alone, the batches after it keep their size
+    assert [len(batch) for batch in batches] == [8, 4, 2, 1, 1, 2, 4, 8, 8, 7]
+    assert batches[3] == ['bad.py']
@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+from github.ratelimit import RateLimitGovernor, CORE, GRAPHQL, RAW
+
+
+def _governor(tokens=('a',), raw_requests_per_second=1000.0) -> RateLimitGovernor:
+    return RateLimitGovernor(list(tokens), burst=10, reserve=50, raw_requests_per_second=raw_requests_per_second)
+
+
+def _exhaust(governor: RateLimitGovernor, reset_in: float = 3600):
+    for token in governor.tokens:
+        governor.observe(token, 200, {
+            'X-RateLimit-Limit': '5000',
+            'X-RateLimit-Remaining': '10',
+            'X-RateLimit-Reset': str(int(time.time() + reset_in)),
+        })
+
+
+def test_raw_requests_ignore_the_parked_api_quota():
+    governor = _governor()
+    _exhaust(governor)
+
+    async def run():
+        return await asyncio.wait_for(governor.acquire(RAW), 1)
+
+    assert asyncio.run(run()) is governor.tokens[0]
+
+
+def test_api_waiter_does_not_hold_up_raw_requests():
+    governor = _governor()
+    _exhaust(governor, reset_in=60)
+
+    async def run():
+        api = asyncio.create_task(governor.acquire())
+        await asyncio.sleep(0.05)
+        # The API request is parked until the reset, the raw one goes through meanwhile
+        token = await asyncio.wait_for(governor.acquire(RAW), 1)
+        assert not api.done()
+        api.cancel()
+        return token
+
+    assert asyncio.run(run()) is governor.tokens[0]
+
+
+def test_raw_pacing_does_not_hold_up_api_requests():
+    governor = _governor(raw_requests_per_second=0.5)
+
+    async def run():
+        # Empty the raw bucket, the next raw request waits about 2 seconds
+        for _ in range(10):
+            await governor.acquire(RAW)
+        raw = asyncio.create_task(governor.acquire(RAW))
+        await asyncio.sleep(0.05)
+        token = await asyncio.wait_for(governor.acquire(), 1)
+        raw.cancel()
+        return token
+
+    assert asyncio.run(run()) is governor.tokens[0]
+
+
+def test_retry_after_parks_the_token():
+    governor = _governor(tokens=('a', 'b'))
+    governor.observe(governor.tokens[0], 403, {'Retry-After': '60'})
+
+    async def run():
+        return [await governor.acquire() for _ in range(3)]
+
+    assert all(token is governor.tokens[1] for token in asyncio.run(run()))
+
+
+def _graphql_headers(remaining: int, reset_in: float = 3600) -> dict:
+    return {
+        'X-RateLimit-Resource': 'graphql',
+        'X-RateLimit-Limit': '5000',
+        'X-RateLimit-Remaining': str(remaining),
+        'X-RateLimit-Reset': str(int(time.time() + reset_in)),
+    }
+
+
+def test_graphql_quota_is_tracked_apart_from_core():
+    governor = _governor()
+    token = governor.tokens[0]
+    _exhaust(governor)
+
+    async def run():
+        graphql = await asyncio.wait_for(governor.acquire(GRAPHQL), 1)
+        governor.observe(graphql, 200, _graphql_headers(4000), GRAPHQL)
+
+    asyncio.run(run())
+    assert token.quotas[GRAPHQL].remaining == 4000
+    # The GraphQL request neither counted against nor reset the REST quota
+    assert token.remaining == 10
+
+
+def test_graphql_rate_limit_parks_only_the_graphql_quota():
+    governor = _governor()
+    token = governor.tokens[0]
+    governor.observe(token, 403, _graphql_headers(0, reset_in=60), GRAPHQL)
+
+    async def run():
+        graphql = asyncio.create_task(governor.acquire(GRAPHQL))
+        core = await asyncio.wait_for(governor.acquire(CORE), 1)
+        await asyncio.sleep(0.05)
+        assert not graphql.done()
+        graphql.cancel()
+        return core
+
+    assert asyncio.run(run()) is token
+
+
+def test_retry_after_is_the_earliest_unparking():
+    governor = _governor(tokens=('a', 'b'))
+    assert governor.retryAfter() == 0
+
+    governor.observe(governor.tokens[0], 403, {'Retry-After': '60'})
+    assert governor.retryAfter() == 0
+    governor.observe(governor.tokens[1], 403, {'Retry-After': '30'})
+    assert 28 < governor.retryAfter() <= 30
+    assert governor.retryAfter(GRAPHQL) == 0
@@ -0,0 +1,101 @@
+import asyncio
+import json
+from typing import Dict, List, Tuple
+
+import pytest
+from aiohttp import web
+
+import github.fetch_repo as fetch_repo
+from db.model.github_response_cache import GithubResponseCacheData
+from github.client import GithubClient
+from github.ratelimit import RateLimitGovernor
+from github.response_cache import ResponseCache
+
+_REPO = {
+    'owner': {'login': 'o'}, 'name': 'r', 'html_url': 'https://github.com/o/r', 'topics': [], 'language': 'Python',
+    'description': None, 'stargazers_count': 1, 'forks_count': 0, 'default_branch': 'main',
+    'pushed_at': '2024-01-01T00:00:00Z',
+}
+_RESPONSES = {
+    '/repos/o/r': _REPO,
+    '/repos/o/r/branches/main': {'name': 'main', 'commit': {'sha': '0123abc'}},
+    '/repos/o/r/git/trees/0123abc': {'sha': '0123abc', 'tree': [], 'truncated': False},
+}
+
+
+class _Table:
+    """
+    Keeps the GithubResponseCache rows in memory, and records the lookups.
+    """
+    def __init__(self):
+        self.rows: Dict[Tuple[str, str], GithubResponseCacheData] = {}
+        self.selects = 0
+
+    async def select(self, url, token_hash):
+        self.selects += 1
+        return self.rows.get((url, token_hash))
+
+    async def touch(self, url, token_hash):
+        self.rows[url, token_hash].hits += 1
+
+    async def upsert(self, url, token_hash, etag, body):
+        self.rows[url, token_hash] = GithubResponseCacheData(url, token_hash, etag, body, len(body), 0, None, None)
+
+
+@pytest.fixture
+def table(monkeypatch) -> _Table:
+    table = _Table()
+    cache = ResponseCache(True, 1_000_000)
+    cache._table = table
+    monkeypatch.setattr(ResponseCache, '_instance', cache)
+    monkeypatch.setattr(RateLimitGovernor, '_instance', RateLimitGovernor(['a', 'b', 'c'], 10, 0, 10))
+    return table
+
+
+async def _serve(requests: List[str], call):
+    """
+    Runs `call` against a local server answering the API paths of _RESPONSES, and records the paths requested.
+    """
+    async def api(request: web.Request) -> web.Response:
+        requests.append(request.path)
+        return web.Response(text=json.dumps(_RESPONSES[request.path]), headers={'ETag': f'"{request.path}"'})
+
+    app = web.Application()
+    app.router.add_get('/{path:.+}', api)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, 'localhost', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    url = fetch_repo._API_URL
+    fetch_repo._API_URL = f'http://{host}:{port}'
+    try:
+        return await call()
+    finally:
+        fetch_repo._API_URL = url
+        await GithubClient.getInstance().close()
+        await runner.cleanup()
+
+
+def test_immutable_response_is_shared_by_every_token(table):
+    requests = []
+
+    async def fetch_twice():
+        url = f'{fetch_repo._API_URL}/repos/o/r/git/trees/0123abc'
+        return [await fetch_repo._github_get_json(url, immutable=True) for _ in range(2)]
+
+    first, second = asyncio.run(_serve(requests, fetch_twice))
+
+    assert first == second == (200, _RESPONSES['/repos/o/r/git/trees/0123abc'])
+    # A single lookup each time, whatever the number of tokens, and a single request
+    assert requests == ['/repos/o/r/git/trees/0123abc']
+    assert table.selects == 2 and len(table.rows) == 1
+
+
+def test_repo_details_read_the_sha_from_the_branch(table):
+    requests = []
+
+    details = asyncio.run(_serve(requests, lambda: fetch_repo.fetch_github_repo_details('o', 'r')))
+
+    assert details.sha == '0123abc' and details.default_branch == 'main'
+    assert requests == ['/repos/o/r', '/repos/o/r/branches/main']
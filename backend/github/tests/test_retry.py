@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import pytest
+
+from github.retry import RetryPolicy, RetriableError, CircuitBreaker, CircuitOpenError, check_status
+
+_URL = 'https://api.github.com/repos/o/r'
+
+
+def _policy(max_attempts=3, max_elapsed_seconds=5.0) -> RetryPolicy:
+    return RetryPolicy(max_attempts, base_delay=0.001, max_delay=0.01, max_elapsed_seconds=max_elapsed_seconds)
+
+
+def _breaker(open_seconds=0.1) -> CircuitBreaker:
+    return CircuitBreaker('api.github.com', window_seconds=30, min_requests=4, failure_ratio=0.5,
+                          open_seconds=open_seconds)
+
+
+def _failing(errors):
+    """
+    An attempt that raises the given errors one after the other, then returns the number of calls.
+    """
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return len(calls)
+
+    return attempt
+
+
+def test_check_status():
+    check_status(200, {})
+    check_status(404, {})
+    # A 403 without rate limit headers is an access error, left to the caller
+    check_status(403, {'X-RateLimit-Remaining': '12'})
+    with pytest.raises(RetriableError) as error:
+        check_status(503, {'Retry-After': '7'})
+    assert error.value.retry_after == 7 and not error.value.throttled
+    for status, headers in ((403, {'X-RateLimit-Remaining': '0'}), (403, {'Retry-After': '60'}), (429, {})):
+        with pytest.raises(RetriableError) as error:
+            check_status(status, headers)
+        assert error.value.throttled
+
+
+def test_retries_until_success():
+    policy = _policy()
+    attempt = _failing([RetriableError('502'), asyncio.TimeoutError()])
+
+    assert asyncio.run(policy.run(_URL, attempt)) == 3
+    assert policy.retries == 2 and policy.failures == 0
+
+
+def test_gives_up_after_max_attempts():
+    policy = _policy()
+    attempt = _failing([RetriableError('502')] * 5)
+
+    with pytest.raises(RetriableError):
+        asyncio.run(policy.run(_URL, attempt))
+    assert policy.retries == 2 and policy.failures == 1
+
+
+def test_other_errors_are_not_retried():
+    policy = _policy()
+    attempt = _failing([ValueError('404')])
+
+    with pytest.raises(ValueError):
+        asyncio.run(policy.run(_URL, attempt))
+    assert policy.retries == 0
+
+
+def test_rate_limits_get_every_attempt():
+    policy = _policy()
+    attempt = _failing([RetriableError('rate limit', throttled=True)] * 2)
+
+    assert asyncio.run(policy.run(_URL, attempt, max_attempts=1)) == 3
+    # Throttling says nothing about the health of the host
+    assert policy.breaker(_URL).stats()['failures'] == 0
+
+
+def test_waits_for_retry_after():
+    policy = _policy()
+    attempt = _failing([RetriableError('503', retry_after=0.2)])
+
+    start = time.monotonic()
+    asyncio.run(policy.run(_URL, attempt))
+    assert time.monotonic() - start >= 0.2
+
+
+def test_breaker_opens_on_failure_rate():
+    breaker = _breaker()
+    for success in (True, False, True):
+        breaker.record(success)
+    assert breaker.state() == 'closed' and breaker.blockedFor() == 0
+
+    breaker.record(False)
+    assert breaker.state() == 'open' and breaker.blockedFor() > 0 and breaker.opened == 1
+
+
+def test_half_open_breaker_lets_a_single_probe_through():
+    breaker = _breaker(open_seconds=0.05)
+    for _ in range(4):
+        breaker.record(False)
+    time.sleep(0.06)
+
+    assert breaker.state() == 'half-open'
+    assert breaker.blockedFor() == 0
+    # The probe is in flight, other requests wait for its outcome
+    assert breaker.blockedFor() > 0
+
+    breaker.record(False)
+    assert breaker.state() == 'open'
+    time.sleep(0.06)
+    assert breaker.blockedFor() == 0
+    breaker.record(True)
+    assert breaker.state() == 'closed' and breaker.blockedFor() == 0
+
+
+def test_abandoned_probe_lets_another_one_through():
+    breaker = _breaker(open_seconds=0.05)
+    for _ in range(4):
+        breaker.record(False)
+    time.sleep(0.06)
+
+    assert breaker.blockedFor() == 0
+    breaker.abandon()
+    assert breaker.blockedFor() == 0
+
+
+def test_open_breaker_fails_fast_past_the_deadline():
+    policy = _policy(max_elapsed_seconds=0.5)
+    breaker = policy.breaker(_URL)
+    # Open for GITHUB_CIRCUIT_OPEN_SECONDS, longer than the deadline
+    while breaker.state() == 'closed':
+        breaker.record(False)
+    attempt = _failing([])
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(policy.run(_URL, attempt))
+    assert policy.failures == 1
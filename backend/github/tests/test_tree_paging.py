@@ -0,0 +1,85 @@
+import asyncio
+from typing import List, Tuple
+
+import pytest
+
+import github.fetch_repo as fetch_repo
+from github.config import github_tree_config
+
+
+def _blob(path: str) -> dict:
+    return {'path': path, 'type': 'blob', 'sha': f'blob:{path}', 'size': 10}
+
+
+def _tree(path: str, sha: str) -> dict:
+    return {'path': path, 'type': 'tree', 'sha': sha}
+
+
+# root
+# ├── README.md
+# ├── src (truncated)
+# │   ├── main.py
+# │   ├── core (truncated) ── engine.py, util/helpers.py
+# │   └── api ── routes.py
+# └── node_modules ── left-pad/index.js
+# Listings of each tree SHA, paths relative to it: one level, and recursive with whether GitHub truncated it
+_LEVELS = {
+    'root': [_blob('README.md'), _tree('src', 'src'), _tree('node_modules', 'nm')],
+    'src': [_blob('main.py'), _tree('core', 'core'), _tree('api', 'api')],
+    'core': [_blob('engine.py'), _tree('util', 'util')],
+}
+_RECURSIVE = {
+    'root': ([], True),
+    'src': ([], True),
+    'core': ([], True),
+    'util': ([_blob('helpers.py')], False),
+    'api': ([_blob('routes.py')], False),
+    'nm': ([_tree('left-pad', 'lp'), _blob('left-pad/index.js')], False),
+}
+
+
+@pytest.fixture
+def requests(monkeypatch) -> List[Tuple[str, bool]]:
+    """
+    Serves the tree above instead of the GitHub API, and records the (sha, recursive) listings asked for.
+    """
+    calls = []
+
+    async def fetch_tree_entries(owner, repo, sha, recursive):
+        calls.append((sha, recursive))
+        if recursive:
+            return _RECURSIVE[sha]
+        return _LEVELS[sha], False
+
+    monkeypatch.setattr(fetch_repo, '_fetch_tree_entries', fetch_tree_entries)
+    return calls
+
+
+def _files(tree: fetch_repo.RepoTreeResult) -> List[str]:
+    return tree.files + [f for subdir in tree.subdirectories for f in _files(subdir)]
+
+
+def test_truncated_tree_is_paged(requests):
+    tree = asyncio.run(fetch_repo.fetch_github_repo_tree('o', 'r', 'root'))
+
+    assert sorted(_files(tree)) == [
+        'README.md', 'node_modules/left-pad/index.js', 'src/api/routes.py', 'src/core/engine.py',
+        'src/core/util/helpers.py', 'src/main.py',
+    ]
+    # Folders are listed one level at a time only where the recursive listing was truncated
+    assert ('src', False) in requests and ('core', False) in requests
+    assert ('api', False) not in requests and ('util', False) not in requests
+
+
+def test_pruned_folders_are_not_listed(requests):
+    tree = asyncio.run(fetch_repo.fetch_github_repo_tree('o', 'r', 'root', prune=lambda path: path == 'node_modules'))
+
+    assert 'node_modules/left-pad/index.js' not in _files(tree)
+    assert all(sha != 'nm' for sha, _ in requests)
+
+
+def test_paging_past_the_budget_raises(requests, monkeypatch):
+    monkeypatch.setitem(github_tree_config, 'max_requests', 3)
+
+    with pytest.raises(Exception, match='does not fit in 3 requests'):
+        asyncio.run(fetch_repo.fetch_github_repo_tree('o', 'r', 'root'))
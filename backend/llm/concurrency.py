@@ -0,0 +1,104 @@
+import asyncio
+import time
+from typing import List, Optional
+
+from llm.llm_provider import LLMProvider, HistoryItem
+
+from loguru import logger
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD (additive increase, multiplicative decrease) limit on the number of concurrent LLM calls.
+
+    Every call that succeeds within the latency target grows the limit by 1/limit, so roughly +1 per round of
+    calls. A call rejected because the LLM is overloaded (429, 5xx, timeout) halves it, at most once per
+    typical call duration so a burst of failures from the same overload only counts once.
+    Slow but successful calls keep the limit where it is.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_target: float):
+        """
+        :param initial: Concurrency to start with
+        :param minimum: The limit never drops below this
+        :param maximum: The limit never grows above this
+        :param latency_target: Calls slower than this (seconds) do not grow the limit
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._avgLatency: Optional[float] = None
+        self._lastDecrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float, overloaded: bool):
+        """
+        :param latency: Duration of the call in seconds
+        :param overloaded: True if the call failed because the LLM is overloaded
+        """
+        async with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded:
+                if now - self._lastDecrease > (self._avgLatency or latency):
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._lastDecrease = now
+                    logger.warning(f"LLM is overloaded, lowering concurrency to {int(self.limit)}")
+            else:
+                self._avgLatency = latency if self._avgLatency is None else 0.9 * self._avgLatency + 0.1 * latency
+                if latency <= self.latency_target:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "avg_latency": self._avgLatency,
+        }
+
+
+class ConcurrencyLimitedProvider(LLMProvider):
+    """
+    Wraps an LLMProvider so that its calls go through an AdaptiveConcurrencyLimiter.
+    """
+
+    def __init__(self, provider: LLMProvider, limiter: AdaptiveConcurrencyLimiter):
+        """
+        :param provider: The provider doing the actual calls
+        :param limiter: The limiter, shared by every provider of the process
+        """
+        super().__init__(provider.api_key, provider.model_name, provider.llm_config, provider.system_prompt)
+        self.provider = provider
+        self.limiter = limiter
+
+    def is_overload_error(self, error: Exception) -> bool:
+        return self.provider.is_overload_error(error)
+
+    async def run(self, user_prompt: str, history: Optional[List[HistoryItem]] = None) -> str:
+        """
+        Executes the wrapped LLM once a concurrency slot is free.
+
+        :param user_prompt: User input prompt (The code will go inside here)
+        :param history: The history of the conversation (optional)
+        :return: The LLM response
+        """
+        await self.limiter.acquire()
+        started = time.monotonic()
+        overloaded = False
+        try:
+            return await self.provider.run(user_prompt, history)
+        except Exception as e:
+            overloaded = self.provider.is_overload_error(e)
+            raise
+        finally:
+            await self.limiter.release(time.monotonic() - started, overloaded)
+            self.prompt_tokens = self.provider.prompt_tokens
+            self.completion_tokens = self.provider.completion_tokens
@@ -1,3 +1,6 @@
+from typing import Optional
+
+from llm.concurrency import AdaptiveConcurrencyLimiter, ConcurrencyLimitedProvider
 from llm.llm_config import LLMConfig
 from llm.llm_provider import LLMProvider
 from llm.providers.deepseek import DeepSeekProvider
@@ -13,10 +16,38 @@ LLMEnvConfig = {
     "modelName": os.getenv('LLM_MODELNAME')
 }
 
+# Concurrent LLM calls of the whole process, adapted between min and max (see AdaptiveConcurrencyLimiter)
+LLMConcurrencyConfig = {
+    "initial": int(os.getenv('LLM_CONCURRENCY_INITIAL', '8')),
+    "min": int(os.getenv('LLM_CONCURRENCY_MIN', '1')),
+    "max": int(os.getenv('LLM_CONCURRENCY_MAX', '64')),
+    "latencyTarget": float(os.getenv('LLM_CONCURRENCY_LATENCY_TARGET', '90')),  # seconds
+}
+
 
 class LLMFactory:
+    _limiter: Optional[AdaptiveConcurrencyLimiter] = None
+
+    @classmethod
+    def get_limiter(cls) -> AdaptiveConcurrencyLimiter:
+        """
+        Returns the concurrency limiter shared by every provider created by the factory.
+        """
+        if cls._limiter is None:
+            cls._limiter = AdaptiveConcurrencyLimiter(
+                LLMConcurrencyConfig.get('initial'),
+                LLMConcurrencyConfig.get('min'),
+                LLMConcurrencyConfig.get('max'),
+                LLMConcurrencyConfig.get('latencyTarget'),
+            )
+        return cls._limiter
+
+    @classmethod
+    def create_provider(cls, llm_config: LLMConfig) -> LLMProvider:
+        return ConcurrencyLimitedProvider(cls._create_provider(llm_config), cls.get_limiter())
+
     @staticmethod
-    def create_provider(llm_config: LLMConfig) -> LLMProvider:
+    def _create_provider(llm_config: LLMConfig) -> LLMProvider:
         if not LLMEnvConfig.get('provider'):
             raise Exception(
                 'LLM Provider is not specified. Please set LLM_PROVIDER in the environment\nExample: '
@@ -38,6 +38,29 @@ class LLMProvider(ABC):
         self.model_name = model_name
         self.llm_config = llm_config
         self.system_prompt = system_prompt
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    @property
+    def total_tokens(self) -> int:
+        """
+        Gets the number of tokens consumed by this provider so far.
+        :return: Prompt and completion tokens combined
+        """
+        return self.prompt_tokens + self.completion_tokens
+
+    def is_overload_error(self, error: Exception) -> bool:
+        """
+        Tells whether an error raised by run() means the LLM service is overloaded (rate limited or failing),
+        as opposed to a problem with the request itself.
+
+        :param error: The error raised by run()
+        :return: True for 429 and 5xx responses and timeouts
+        """
+        status_code = getattr(error, 'status_code', None)
+        if status_code is not None:
+            return status_code == 429 or status_code >= 500
+        return isinstance(error, TimeoutError)
 
     @abstractmethod
     async def run(self, user_prompt: str, history: Optional[List[HistoryItem]] = None) -> str:
@@ -3,7 +3,7 @@ from typing import List, Optional
 from llm.llm_config import LLMConfig
 from llm.llm_provider import LLMProvider, HistoryItem
 
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, APIConnectionError
 
 
 class DeepSeekProvider(LLMProvider):
@@ -23,6 +23,16 @@ class DeepSeekProvider(LLMProvider):
         super().__init__(api_key, model_name, llm_config, system_prompt="")
         self.llm = AsyncOpenAI(api_key=api_key, base_url="https://api.deepseek.com")
 
+    def is_overload_error(self, error: Exception) -> bool:
+        """
+        Also treats timeouts and dropped connections of the OpenAI client as overload.
+
+        :param error: The error raised by run()
+        :return: True if the DeepSeek API is overloaded
+        """
+        # APITimeoutError is a subclass of APIConnectionError
+        return isinstance(error, APIConnectionError) or super().is_overload_error(error)
+
     async def run(self, user_prompt: str, history: Optional[List[HistoryItem]] = None) -> str:
         """
         Executes the LLM with the given prompt.
@@ -43,4 +53,8 @@ class DeepSeekProvider(LLMProvider):
             messages=messages
         )
 
+        if completion.usage:
+            self.prompt_tokens += completion.usage.prompt_tokens
+            self.completion_tokens += completion.usage.completion_tokens
+
         return completion.choices[0].message.content
@@ -1,13 +1,39 @@
-from fastapi import FastAPI, Response
+import asyncio
+import math
+from contextlib import asynccontextmanager
+from typing import Optional, List
+
+import aiohttp
+
+from fastapi import FastAPI, Response, HTTPException
 from pydantic import BaseModel
 from starlette import status
 
 from service.queue import InsertQueue
+from github.ratelimit import RateLimitGovernor
+from github.client import GithubClient
+from github.response_cache import ResponseCache
+from github.retry import RetryPolicy, RetriableError, CircuitOpenError
+from github.fetch_repo import RepoNotFoundError, GithubApiError
+from service.summary_cache import FileSummaryCache
+from service.cost_estimator import estimate_repository
+from llm.llm_factory import LLMFactory
 
 from db.utils.connector import AsyncDBConnector
 
 from fastapi.middleware.cors import CORSMiddleware
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    connector = await AsyncDBConnector.init()
+    insert_queue = InsertQueue.getInstance(connector)
+    insert_queue.start()
+    yield
+    await insert_queue.stop()
+    await GithubClient.getInstance().close()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -26,6 +52,10 @@ app.add_middleware(
 class RepoInfo(BaseModel):
     owner: str
     repo: str
+    refresh: bool = False
+    fetch_mode: Optional[str] = None
+    max_file_bytes: Optional[int] = None
+    path_rules: Optional[List[str]] = None
 
 @app.get("/api/queue", status_code=status.HTTP_200_OK)
 async def queue():
@@ -33,9 +63,8 @@ async def queue():
     insert_queue = InsertQueue.getInstance(connector)
 
     return {
-        "current": insert_queue.processingItem,
-        "queue": insert_queue.queue,
-        "time": insert_queue.processingTime
+        "processing": await insert_queue.processing(),
+        "queue": await insert_queue.queue()
     }
 
 
@@ -46,10 +75,54 @@ async def register(repo_info: RepoInfo, response: Response):
     insert_resp = await insert_queue.add(repo_info)
     if insert_resp.success:
         response.status_code = status.HTTP_201_CREATED
+    elif insert_resp.retry_after is not None:
+        response.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+        response.headers["Retry-After"] = str(insert_resp.retry_after)
     else:
         response.status_code = status.HTTP_400_BAD_REQUEST
     return insert_resp
 
+@app.get("/api/estimate", status_code=status.HTTP_200_OK)
+async def estimate(owner: str, repo: str):
+    # Throughput of the LLM calls of the running ingests, so the estimate reflects the current load
+    llm_stats = LLMFactory.get_limiter().stats()
+    try:
+        return await estimate_repository(owner, repo, llm_stats["limit"], llm_stats["avg_latency"])
+    except RepoNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except RetriableError as e:
+        if not e.throttled:
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"GitHub failed: {e}")
+        # The governor parked the token(s) until GitHub accepts requests again
+        retry_after = max(RateLimitGovernor.getInstance().retryAfter(), e.retry_after or 0, 1)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"GitHub rate limit reached: {e}",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(max(e.retry_after, 1)))},
+        )
+    except (GithubApiError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"GitHub failed: {str(e) or type(e).__name__}")
+
+@app.get("/api/github/stats", status_code=status.HTTP_200_OK)
+async def github_stats():
+    return {
+        "tokens": RateLimitGovernor.getInstance().usage(),
+        "http": GithubClient.getInstance().stats(),
+        "response_cache": await ResponseCache.getInstance().stats(),
+        "retry": RetryPolicy.getInstance().stats(),
+    }
+
+@app.get("/api/cache/stats", status_code=status.HTTP_200_OK)
+async def cache_stats():
+    connector = await AsyncDBConnector.init()
+    return await FileSummaryCache.getInstance(connector).stats()
+
 @app.get("/")
 async def root():
     return {"status": "ok"}
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import sys
 import dotenv
 from loguru import logger
 dotenv.load_dotenv()
@@ -11,8 +12,87 @@ TokenProcessingConfig = {
 
 if TokenProcessingConfig['characterLimit'] < TokenProcessingConfig['reduceCharPerRetry']:
     logger.critical('.env: TOKEN_PROCESSING_CHARACTER_LIMIT should be greater than TOKEN_PROCESSING_REDUCE_CHAR_PER_RETRY')
-    os.exit(1)
+    sys.exit(1)
 
 if TokenProcessingConfig['maxRetries'] < 1:
     logger.critical('.env: TOKEN_PROCESSING_MAX_RETRIES should be greater than 0')
-    os.exit(1)
\ No newline at end of file
+    sys.exit(1)
+
+QueueConfig = {
+    "workers": int(os.getenv('QUEUE_WORKERS', '2')), # repositories ingested concurrently by this process
+    "leaseSeconds": int(os.getenv('QUEUE_LEASE_SECONDS', '120')), # a job is reclaimed if not renewed within this time
+    "heartbeatSeconds": int(os.getenv('QUEUE_HEARTBEAT_SECONDS', '10')), # how often a running job renews its lease and publishes progress
+    "pollSeconds": int(os.getenv('QUEUE_POLL_SECONDS', '5')), # how often idle workers look for new jobs
+    "maxAttempts": int(os.getenv('QUEUE_MAX_ATTEMPTS', '3')), # a job is failed after losing its lease this many times
+    "agingBytesPerSecond": float(os.getenv('QUEUE_AGING_BYTES_PER_SECOND', '5000')), # priority a queued job gains per second of waiting
+}
+
+if QueueConfig['workers'] < 1:
+    logger.critical('.env: QUEUE_WORKERS should be greater than 0')
+    sys.exit(1)
+
+if QueueConfig['heartbeatSeconds'] >= QueueConfig['leaseSeconds']:
+    logger.critical('.env: QUEUE_HEARTBEAT_SECONDS should be less than QUEUE_LEASE_SECONDS')
+    sys.exit(1)
+
+# How the contents of the files of an ingest are downloaded, see InsertRepoService._fetchAndInsertFiles
+FETCH_MODES = ('auto', 'raw', 'archive', 'graphql')
+
+PipelineConfig = {
+    "fetchWorkers": int(os.getenv('PIPELINE_FETCH_WORKERS', '16')), # concurrent file downloads per ingest
+    "summarizeWorkers": int(os.getenv('PIPELINE_SUMMARIZE_WORKERS', '64')), # concurrent file summaries per ingest, the LLM limiter still applies
+    "queueSize": int(os.getenv('PIPELINE_QUEUE_SIZE', '32')), # files waiting between two stages
+    "maxInFlightBytes": int(os.getenv('PIPELINE_MAX_IN_FLIGHT_BYTES', str(16 * 1024 * 1024))), # file content held in memory per ingest
+    "fetchMode": os.getenv('PIPELINE_FETCH_MODE', 'auto').lower(), # raw: one request per file, archive: one tarball per commit, graphql: batches of files per query, auto: raw or archive by file count
+    "archiveMinFiles": int(os.getenv('PIPELINE_ARCHIVE_MIN_FILES', '200')), # files to fetch from which auto downloads the tarball
+    "fetchRetrySeconds": float(os.getenv('PIPELINE_FETCH_RETRY_SECONDS', '600')), # time from the start of the fetches during which files that failed transiently are fetched again
+}
+
+if min(PipelineConfig['fetchWorkers'], PipelineConfig['summarizeWorkers'], PipelineConfig['queueSize']) < 1:
+    logger.critical('.env: PIPELINE_FETCH_WORKERS, PIPELINE_SUMMARIZE_WORKERS and PIPELINE_QUEUE_SIZE should be greater than 0')
+    sys.exit(1)
+
+if PipelineConfig['fetchMode'] not in FETCH_MODES:
+    logger.critical(f'.env: PIPELINE_FETCH_MODE should be one of {", ".join(FETCH_MODES)}')
+    sys.exit(1)
+
+if PipelineConfig['fetchRetrySeconds'] < 0:
+    logger.critical('.env: PIPELINE_FETCH_RETRY_SECONDS should not be negative')
+    sys.exit(1)
+
+if PipelineConfig['maxInFlightBytes'] < TokenProcessingConfig['characterLimit']:
+    logger.critical('.env: PIPELINE_MAX_IN_FLIGHT_BYTES should be at least TOKEN_PROCESSING_CHARACTER_LIMIT')
+    sys.exit(1)
+
+# Files left out of the summaries because of their metadata or content, see service/file_filter.py
+FileFilterConfig = {
+    "maxFileBytes": int(os.getenv('FILE_FILTER_MAX_FILE_BYTES', str(1024 * 1024))), # larger blobs are not downloaded (default of a job)
+    "maxLineLength": int(os.getenv('FILE_FILTER_MAX_LINE_LENGTH', '5000')), # a longer line means minified or embedded data
+    "maxAverageLineLength": int(os.getenv('FILE_FILTER_MAX_AVERAGE_LINE_LENGTH', '300')), # minified bundles
+    "minEntropy": float(os.getenv('FILE_FILTER_MIN_ENTROPY', '3.0')), # bits per character, code is around 4.5-5, repetitive data tables much lower
+}
+
+if FileFilterConfig['maxFileBytes'] < 1 or FileFilterConfig['maxLineLength'] < 1 or FileFilterConfig['maxAverageLineLength'] < 1:
+    logger.critical('.env: FILE_FILTER_MAX_FILE_BYTES, FILE_FILTER_MAX_LINE_LENGTH and FILE_FILTER_MAX_AVERAGE_LINE_LENGTH should be greater than 0')
+    sys.exit(1)
+
+SummaryCacheConfig = {
+    "enabled": os.getenv('SUMMARY_CACHE_ENABLED', 'true').lower() == 'true', # reuse file summaries of identical blobs
+    "maxBytes": int(os.getenv('SUMMARY_CACHE_MAX_BYTES', str(256 * 1024 * 1024))), # least recently used summaries are evicted past this size
+}
+
+if SummaryCacheConfig['maxBytes'] < 0:
+    logger.critical('.env: SUMMARY_CACHE_MAX_BYTES should not be negative')
+    sys.exit(1)
+
+# Assumptions of the dry-run estimate of GET /api/estimate, see service/cost_estimator.py
+EstimateConfig = {
+    "charsPerToken": float(os.getenv('ESTIMATE_CHARS_PER_TOKEN', '3.5')), # characters of code per prompt token
+    "completionTokensPerCall": int(os.getenv('ESTIMATE_COMPLETION_TOKENS_PER_CALL', '700')), # tokens of a generated summary
+    "promptOverheadChars": int(os.getenv('ESTIMATE_PROMPT_OVERHEAD_CHARS', '1500')), # format instructions and repository details of a prompt
+    "defaultSecondsPerCall": float(os.getenv('ESTIMATE_DEFAULT_SECONDS_PER_CALL', '30')), # duration of an LLM call before any was observed
+}
+
+if EstimateConfig['charsPerToken'] <= 0:
+    logger.critical('.env: ESTIMATE_CHARS_PER_TOKEN should be greater than 0')
+    sys.exit(1)
@@ -0,0 +1,190 @@
+import math
+from dataclasses import dataclass
+from typing import Optional, List
+
+from agent.prompt import CodePrompt, FolderPrompt
+from github.fetch_repo import RepoTreeResult
+from github.filterfile import default_classifier
+from service.config import TokenProcessingConfig, EstimateConfig, FileFilterConfig
+from service.file_filter import apply_size_policy
+from source.source_factory import SourceFactory
+
+
+@dataclass
+class RepoCostEstimate:
+    file_count: int
+    folder_count: int
+    total_bytes: int  # Size of the files that will be sent to the LLM, the main driver of ingest time and cost
+
+
+@dataclass
+class LLMUsageEstimate:
+    file_calls: int
+    folder_calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    depth: int  # Folder levels, step 8 takes at least one round of calls per level
+
+    @property
+    def calls(self) -> int:
+        return self.file_calls + self.folder_calls
+
+
+def estimate_tree_cost(filtered_tree: RepoTreeResult) -> RepoCostEstimate:
+    file_count = len(filtered_tree.files)
+    folder_count = 1
+    total_bytes = sum(filtered_tree.file_sizes.get(f, 0) for f in filtered_tree.files)
+
+    for subdir in filtered_tree.subdirectories:
+        child = estimate_tree_cost(subdir)
+        file_count += child.file_count
+        folder_count += child.folder_count
+        total_bytes += child.total_bytes
+
+    return RepoCostEstimate(file_count=file_count, folder_count=folder_count, total_bytes=total_bytes)
+
+
+def _reduce_calls(summary_count: int, budget: int) -> int:
+    """
+    Calls of the batch reduce tier (see service/segments.py) for summaries that do not fit in one prompt.
+    """
+    summary_chars = EstimateConfig['completionTokensPerCall'] * EstimateConfig['charsPerToken']
+    calls = 0
+    while summary_count > 1 and summary_count * summary_chars > budget:
+        per_batch = max(int(budget // summary_chars), 1)
+        if per_batch == 1:
+            break
+        summary_count = math.ceil(summary_count / per_batch)
+        calls += summary_count
+    return calls
+
+
+def estimate_llm_usage(filtered_tree: RepoTreeResult) -> LLMUsageEstimate:
+    """
+    Estimates the LLM calls and tokens of ingesting the tree the same way InsertRepoService does it:
+    one call per file (or per segment plus reduce calls for files larger than the character limit),
+    then one call per folder (plus reduce calls for folders with too many children).
+    """
+    budget = TokenProcessingConfig['characterLimit']
+    chars_per_token = EstimateConfig['charsPerToken']
+    completion_tokens = EstimateConfig['completionTokensPerCall']
+    summary_chars = completion_tokens * chars_per_token
+
+    file_calls, folder_calls, prompt_chars = 0, 0, 0.0
+    depth = 0
+
+    def visit(tree: RepoTreeResult, level: int):
+        nonlocal file_calls, folder_calls, prompt_chars, depth
+        depth = max(depth, level)
+        for f in tree.files:
+            size = tree.file_sizes.get(f, 0)
+            if size <= budget:
+                file_calls += 1
+                prompt_chars += len(CodePrompt) + size
+            else:
+                segments = math.ceil(size / budget)
+                reduce_calls = _reduce_calls(segments, budget) + 1
+                file_calls += segments + reduce_calls
+                prompt_chars += segments * len(CodePrompt) + size + reduce_calls * (len(CodePrompt) + budget)
+
+        children = len(tree.files) + len(tree.subdirectories)
+        reduce_calls = _reduce_calls(children, budget)
+        folder_calls += 1 + reduce_calls
+        prompt_chars += (1 + reduce_calls) * len(FolderPrompt) + min(children * summary_chars, budget) \
+            + reduce_calls * budget
+
+        for subdir in tree.subdirectories:
+            visit(subdir, level + 1)
+
+    visit(filtered_tree, 1)
+    calls = file_calls + folder_calls
+    # Format instructions and repository details come with every prompt
+    prompt_chars += calls * EstimateConfig['promptOverheadChars']
+    return LLMUsageEstimate(
+        file_calls=file_calls,
+        folder_calls=folder_calls,
+        prompt_tokens=round(prompt_chars / chars_per_token),
+        completion_tokens=calls * completion_tokens,
+        depth=depth,
+    )
+
+
+def estimate_wall_seconds(usage: LLMUsageEstimate, concurrency: int, seconds_per_call: Optional[float]) -> float:
+    """
+    Expected duration of the LLM steps at the given throughput. Files are summarized `concurrency` at a time,
+    folders as well but never faster than one round of calls per folder level.
+    """
+    seconds_per_call = seconds_per_call or EstimateConfig['defaultSecondsPerCall']
+    concurrency = max(concurrency, 1)
+    file_seconds = math.ceil(usage.file_calls / concurrency) * seconds_per_call
+    folder_seconds = max(math.ceil(usage.folder_calls / concurrency), usage.depth) * seconds_per_call
+    return file_seconds + folder_seconds
+
+
+async def _fetch_filtered_tree(
+        owner: str,
+        repo: str,
+        ref: str,
+        max_file_bytes: Optional[int],
+        path_rules: Optional[List[str]]
+) -> RepoTreeResult:
+    """
+    The tree an ingest of `ref` would summarize, filtered as InsertRepoService filters it.
+    """
+    classifier = default_classifier.withRules(path_rules)
+    tree = await SourceFactory.get_source().fetch_tree(owner, repo, ref, classifier.isFolderExcluded)
+    max_file_bytes = max_file_bytes or FileFilterConfig['maxFileBytes']
+    return apply_size_policy(classifier.filterTree(tree), max_file_bytes, {})
+
+
+async def estimate_repository_cost(
+        owner: str,
+        repo: str,
+        ref: str,
+        max_file_bytes: Optional[int] = None,
+        path_rules: Optional[List[str]] = None
+) -> RepoCostEstimate:
+    """
+    Estimates the ingest cost of a repository from a single recursive tree call, without fetching any content.
+
+    :param ref: Branch name or commit SHA to estimate
+    :param max_file_bytes: Size policy of the job, FILE_FILTER_MAX_FILE_BYTES if None
+    :param path_rules: Path rules of the job, on top of the built-in path filters
+    """
+    return estimate_tree_cost(await _fetch_filtered_tree(owner, repo, ref, max_file_bytes, path_rules))
+
+
+async def estimate_repository(owner: str, repo: str, concurrency: int, seconds_per_call: Optional[float]) -> dict:
+    """
+    Dry run of steps 1, 4 and 5 of an ingest (details, recursive tree, filtering): no file content is fetched
+    and the LLM is not called.
+
+    :param concurrency: Current number of concurrent LLM calls
+    :param seconds_per_call: Current average duration of an LLM call, None if unknown
+    """
+    details = await SourceFactory.get_source().fetch_details(owner, repo)
+    # The same tree as the queue-time estimate of estimate_repository_cost, the LLM usage is derived from it as well
+    filtered_tree = await _fetch_filtered_tree(owner, repo, details.sha, None, None)
+    cost = estimate_tree_cost(filtered_tree)
+    usage = estimate_llm_usage(filtered_tree)
+    return {
+        "owner": details.repo_owner,
+        "repo": details.repo_name,
+        "default_branch": details.default_branch,
+        "commit_sha": details.sha,
+        "file_count": cost.file_count,
+        "folder_count": cost.folder_count,
+        "total_bytes": cost.total_bytes,
+        "llm_calls": {
+            "files": usage.file_calls,
+            "folders": usage.folder_calls,
+            "total": usage.calls,
+        },
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "wall_seconds": round(estimate_wall_seconds(usage, concurrency, seconds_per_call)),
+        "throughput": {
+            "concurrency": concurrency,
+            "seconds_per_call": seconds_per_call,
+        },
+    }
@@ -0,0 +1,84 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from github.fetch_repo import RepoTreeResult
+from service.config import FileFilterConfig
+
+# Markers of generated code, looked for at the start of the comment lines at the top of the file, so code that merely
+# mentions them (e.g. a generator writing "DO NOT EDIT" into its output) is kept
+_GENERATED_MARKER = re.compile(
+    r'^[ \t]*(?://|#|/\*|\*)[ \t]*(?:code generated|@generated|do not edit|(?:this file (?:is|was) )?auto-?generated'
+    r'|generated by the protocol buffer compiler)',
+    re.IGNORECASE | re.MULTILINE
+)
+_HEAD_CHARS = 2048
+# Binary and entropy checks only look at the beginning of the file, it is enough to tell and keeps them cheap
+_SAMPLE_CHARS = 64 * 1024
+# Below this size, a low entropy says nothing (e.g. a short __all__ list)
+_MIN_ENTROPY_CHARS = 4096
+
+
+def apply_size_policy(tree: RepoTreeResult, max_file_bytes: int, skipped: Dict[str, str]) -> RepoTreeResult:
+    """
+    Leaves out the files larger than max_file_bytes according to the tree, before anything is downloaded, and
+    prunes folders left without any files.
+
+    :param skipped: Filled with path => skip reason of the files left out
+    """
+    files = []
+    for fp in tree.files:
+        size = tree.file_sizes.get(fp, 0)
+        if size > max_file_bytes:
+            skipped[fp] = "too large"
+        else:
+            files.append(fp)
+
+    subdirectories = []
+    for subdir in tree.subdirectories:
+        kept = apply_size_policy(subdir, max_file_bytes, skipped)
+        if kept.files or kept.subdirectories:
+            subdirectories.append(kept)
+
+    return RepoTreeResult(
+        path=tree.path,
+        files=files,
+        subdirectories=subdirectories,
+        file_sizes={f: tree.file_sizes[f] for f in files if f in tree.file_sizes},
+        file_shas={f: tree.file_shas[f] for f in files if f in tree.file_shas}
+    )
+
+
+def _line_lengths(content: str) -> Tuple[int, float]:
+    lines = content.splitlines() or [""]
+    return max(len(line) for line in lines), len(content) / len(lines)
+
+
+def _entropy(sample: str) -> float:
+    """
+    Shannon entropy of the characters of the sample, in bits per character.
+    """
+    counts = Counter(sample)
+    total = len(sample)
+    return -sum(count / total * math.log2(count / total) for count in counts.values())
+
+
+def content_skip_reason(content: str) -> Optional[str]:
+    """
+    Fast checks on the content of a downloaded file, for what the path filters and the size policy cannot see.
+
+    :return: Why the file should not be summarized (binary, generated, minified, low entropy), None to keep it
+    """
+    sample = content[:_SAMPLE_CHARS]
+    # NUL characters, or many bytes that were not valid UTF-8
+    if "\x00" in sample or sample.count("\ufffd") > len(sample) / 10:
+        return "binary"
+    if _GENERATED_MARKER.search(content[:_HEAD_CHARS]):
+        return "generated"
+    longest, average = _line_lengths(content)
+    if longest > FileFilterConfig['maxLineLength'] or average > FileFilterConfig['maxAverageLineLength']:
+        return "minified"
+    if len(sample) >= _MIN_ENTROPY_CHARS and _entropy(sample) < FileFilterConfig['minEntropy']:
+        return "low entropy"
+    return None
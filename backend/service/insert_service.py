@@ -1,38 +1,89 @@
 import asyncio
-from typing import Optional, List, Dict
-
-from agent.index import CodeProcessor, FolderProcessor
-from db.model.branch import Branch
+import hashlib
+import random
+import time
+from contextlib import aclosing
+from typing import Optional, List, Dict, Set, Callable, Awaitable
+
+from agent.index import CodeProcessor, FolderProcessor, CodeSegmentsProcessor
+from agent.schema_factory import FileSchema
+from db.model.branch import Branch, BranchData
 from db.model.file import File
 from db.model.folder import Folder
 from db.utils.connector import AsyncDBConnector
-from github.fetch_repo import fetch_github_repo_details, fetch_github_repo_tree, RepoTreeResult, fetch_github_repo_file
-from github.filterfile import whitelisted_file, blacklisted_file, whitelisted_filter, blacklisted_files, \
-    blacklisted_folder, blacklisted_filter
+from github.fetch_repo import RepoTreeResult
+from github.filterfile import default_classifier
+from github.retry import is_transient
 from llm.llm_provider import LLMProvider
 from db.model.repository import Repository, RepositoryData
-from service.config import TokenProcessingConfig
+from service.config import TokenProcessingConfig, PipelineConfig, FileFilterConfig
+from service.file_filter import apply_size_policy, content_skip_reason
+from service.pipeline import ByteBudget, run_stages
+from service.segments import split_lines, reduce_by_budget
+from service.progress import IngestProgress
+from service.summary_cache import FileSummaryCache
+from source.repo_source import RepoSource
+from source.source_factory import SourceFactory
 
 from loguru import logger
 
 
 class InsertRepoService:
-    def __init__(self, db: AsyncDBConnector, llm_provider: LLMProvider):
+    def __init__(
+            self,
+            db: AsyncDBConnector,
+            llm_provider: LLMProvider,
+            progress: Optional[IngestProgress] = None,
+            fetch_mode: Optional[str] = None,
+            source: Optional[RepoSource] = None,
+            max_file_bytes: Optional[int] = None,
+            path_rules: Optional[List[str]] = None,
+            refresh: bool = False
+    ):
+        """
+        :param fetch_mode: How file contents are downloaded (auto, raw, archive or graphql), PIPELINE_FETCH_MODE if None
+        :param source: Where the repository is read from, the source of SOURCE_PROVIDER if None
+        :param max_file_bytes: Larger files are not downloaded, FILE_FILTER_MAX_FILE_BYTES if None
+        :param path_rules: gitignore-style rules applied on top of the built-in path filters, see PathClassifier
+        :param refresh: The repository is already in DB, its metadata (stars, description...) is updated as well
+        """
+        self.llmProvider = llm_provider
+        self.maxFileBytes = max_file_bytes or FileFilterConfig['maxFileBytes']
+        self.pathClassifier = default_classifier.withRules(path_rules)
+        self.source = source or SourceFactory.get_source()
+        self.fetchMode = fetch_mode or PipelineConfig['fetchMode']
+        self.refresh = refresh
+        self.progress = progress or IngestProgress()
         self.repository = Repository(db)
         self.branch = Branch(db)
         self.folder = Folder(db)
         self.file = File(db)
+        self.summaryCache = FileSummaryCache.getInstance(db)
         self.codeProcessor = CodeProcessor(llm_provider)
+        self.segmentsProcessor = CodeSegmentsProcessor(llm_provider)
+        # Version of the prompts a file summary depends on, part of the summary cache key
+        self.filePromptVersion = hashlib.sha256(
+            (self.codeProcessor.prompt_version + self.segmentsProcessor.prompt_version).encode()
+        ).hexdigest()
         self.folderProcessor = FolderProcessor(llm_provider)
         self.folderPathMap: Dict[str, int] = {}
         self.repoFileInfo: Optional[Dict[str, str]] = None
+        # file path => AI summary of the files inserted in step 7, read by the folder summaries of step 8
+        self.fileSummaries: Dict[str, str] = {}
+        # folder path => summary of the folders that need no LLM call in step 8, because they were copied from
+        # the previous snapshot on a refresh or summarized by an interrupted attempt of the ingest
+        self.reusedFolderSummaries: Dict[str, str] = {}
 
     async def insertRepository(self, owner: str, repo: str) -> Optional[RepositoryData]:
+        self.progress.set_stage(1)
         logger.info(f"Step 1: Fetching repository details for {owner}/{repo}...")
-        repo_details = await fetch_github_repo_details(owner, repo)
+        repo_details = await self.source.fetch_details(owner, repo)
 
+        self.progress.set_stage(2)
         logger.info(f"Step 2: Inserting repository {repo_details.repo_owner}/{repo_details.repo_name} into DB...")
-        repositoryData = await self.repository.insert(
+        # insert() leaves an existing repository as it is, a refresh brings its metadata up to date
+        upsert = self.repository.update if self.refresh else self.repository.insert
+        repositoryData = await upsert(
             repo_details.url,
             repo_details.repo_owner,
             repo_details.repo_name,
@@ -49,63 +100,86 @@ class InsertRepoService:
             logger.info(f"Repository already exists: {owner}/{repo}")
             return None
 
-        logger.info(f"Step 3: Inserting branch {repo_details.default_branch} into DB...")
-        branchCommit = await self.branch.insert(
-            repo_details.sha,
-            repo_details.default_branch,
-            repo_details.url,
-            repo_details.commit_at
-        )
+        # On a refresh, the latest snapshot is diffed against the new commit
+        previousBranch = await self.branch.select(repositoryData.url)
+        # An ingest that was interrupted (crash, lost lease) resumes at its own commit to keep what it already did
+        branchCommit = await self.branch.select_interrupted(repositoryData.url)
+        resuming = branchCommit is not None
+
+        if resuming:
+            logger.info(
+                f"Step 3: Resuming the ingest of {owner}/{repo} @ {branchCommit.last_commit_sha} "
+                f"after step {branchCommit.stage}..."
+            )
+        else:
+            if previousBranch and previousBranch.last_commit_sha == repo_details.sha:
+                logger.info(f"Repository {owner}/{repo} is already up to date at {repo_details.sha}")
+                return repositoryData
+
+            self.progress.set_stage(3)
+            logger.info(f"Step 3: Inserting branch {repo_details.default_branch} into DB...")
+            branchCommit = await self.branch.insert(
+                repo_details.sha,
+                repo_details.default_branch,
+                repo_details.url,
+                repo_details.commit_at
+            )
+            if branchCommit.status == 'done':
+                logger.info(f"Commit {repo_details.sha} of {owner}/{repo} was already ingested")
+                return repositoryData
         branchId = branchCommit.branch_id
+        commitSha = branchCommit.last_commit_sha
 
         # Store info for summarization
         self.repoFileInfo = {
             "repo_owner": owner,
             "repo_name": repo,
-            "commit_sha": repo_details.sha
+            "commit_sha": commitSha
         }
 
-        logger.info(f"Step 4: Fetching entire repo tree for {owner}/{repo} @ {repo_details.sha}...")
-        fullTree = await fetch_github_repo_tree(owner, repo, repo_details.sha)
+        self.progress.set_stage(4)
+        logger.info(f"Step 4: Fetching entire repo tree for {owner}/{repo} @ {commitSha}...")
+        fullTree = await self.source.fetch_tree(owner, repo, commitSha, self.pathClassifier.isFolderExcluded)
 
+        self.progress.set_stage(5)
         logger.info("Step 5: Filtering tree in memory...")
         filteredTree = self._filterTree(fullTree)
 
+        self.progress.set_stage(6)
         logger.info("Step 6: Inserting folder structure into DB...")
+        insertedFiles = await self._loadCheckpoint(branchId) if resuming else set()
         await self._insertFolders(filteredTree, branchId, None)
 
-        logger.info("Step 7: Fetching and summarizing files in parallel...")
-        await self._fetchAndInsertFiles(filteredTree)
+        unchangedFiles = set()
+        if previousBranch:
+            logger.info(f"\tCopying what did not change since commit {previousBranch.last_commit_sha}...")
+            unchangedFiles = await self._copyUnchanged(filteredTree, previousBranch, branchId, insertedFiles)
+        self.progress.folders_total = len(self.folderPathMap) - len(self.reusedFolderSummaries)
+        await self.branch.set_stage(branchId, 6)
 
+        self.progress.set_stage(7)
+        if branchCommit.stage < 7:
+            logger.info("Step 7: Fetching and summarizing files in parallel...")
+            await self._fetchAndInsertFiles(filteredTree, insertedFiles | unchangedFiles)
+            await self.branch.set_stage(branchId, 7)
+
+        self.progress.set_stage(8)
         logger.info("Step 8: Summarizing folders bottom-up...")
         await self._summarizeFolders(filteredTree)
 
+        await self.branch.finish(branchId)
         logger.success(f"Done! Inserted and summarized repository {owner}/{repo} successfully.")
         return repositoryData
 
     def _filterTree(self, tree: RepoTreeResult) -> RepoTreeResult:
         logger.info(f'Filtering tree at path "{tree.path or "/"}"...')
-
-        # 1) Filter files
-        allowed_files = whitelisted_file(tree.files, whitelisted_filter)
-        allowed_files = blacklisted_files(allowed_files, blacklisted_file)
-
-        # 2) Filter subfolders
-        allowed_subdirs = blacklisted_folder(tree.subdirectories, blacklisted_filter)
-
-        # Recursively prune
-        pruned_subdirs = []
-        for subdir in allowed_subdirs:
-            filtered_subdir = self._filterTree(subdir)
-            # remove subdirs that contain no files or child subfolders
-            if filtered_subdir.files or filtered_subdir.subdirectories:
-                pruned_subdirs.append(filtered_subdir)
-
-        return RepoTreeResult(
-            path=tree.path,
-            files=allowed_files,
-            subdirectories=pruned_subdirs
-        )
+        skipped: Dict[str, str] = {}
+        filteredTree = apply_size_policy(self.pathClassifier.filterTree(tree), self.maxFileBytes, skipped)
+        for reason in skipped.values():
+            self.progress.file_skipped(reason, fetched=False)
+        if skipped:
+            logger.info(f"\tLeft out {len(skipped)} files larger than {self.maxFileBytes} bytes")
+        return filteredTree
 
     async def _insertFolders(
             self,
@@ -116,137 +190,449 @@ class InsertRepoService:
         folder_name = tree.path.split("/")[-1] if tree.path else ""  # root => ""
         folder_path = tree.path
 
-        logger.info(f'\tInserting folder "{folder_name}" with path "{folder_path}"...')
-        folderData = await self.folder.insert(folder_name, folder_path, branch_id, parent_folder_id)
-
-        self.folderPathMap[folder_path] = folderData.folder_id
+        # Folders inserted by an interrupted attempt are already in folderPathMap
+        folder_id = self.folderPathMap.get(folder_path)
+        if folder_id is None:
+            logger.info(f'\tInserting folder "{folder_name}" with path "{folder_path}"...')
+            folderData = await self.folder.insert(folder_name, folder_path, branch_id, parent_folder_id)
+            folder_id = folderData.folder_id
+            self.folderPathMap[folder_path] = folder_id
 
         # Recurse
         for subdir in tree.subdirectories:
-            await self._insertFolders(subdir, branch_id, folderData.folder_id)
+            await self._insertFolders(subdir, branch_id, folder_id)
+
+    async def _loadCheckpoint(self, branchId: int) -> Set[str]:
+        """
+        Reloads what an interrupted attempt of the ingest already stored: its folders, the summaries of its
+        folders and the files it inserted (a file row is only inserted once the file is summarized).
+
+        :return: The paths of the files that are already inserted
+        """
+        for folder in await self.folder.select(branchId):
+            self.folderPathMap[folder.path] = folder.folder_id
+            if folder.ai_summary:
+                self.reusedFolderSummaries[folder.path] = folder.ai_summary
+
+        insertedFiles = set()
+        for file in await self.file.select_snapshot(branchId):
+            insertedFiles.add(file.path)
+            if file.ai_summary:
+                self.fileSummaries[file.path] = file.ai_summary
+        logger.info(
+            f"\tResuming with {len(self.folderPathMap)} folders, {len(self.reusedFolderSummaries)} folder "
+            f"summaries and {len(insertedFiles)} files already inserted"
+        )
+        return insertedFiles
 
-    async def _fetchAndInsertFiles(self, rootTree: RepoTreeResult):
-        # 1) gather all file paths
-        all_file_paths = []
+    async def _copyUnchanged(
+            self,
+            rootTree: RepoTreeResult,
+            previousBranch: BranchData,
+            branchId: int,
+            insertedFiles: Set[str]
+    ) -> Set[str]:
+        """
+        Diffs the tree against the previous snapshot by git blob SHA and copies the unchanged files, and the
+        folders without any added, changed or deleted file below them, into the new snapshot.
+
+        :param insertedFiles: Files already in the new snapshot (inserted by an interrupted attempt)
+        :return: The paths of the unchanged files
+        """
+        oldSha, newSha = previousBranch.last_commit_sha, self.repoFileInfo["commit_sha"]
+        previousFiles = {f.path: f for f in await self.file.select_snapshot(previousBranch.branch_id)}
+        currentShas: Dict[str, Optional[str]] = {}
 
         def gather_files(t: RepoTreeResult):
-            all_file_paths.extend(t.files)
+            for fp in t.files:
+                currentShas[fp] = t.file_shas.get(fp)
             for s in t.subdirectories:
                 gather_files(s)
 
         gather_files(rootTree)
-        logger.success(f"\tFound {len(all_file_paths)} files to process...")
 
-        # 2) fetch file contents in parallel
-        logger.info(f"\tFetching file contents in parallel...")
+        changedFiles: Set[str] = set()
+        unchangedFiles: Set[str] = set()
+        copyFileIds: List[int] = []
+        copyFolderIds: List[int] = []
+        for fp, sha in currentShas.items():
+            previous = previousFiles.get(fp)
+            if previous and sha and previous.sha == sha and previous.ai_summary:
+                unchangedFiles.add(fp)
+                if fp not in insertedFiles:
+                    copyFileIds.append(previous.file_id)
+                    copyFolderIds.append(self.folderPathMap[fp.rpartition("/")[0]])
+                    self.fileSummaries[fp] = previous.ai_summary.replace(oldSha, newSha)
+            else:
+                changedFiles.add(fp)
+
+        # A folder is summarized again if anything below it was added, changed or deleted
+        dirtyFolders: Set[str] = set()
+        for fp in changedFiles | (previousFiles.keys() - currentShas.keys()):
+            folder_path = fp
+            while folder_path:
+                folder_path = folder_path.rpartition("/")[0]
+                dirtyFolders.add(folder_path)
+
+        previousFolders = {f.path: f for f in await self.folder.select(previousBranch.branch_id)}
+        cleanFolders = [
+            path for path in self.folderPathMap
+            if path not in dirtyFolders and path in previousFolders and previousFolders[path].ai_summary
+        ]
+        for path in cleanFolders:
+            self.reusedFolderSummaries[path] = previousFolders[path].ai_summary.replace(oldSha, newSha)
+
+        await self.file.copy_forward(copyFileIds, copyFolderIds, oldSha, newSha)
+        await self.folder.copy_summaries(branchId, previousBranch.branch_id, cleanFolders, oldSha, newSha)
+        logger.success(
+            f"\tCopied {len(copyFileIds)} unchanged files and {len(cleanFolders)} unchanged folders, "
+            f"{len(changedFiles)} files changed"
+        )
+        return unchangedFiles
+
+    async def _fetchAndInsertFiles(self, rootTree: RepoTreeResult, skip: Set[str]):
+        """
+        Streams every file through fetch -> summarize -> insert. The stages are connected by bounded queues and
+        a file only holds memory between the moment it is fetched and the moment its row is inserted, so memory
+        stays flat whatever the size of the repository and the first rows land right away.
+
+        Files are fetched one request each (e.g. from raw.githubusercontent.com), or all at once with the bulk
+        download of the source (archive mode, e.g. the tarball of the commit extracted while it downloads, or graphql
+        mode, batches of files per GraphQL query).
+        Files the bulk download did not provide are then fetched one by one.
+        A file whose fetch failed transiently (after the retries of the source, e.g. while GitHub is down) is put
+        back in the queue with a backoff, until PIPELINE_FETCH_RETRY_SECONDS after the start of the fetches.
+
+        :param skip: Files that are already in the snapshot (copied from the previous one or inserted by an
+                     interrupted attempt)
+        """
+        # 1) gather all file paths, with their size as reported by the tree
+        file_sizes: Dict[str, int] = {}
+        file_shas: Dict[str, str] = {}
+
+        def gather_files(t: RepoTreeResult):
+            for fp in t.files:
+                if fp in skip:
+                    continue
+                file_sizes[fp] = t.file_sizes.get(fp, TokenProcessingConfig.get('characterLimit'))
+                if fp in t.file_shas:
+                    file_shas[fp] = t.file_shas[fp]
+            for s in t.subdirectories:
+                gather_files(s)
 
-        async def fetch_content(fp: str):
+        gather_files(rootTree)
+        self.progress.files_total = len(file_sizes)
+        logger.success(f"\tFound {len(file_sizes)} files to process...")
+
+        # archive and graphql are bulk downloads, auto picks the archive for large enough file counts
+        fetchMode = self.fetchMode
+        if fetchMode == 'auto':
+            fetchMode = 'archive' if len(file_sizes) >= PipelineConfig['archiveMinFiles'] else 'raw'
+        useBulk = fetchMode != 'raw'
+        budget = ByteBudget(PipelineConfig['maxInFlightBytes'])
+        pathQueue: asyncio.Queue = asyncio.Queue()
+        if not useBulk:
+            for fp in file_sizes:
+                pathQueue.put_nowait(fp)
+        summarizeQueue: asyncio.Queue = asyncio.Queue(PipelineConfig['queueSize'])
+        insertQueue: asyncio.Queue = asyncio.Queue(PipelineConfig['queueSize'])
+
+        fetchDeadline = time.monotonic() + PipelineConfig['fetchRetrySeconds']
+        fetchFailures: Dict[str, int] = {}
+        retryAt: Dict[str, float] = {}
+
+        # 2) fetch file contents, each one waits for its bytes to fit in the budget
+        async def fetch_worker():
+            while not pathQueue.empty():
+                fp = pathQueue.get_nowait()
+                wait = retryAt.pop(fp, 0) - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                reserved = await budget.acquire(file_sizes[fp])
+                try:
+                    content = await self.source.fetch_file(
+                        self.repoFileInfo["repo_owner"],
+                        self.repoFileInfo["repo_name"],
+                        self.repoFileInfo["commit_sha"],
+                        fp
+                    )
+                    self.progress.files_fetched += 1
+                except Exception as e:
+                    failures = fetchFailures[fp] = fetchFailures.get(fp, 0) + 1
+                    # Exponential backoff with jitter, so the files that failed together are not retried together
+                    delay = random.uniform(0.5, 1) * min(2 ** failures, 60)
+                    if is_transient(e) and time.monotonic() + delay < fetchDeadline:
+                        logger.warning(f"\tFailed fetching file: {fp}, retrying in {delay:.0f}s, error: {e}")
+                        self.progress.fetch_retries += 1
+                        retryAt[fp] = time.monotonic() + delay
+                        pathQueue.put_nowait(fp)
+                        await budget.release(reserved)
+                        continue
+                    logger.error(f"\tFailed fetching file: {fp}, error: {e}")
+                    content = None
+                await summarizeQueue.put((fp, content, reserved))
+
+        # 2') or take them from the bulk download as it streams in, the download waits while the budget is full (archive
+        # mode gives up after GITHUB_ARCHIVE_STALL_SECONDS, the files left are then fetched one by one)
+        async def fetch_bulk():
+            remaining = set(file_sizes)
             try:
-                content = await fetch_github_repo_file(
+                files = self.source.fetch_files(
                     self.repoFileInfo["repo_owner"],
                     self.repoFileInfo["repo_name"],
                     self.repoFileInfo["commit_sha"],
-                    fp
+                    set(remaining),
+                    fetchMode
                 )
-                return fp, content
+                async with aclosing(files):
+                    async for fp, content in files:
+                        if fp not in remaining:
+                            continue
+                        remaining.discard(fp)
+                        reserved = await budget.acquire(file_sizes[fp])
+                        self.progress.files_fetched += 1
+                        await summarizeQueue.put((fp, content, reserved))
             except Exception as e:
-                logger.error(f"\tFailed fetching file: {fp}, error: {e}")
-                return fp, None
+                logger.error(f"\tFailed the {fetchMode} download, error: {e}")
+            if remaining:
+                logger.warning(f"\t{len(remaining)} files were not in the {fetchMode} download, fetching them one by one")
+                for fp in remaining:
+                    pathQueue.put_nowait(fp)
+
+        # 3) summarize each file as soon as it is fetched
+        async def summarize_worker():
+            while True:
+                item = await summarizeQueue.get()
+                if item is None:
+                    return
+                fp, content, reserved = item
+                aiSummary = await self._summarizeFile(fp, content, file_shas.get(fp))
+                await insertQueue.put((fp, content, aiSummary, reserved))
+
+        # 4) insert file records in DB, which gives their bytes back to the budget
+        async def insert_worker():
+            while True:
+                item = await insertQueue.get()
+                if item is None:
+                    return
+                fp, content, aiSummary, reserved = item
+                try:
+                    if aiSummary:
+                        await self._insertFile(fp, content, aiSummary, file_shas.get(fp))
+                finally:
+                    await budget.release(reserved)
+
+        async def fetch_stage():
+            if useBulk:
+                await fetch_bulk()
+            await asyncio.gather(*[fetch_worker() for _ in range(PipelineConfig['fetchWorkers'])])
+            for _ in range(PipelineConfig['summarizeWorkers']):
+                await summarizeQueue.put(None)
+
+        async def summarize_stage():
+            await asyncio.gather(*[summarize_worker() for _ in range(PipelineConfig['summarizeWorkers'])])
+            await insertQueue.put(None)
+
+        logger.info(f"\tFetching ({fetchMode}), summarizing and inserting files...")
+        await run_stages([
+            asyncio.create_task(fetch_stage()),
+            asyncio.create_task(summarize_stage()),
+            asyncio.create_task(insert_worker()),
+        ])
+        await self.summaryCache.evict()
+
+    async def _summarizeFile(self, file_path: str, content: Optional[str], sha: Optional[str]) -> Optional[FileSchema]:
+        if not content:
+            self.progress.file_summarized(success=False)
+            return None
 
-        fetch_coros = [fetch_content(fp) for fp in all_file_paths]
-        fetched_files = await asyncio.gather(*fetch_coros)
+        # Binary or generated content that the path filters and the size policy let through
+        skipReason = content_skip_reason(content)
+        if skipReason:
+            logger.info(f"\tSkipping {file_path}: {skipReason}")
+            self.progress.file_skipped(skipReason, fetched=True)
+            return None
 
-        # 3) Summarize each file
-        logger.info(f"\tGenerating summaries for files...")
+        # Identical content was already summarized with the same prompt and model, maybe in another repository
+        cacheKey = (sha, self.filePromptVersion, self.llmProvider.model_name)
+        if sha:
+            cached = await self.summaryCache.get(*cacheKey, self.repoFileInfo, file_path)
+            if cached:
+                self.progress.file_summarized(success=True, cached=True)
+                return cached
 
-        async def summarize_file(file_path: str, content: Optional[str]):
-            if not content:
-                return None
-            aiSummary = None
-            retries = 0
-            wordDeduction = 0
-            reducedContent = content
+        aiSummary = None
+        retries = 0
+        wordDeduction = 0
 
-            while not aiSummary and retries < TokenProcessingConfig.get('maxRetries'):
-                try:
-                    # Simple approach: slice the content to fit the limit
-                    slice_size = TokenProcessingConfig.get('characterLimit') - wordDeduction
-                    reducedContent = content[: max(0, slice_size)]
-                    if self.repoFileInfo is None:
-                        logger.error("ERROR! repoFileInfo is empty!")
-                        continue
-                    aiSummary = await self.codeProcessor.generate(reducedContent, {
-                        "path": file_path,
-                        **(self.repoFileInfo or {})
-                    })
-                except Exception as e:
-                    logger.error(f"\t[Retry {retries + 1}] Failed generating summary for {file_path}")
-                finally:
-                    retries += 1
+        if len(content) > TokenProcessingConfig.get('characterLimit'):
+            aiSummary = await self._summarizeSegments(file_path, content)
+
+        while not aiSummary and retries < TokenProcessingConfig.get('maxRetries'):
+            try:
+                # The file fits the limit, slicing only kicks in if the LLM still rejects it
+                slice_size = TokenProcessingConfig.get('characterLimit') - wordDeduction
+                reducedContent = content[: max(0, slice_size)]
+                if self.repoFileInfo is None:
+                    logger.error("ERROR! repoFileInfo is empty!")
+                    continue
+                aiSummary = await self.codeProcessor.generate(reducedContent, {
+                    "path": file_path,
+                    **(self.repoFileInfo or {})
+                })
+            except Exception as e:
+                logger.error(f"\t[Retry {retries + 1}] Failed generating summary for {file_path}")
+                # An overloaded LLM says nothing about the prompt size, so retry with the same content
+                if not self.llmProvider.is_overload_error(e):
                     wordDeduction += TokenProcessingConfig.get('reduceCharPerRetry')
+            finally:
+                retries += 1
+
+        self.progress.file_summarized(success=aiSummary is not None)
+        self.progress.tokens_used = self.llmProvider.total_tokens
+        if aiSummary and sha:
+            await self.summaryCache.put(*cacheKey, self.repoFileInfo, file_path, aiSummary)
+        return aiSummary
+
+    async def _summarizeSegments(self, file_path: str, content: str) -> Optional[FileSchema]:
+        """
+        Map-reduce for files larger than the character limit: the file is split into segments of whole lines
+        that fit in a prompt, the segments are summarized concurrently, then their summaries are reduced into
+        the summary of the file. Every segment is numbered from its first line in the file, so the line anchors
+        of the links stay right, and the whole file is read.
+        """
+        budget = TokenProcessingConfig.get('characterLimit')
+        repoInfo = {"path": file_path, **(self.repoFileInfo or {})}
+        segments = [
+            (start, start + segment.rstrip("\n").count("\n"), segment)
+            for start, segment in split_lines(content, budget)
+        ]
+        logger.info(f"\t{file_path} does not fit in a prompt, summarizing it in {len(segments)} segments...")
 
-            return {
-                "filePath": file_path,
-                "content": content,
-                "aiSummary": aiSummary
-            }
-
-        summarize_coros = [summarize_file(fp, ct) for fp, ct in fetched_files]
-        processed_files = await asyncio.gather(*summarize_coros)
-
-        # 4) Insert file records in DB
-        logger.info(f"\tInserting summarized files into DB...")
-        for f in processed_files:
-            if not f or not f["aiSummary"]:
-                continue
-
-            file_path = f["filePath"]
-            folder_path = file_path.rpartition("/")[0]
-            # root-level file => folder_path == ""
-            folder_id = self.folderPathMap.get(folder_path, None)
-            if folder_id is None:
-                logger.critical(f"\tNo folder found for path: '{folder_path}' (file: '{file_path}')")
-                continue
-
-            file_name = file_path.split("/")[-1]
-            logger.info(f'\t\tInserting file "{file_name}" (path: "{file_path}")...')
-            await self.file.insert(
-                file_name,
-                folder_id,
-                f["content"],
-                f["aiSummary"].summary,
-                f["aiSummary"].usage
+        results = await asyncio.gather(*[
+            self._generateWithRetries(
+                f"summary of lines {start} - {end} of {file_path}",
+                lambda segment=segment, start=start: self.codeProcessor.generate(segment, repoInfo, start)
             )
+            for start, end, segment in segments
+        ])
+        summaries = [
+            f"Summary of lines {start} - {end}:\n{result.summary}\n"
+            for (start, end, _), result in zip(segments, results)
+            if result
+        ]
+        if not summaries:
+            return None
 
-    async def _summarizeFolders(self, tree: RepoTreeResult) -> Optional[str]:
-        logger.info(f'Summarizing folder "{tree.path or "/"}"...')
+        async def reduce(batch: List[str]) -> Optional[str]:
+            result = await self._generateWithRetries(
+                f"summary of segments of {file_path}",
+                lambda: self.segmentsProcessor.generate(batch, repoInfo)
+            )
+            return result.summary if result else None
 
-        # 1) Summarize subfolders first
-        subfolders_summaries: List[str] = []
-        for subdir in tree.subdirectories:
-            child_summary = await self._summarizeFolders(subdir)
-            if child_summary:
-                subfolders_summaries.append(f"Summary of folder {subdir.path}:\n{child_summary}\n")
+        summaries = await reduce_by_budget(summaries, budget, reduce)
+        return await self._generateWithRetries(
+            f"summary of the segments of {file_path}",
+            lambda: self.segmentsProcessor.generate(summaries, repoInfo)
+        )
+
+    async def _generateWithRetries(self, what: str, generate: Callable[[], Awaitable]):
+        """
+        Calls the LLM through generate() until it succeeds, at most maxRetries times.
+        The prompt is already sized to fit, so a retry sends it unchanged.
+        """
+        for retry in range(TokenProcessingConfig.get('maxRetries')):
+            try:
+                return await generate()
+            except Exception as e:
+                logger.error(f"\t[Retry {retry + 1}] Failed generating {what}, error: {e}")
+        return None
+
+    async def _insertFile(self, file_path: str, content: str, aiSummary: FileSchema, sha: Optional[str]):
+        folder_path = file_path.rpartition("/")[0]
+        # root-level file => folder_path == ""
+        folder_id = self.folderPathMap.get(folder_path, None)
+        if folder_id is None:
+            logger.critical(f"\tNo folder found for path: '{folder_path}' (file: '{file_path}')")
+            return
+
+        file_name = file_path.split("/")[-1]
+        logger.info(f'\t\tInserting file "{file_name}" (path: "{file_path}")...')
+        fileData = await self.file.insert(
+            file_name,
+            folder_id,
+            content,
+            aiSummary.summary,
+            aiSummary.usage,
+            sha
+        )
+        # A row left by a previous attempt keeps its summary, same as what the folder would have read from DB
+        self.fileSummaries[file_path] = fileData.ai_summary if fileData else aiSummary.summary
+
+    async def _summarizeFolders(self, rootTree: RepoTreeResult):
+        """
+        Summarizes the folders as a dependency DAG: every folder is a task that starts its LLM call as soon as
+        all of its subfolders are done, so independent folders run concurrently (bounded by the LLM limiter)
+        and the step takes about as many rounds of calls as the tree is deep.
+        """
+        tasks: List[asyncio.Task] = []
+
+        def schedule(tree: RepoTreeResult) -> asyncio.Task:
+            children = [schedule(subdir) for subdir in tree.subdirectories]
+            task = asyncio.create_task(self._summarizeFolder(tree, children))
+            tasks.append(task)
+            return task
+
+        schedule(rootTree)
+        await run_stages(tasks)
+
+    async def _summarizeFolder(self, tree: RepoTreeResult, children: List[asyncio.Task]) -> Optional[str]:
+        # 1) Wait for the subfolders, they are summarized first
+        child_summaries = await asyncio.gather(*children)
+        if tree.path in self.reusedFolderSummaries:
+            # Nothing changed below this folder since the previous snapshot, or it was summarized before a crash
+            return self.reusedFolderSummaries[tree.path]
+        logger.info(f'Summarizing folder "{tree.path or "/"}"...')
+        subfolders_summaries: List[str] = [
+            f"Summary of folder {subdir.path}:\n{child_summary}\n"
+            for subdir, child_summary in zip(tree.subdirectories, child_summaries)
+            if child_summary
+        ]
 
-        # 2) Gather file summaries from DB
+        # 2) Gather file summaries from the ones kept in step 7
         folder_id = self.folderPathMap.get(tree.path, None)
         if folder_id is None:
             logger.critical(f"\tNo folder ID found for path: '{tree.path}'")
             return None
 
-        files_in_folder = await self.file.select(folder_id)
         file_summaries = [
-            f"Summary of file {f.name}:\n{f.ai_summary}\n"
-            for f in files_in_folder
-            if f.ai_summary
+            f"Summary of file {fp.split('/')[-1]}:\n{self.fileSummaries[fp]}\n"
+            for fp in tree.files
+            if self.fileSummaries.get(fp)
         ]
 
         if not subfolders_summaries and not file_summaries:
             logger.error(f'\tNo summaries found in folder "{tree.path}". Skipping...')
+            self.progress.folder_summarized()
             return None
 
-        # 3) Combine
-        all_summaries = subfolders_summaries + file_summaries
+        # 3) Combine, children that do not fit in one prompt are first reduced in budget-sized batches
+        folderInfo = {"path": tree.path, **(self.repoFileInfo or {})}
+
+        async def reduce(batch: List[str]) -> Optional[str]:
+            result = await self._generateWithRetries(
+                f"summary of a part of folder '{tree.path}'",
+                lambda: self.folderProcessor.generate(batch, folderInfo)
+            )
+            return result.summary if result else None
+
+        all_summaries = await reduce_by_budget(
+            subfolders_summaries + file_summaries,
+            TokenProcessingConfig.get('characterLimit'),
+            reduce,
+            separator="\n\n"
+        )
         combined = "\n\n".join(all_summaries)
 
         # 4) Summarize with folderProcessor
@@ -258,16 +644,16 @@ class InsertRepoService:
             try:
                 slice_size = TokenProcessingConfig.get('characterLimit') - summaryDeduction
                 reduced = combined[: max(0, slice_size)]
-                aiSummary = await self.folderProcessor.generate([reduced], {
-                    "path": tree.path,
-                    **(self.repoFileInfo or {})
-                })
-            except Exception:
+                aiSummary = await self.folderProcessor.generate([reduced], folderInfo)
+            except Exception as e:
                 logger.warning(f"\t[Retry {retries + 1}] Failed to summarize folder '{tree.path}'")
+                if not self.llmProvider.is_overload_error(e):
+                    summaryDeduction += TokenProcessingConfig.get('reduceCharPerRetry')
             finally:
                 retries += 1
-                summaryDeduction += TokenProcessingConfig.get('reduceCharPerRetry')
 
+        self.progress.folder_summarized()
+        self.progress.tokens_used = self.llmProvider.total_tokens
         if not aiSummary:
             logger.warning(f"\tNo AI summary produced for folder '{tree.path}' after max retries.")
             return None
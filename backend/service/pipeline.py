@@ -0,0 +1,50 @@
+import asyncio
+from typing import List
+
+
+class ByteBudget:
+    """
+    Caps the number of content bytes held in memory by the stages of an ingest pipeline.
+    A file reserves its size before it is fetched and releases it once it has been inserted (or dropped).
+
+    A single reservation larger than the whole budget is clamped to it, so a huge file still goes through,
+    just alone.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self._condition = asyncio.Condition()
+
+    def _clamp(self, size: int) -> int:
+        return min(max(size, 0), self.capacity)
+
+    async def acquire(self, size: int) -> int:
+        """
+        Waits until `size` bytes fit in the budget and reserves them.
+        :return: The number of bytes actually reserved, to be given back to release()
+        """
+        size = self._clamp(size)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_use + size <= self.capacity)
+            self.in_use += size
+        return size
+
+    async def release(self, size: int):
+        async with self._condition:
+            self.in_use -= size
+            self._condition.notify_all()
+
+
+async def run_stages(tasks: List[asyncio.Task]):
+    """
+    Awaits the tasks of a pipeline. If one of them fails, the others are cancelled instead of staying blocked
+    on a queue that nobody reads anymore, and the error is raised.
+    """
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
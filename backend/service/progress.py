@@ -0,0 +1,116 @@
+import time
+from typing import Optional, Dict
+
+INGEST_STAGES = {
+    1: "Fetching repository details",
+    2: "Inserting repository",
+    3: "Inserting branch",
+    4: "Fetching repository tree",
+    5: "Filtering tree",
+    6: "Inserting folder structure",
+    7: "Summarizing files",
+    8: "Summarizing folders",
+}
+
+
+class IngestProgress:
+    """
+    Live counters of a single repository ingest, updated by InsertRepoService as it goes through the steps.
+    The ETA is extrapolated from the throughput observed so far in the job, measured on the wall clock since files
+    and folders are summarized concurrently.
+    """
+
+    def __init__(self):
+        self.stage = 0
+        self.files_total = 0
+        self.files_fetched = 0
+        self.fetch_retries = 0  # fetches of files that failed transiently, sent again later in the job
+        self.files_summarized = 0
+        self.files_failed = 0
+        self.files_cached = 0
+        self.files_skipped = 0  # downloaded, then left out because of their content
+        self.skip_reasons: Dict[str, int] = {}  # reason => files left out, before or after download
+        self.folders_total = 0
+        self.folders_summarized = 0
+        self.tokens_used = 0
+        self.started_at = time.time()
+        self._file_stage_started_at: Optional[float] = None
+        self._file_stage_seconds: Optional[float] = None
+        self._folder_stage_started_at: Optional[float] = None
+
+    def set_stage(self, stage: int):
+        self.stage = stage
+        now = time.time()
+        if stage == 7:
+            self._file_stage_started_at = now
+        elif stage == 8:
+            self._folder_stage_started_at = now
+            self._file_stage_seconds = now - (self._file_stage_started_at or now)
+
+    def file_summarized(self, success: bool, cached: bool = False):
+        """
+        Records a finished file, with or without summary.
+        """
+        if cached:
+            self.files_cached += 1
+        if success:
+            self.files_summarized += 1
+        else:
+            self.files_failed += 1
+
+    def file_skipped(self, reason: str, fetched: bool):
+        """
+        Records a file left out of the summaries.
+
+        :param fetched: False if it was left out before download, in which case it is not part of files_total
+        """
+        self.skip_reasons[reason] = self.skip_reasons.get(reason, 0) + 1
+        if fetched:
+            self.files_skipped += 1
+
+    def folder_summarized(self):
+        self.folders_summarized += 1
+
+    def eta_seconds(self) -> Optional[float]:
+        """
+        Estimated seconds until the ingest finishes, or None while there is not enough data to tell.
+        """
+        files_done = self.files_summarized + self.files_failed + self.files_skipped
+        if self.stage < 7 or not files_done:
+            return None
+
+        now = time.time()
+        remaining = 0.0
+        if self.stage == 7:
+            file_stage_seconds = now - self._file_stage_started_at
+            remaining += (self.files_total - files_done) * file_stage_seconds / files_done
+        else:
+            file_stage_seconds = self._file_stage_seconds
+
+        # Until the first folder is done, assume folders are summarized at the rate files were
+        if self.stage == 8 and self.folders_summarized:
+            seconds_per_folder = (now - self._folder_stage_started_at) / self.folders_summarized
+        else:
+            seconds_per_folder = file_stage_seconds / files_done
+        remaining += max(self.folders_total - self.folders_summarized, 0) * seconds_per_folder
+        return remaining
+
+    def to_dict(self) -> dict:
+        eta = self.eta_seconds()
+        return {
+            "stage": self.stage,
+            "stage_name": INGEST_STAGES.get(self.stage),
+            "files_total": self.files_total,
+            "files_fetched": self.files_fetched,
+            "fetch_retries": self.fetch_retries,
+            "files_summarized": self.files_summarized,
+            "files_failed": self.files_failed,
+            "files_cached": self.files_cached,
+            "files_skipped": self.files_skipped,
+            "skip_reasons": self.skip_reasons,
+            "folders_total": self.folders_total,
+            "folders_summarized": self.folders_summarized,
+            "tokens_used": self.tokens_used,
+            "elapsed_seconds": round(time.time() - self.started_at),
+            "eta_seconds": round(eta) if eta is not None else None,
+        }
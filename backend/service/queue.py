@@ -1,46 +1,91 @@
 import asyncio
-import aiohttp
-from typing import List, Optional
+import os
+import socket
+from typing import List, Optional, Dict
 from datetime import datetime, timezone
 
-from github.ratelimit import check_rate_limit
 from llm.llm_config import LLMConfig
 from llm.llm_factory import LLMFactory
-from service.insert_service import InsertRepoService, RepositoryData
+from service.insert_service import InsertRepoService
 from db.utils.connector import AsyncDBConnector
-from llm.llm_provider import LLMProvider
 from db.model.repository import Repository
+from db.model.branch import Branch
+from db.model.insert_job import InsertJob, InsertJobData
+from github.filterfile import default_classifier
 from service.allowed_languages import ALLOWED_LANGUAGES
+from service.cost_estimator import estimate_repository_cost
+from service.config import QueueConfig, FETCH_MODES
+from service.progress import IngestProgress
+from source.source_factory import SourceFactory
 
 from loguru import logger
 
 class InsertItem:
-    def __init__(self, owner: str, repo: str):
+    def __init__(
+            self,
+            owner: str,
+            repo: str,
+            refresh: bool = False,
+            fetch_mode: Optional[str] = None,
+            max_file_bytes: Optional[int] = None,
+            path_rules: Optional[List[str]] = None
+    ):
         self.owner = owner
         self.repo = repo
+        self.refresh = refresh  # re-ingest a repository already in DB at its latest commit
+        self.fetch_mode = fetch_mode  # auto, raw, archive or graphql, PIPELINE_FETCH_MODE if None
+        self.max_file_bytes = max_file_bytes  # larger files are not downloaded, FILE_FILTER_MAX_FILE_BYTES if None
+        self.path_rules = path_rules  # gitignore-style rules on top of the built-in path filters, see PathClassifier
+
+
+class ProcessingItem:
+    def __init__(self, owner: str, repo: str, time: datetime, progress: Optional[dict]):
+        self.owner = owner
+        self.repo = repo
+        self.time = time
+        self.progress = progress
 
 
 class AddRepositoryQueueResult:
-    def __init__(self, success: bool, error: Optional[str] = None, message: Optional[str] = None):
+    def __init__(
+            self,
+            success: bool,
+            error: Optional[str] = None,
+            message: Optional[str] = None,
+            retry_after: Optional[int] = None
+    ):
         self.success = success
         self.error = error
         self.message = message
+        self.retry_after = retry_after
 
 
 class InsertQueue:
+    """
+    Ingest queue backed by the InsertJob table.
+    add() only inserts a row, and the workers of every backend process claim rows from the table,
+    so pending jobs survive restarts and the queue is shared by all replicas.
+    Jobs are not run in FIFO order but smallest estimated repository first, with aging (see InsertJob.claim).
+    """
     _instance: Optional["InsertQueue"] = None
 
     def __init__(self, db: AsyncDBConnector):
         self._db = db
-        self._queue: List[InsertItem] = []
-        self._isProcessing = False
-        self._processingItem: Optional[InsertItem] = None
-        self._processingTime: Optional[str] = None
+        self._jobs = InsertJob(db)
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._newJob = asyncio.Event()
+        self._rateLimitLock = asyncio.Lock()
         self._rateLimitBeforeStop: int = 500
         self._maxQueueSize: int = 25
+        self._defaultRetryAfter: int = 60
+        self._minRetryAfter: int = 10
+        self._maxRetryAfter: int = 3600
+        self._maxWorkers: int = QueueConfig['workers']
+        self._instanceId = f"{socket.gethostname()}:{os.getpid()}"
         self.llm_config = LLMConfig(1, 0.95, 0, 8192)
-        self._repoService = InsertRepoService(db, LLMFactory.create_provider(llm_config=self.llm_config))
         self._repository = Repository(db)
+        self._branch = Branch(db)
+        self._source = SourceFactory.get_source()
 
     @classmethod
     def getInstance(cls, db: AsyncDBConnector) -> "InsertQueue":
@@ -48,82 +93,220 @@ class InsertQueue:
             cls._instance = InsertQueue(db)
         return cls._instance
 
-    @property
-    def queue(self) -> List[InsertItem]:
-        return self._queue
+    async def queue(self) -> List[InsertItem]:
+        jobs = await self._jobs.select_queued(QueueConfig['agingBytesPerSecond'])
+        return [
+            InsertItem(
+                job.owner,
+                job.repo,
+                refresh=job.refresh,
+                fetch_mode=job.fetch_mode,
+                max_file_bytes=job.max_file_bytes,
+                path_rules=job.path_rules
+            )
+            for job in jobs
+        ]
 
-    @property
-    def processingItem(self) -> Optional[InsertItem]:
-        return self._processingItem
+    async def processing(self) -> List[ProcessingItem]:
+        jobs = await self._jobs.select_processing()
+        return [ProcessingItem(job.owner, job.repo, job.started_at, job.progress) for job in jobs]
 
-    @property
-    def processingTime(self) -> Optional[str]:
-        return self._processingTime
+    async def retryAfter(self) -> int:
+        """
+        Seconds until a queue slot is expected to free up, i.e. until the first running job finishes
+        according to the ETA it last published.
+        """
+        now = datetime.now(timezone.utc)
+        etas = [
+            job.progress["eta_seconds"] - (now - job.progress_updated_at).total_seconds()
+            for job in await self._jobs.select_processing()
+            if job.progress and job.progress.get("eta_seconds") is not None
+        ]
+        if not etas:
+            return self._defaultRetryAfter
+        return round(min(max(min(etas), self._minRetryAfter), self._maxRetryAfter))
 
     async def add(self, item: InsertItem) -> AddRepositoryQueueResult:
-        # Check if item is already in queue
-        if any(i.owner == item.owner and i.repo == item.repo for i in self._queue):
+        if item.fetch_mode is not None and item.fetch_mode not in FETCH_MODES:
+            return AddRepositoryQueueResult(False, f"Fetch mode should be one of {', '.join(FETCH_MODES)}")
+        if item.max_file_bytes is not None and item.max_file_bytes < 1:
+            return AddRepositoryQueueResult(False, "Maximum file size should be greater than 0")
+        try:
+            default_classifier.withRules(item.path_rules)
+        except ValueError as e:
+            return AddRepositoryQueueResult(False, str(e))
+
+        # Check if item is already in queue or being processed
+        if await self._jobs.select_active(item.owner, item.repo):
             return AddRepositoryQueueResult(False, "Item already in queue")
 
-        # Check if the repository is in DB (already exists)
+        # Check if the repository is in DB (already exists), unless it is refreshed.
+        # A refresh only summarizes again the files that changed since the ingested commit
         existing_repo = await self._repository.select(item.owner, item.repo)
-        if existing_repo:
-            return AddRepositoryQueueResult(False, "Item already in database")
+        if existing_repo and not item.refresh:
+            # A repository whose ingest never finished can be queued again, it resumes where it stopped
+            interrupted = await self._branch.select_interrupted(existing_repo.url)
+            if interrupted is None and await self._branch.select(existing_repo.url):
+                return AddRepositoryQueueResult(False, "Item already in database")
 
         # Check queue size
-        if len(self._queue) >= self._maxQueueSize:
-            return AddRepositoryQueueResult(False, "Queue is full")
-
-        # Check if the repository actually exists on GitHub
-        logger.info(f"Asking GitHub if {item.owner}/{item.repo} exists...")
-        github_api = f"https://api.github.com/repos/{item.owner}/{item.repo}"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(github_api, ssl=False) as resp:
-                if resp.status != 200:
-                    return AddRepositoryQueueResult(False, "Repository does not exist")
-                data = await resp.json()
-                repo_language = data.get("language")
-                if repo_language and repo_language not in ALLOWED_LANGUAGES:
-                    return AddRepositoryQueueResult(
-                        False,
-                        f"Sorry, {repo_language} Language is not supported for analysis"
-                    )
-
-        self._queue.append(item)
-        if not self._isProcessing:
-            asyncio.create_task(self._processQueue())
+        if await self._jobs.count_queued() >= self._maxQueueSize:
+            return AddRepositoryQueueResult(False, "Queue is full", retry_after=await self.retryAfter())
+
+        # Check if the repository actually exists in the source (GitHub unless SOURCE_PROVIDER says otherwise)
+        logger.info(f"Asking the source if {item.owner}/{item.repo} exists...")
+        data = await self._source.fetch_metadata(item.owner, item.repo)
+        if data is None:
+            return AddRepositoryQueueResult(False, "Repository does not exist")
+        repo_language = data.get("language")
+        if repo_language and repo_language not in ALLOWED_LANGUAGES:
+            return AddRepositoryQueueResult(
+                False,
+                f"Sorry, {repo_language} Language is not supported for analysis"
+            )
+        default_branch = data.get("default_branch")
+
+        # Estimate the size of the repository so small repositories don't wait behind huge ones
+        estimated_files, estimated_bytes = None, None
+        try:
+            estimate = await estimate_repository_cost(
+                item.owner, item.repo, default_branch, item.max_file_bytes, item.path_rules
+            )
+            estimated_files, estimated_bytes = estimate.file_count, estimate.total_bytes
+            logger.info(f"Estimated {item.owner}/{item.repo}: {estimated_files} files, {estimated_bytes} bytes")
+        except Exception as e:
+            logger.warning(f"Failed to estimate the size of {item.owner}/{item.repo}, error: {e}")
+
+        # The unique index on active jobs settles races between concurrent requests and replicas
+        if not await self._jobs.insert(
+            item.owner,
+            item.repo,
+            estimated_files,
+            estimated_bytes,
+            item.fetch_mode,
+            item.max_file_bytes,
+            item.path_rules,
+            item.refresh
+        ):
+            return AddRepositoryQueueResult(False, "Item already in queue")
+
+        self._newJob.set()
         return AddRepositoryQueueResult(
             True,
             message=f"Repository {item.owner}/{item.repo} added to queue"
         )
 
-    async def _processQueue(self):
-        self._isProcessing = True
-        while self._queue:
-            rateLimit = await check_rate_limit()
-            if rateLimit and rateLimit["remaining"] < self._rateLimitBeforeStop:
+    def start(self):
+        for workerId in range(self._maxWorkers):
+            if workerId not in self._workers:
+                self._workers[workerId] = asyncio.create_task(self._processQueue(workerId))
+        logger.info(f"Started {self._maxWorkers} queue workers on {self._instanceId}")
+
+    async def stop(self):
+        # Jobs of cancelled workers keep their lease until it expires, then any replica picks them up again
+        for worker in self._workers.values():
+            worker.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
+
+    async def _processQueue(self, workerId: int):
+        leaseOwner = f"{self._instanceId}:{workerId}"
+        while True:
+            job = None
+            try:
+                await self._waitForRateLimit()
+                abandoned = await self._jobs.fail_abandoned(QueueConfig['maxAttempts'])
+                if abandoned:
+                    logger.warning(f"Marked {abandoned} abandoned job(s) as failed")
+                job = await self._jobs.claim(
+                    leaseOwner,
+                    QueueConfig['leaseSeconds'],
+                    QueueConfig['maxAttempts'],
+                    QueueConfig['agingBytesPerSecond']
+                )
+            except Exception as e:
+                logger.error(f"[Worker {workerId}] Failed to claim a job, error: {e}")
+
+            if job is None:
+                await self._waitForJob()
+                continue
+
+            await self._processJob(workerId, leaseOwner, job)
+
+    async def _waitForJob(self):
+        try:
+            await asyncio.wait_for(self._newJob.wait(), timeout=QueueConfig['pollSeconds'])
+        except asyncio.TimeoutError:
+            pass
+        self._newJob.clear()
+
+    async def _waitForRateLimit(self):
+        # Workers share one check so that only a single worker polls GitHub (and sleeps) at a time
+        async with self._rateLimitLock:
+            while True:
+                rateLimit = await self._source.rate_limit()
+                if not rateLimit or rateLimit["remaining"] >= self._rateLimitBeforeStop:
+                    return
+
                 logger.info("Rate limit reached. Stopping queue processing.")
-                waitTime = (rateLimit["reset"] - int(datetime().now().timestamp())) * 1000
+                waitTime = (rateLimit["reset"] - int(datetime.now().timestamp())) * 1000
                 if waitTime < 0:
                     waitTime = 0
                 logger.info(f"Waiting for {waitTime / 1000} seconds")
                 await asyncio.sleep(waitTime / 1000 + 1)
-                continue
 
-            item = self._queue.pop(0)
-            await self._processItem(item)
+    async def _heartbeat(
+            self,
+            job: InsertJobData,
+            leaseOwner: str,
+            ingest: asyncio.Task,
+            progress: IngestProgress
+    ) -> bool:
+        while not ingest.done():
+            await asyncio.sleep(QueueConfig['heartbeatSeconds'])
+            try:
+                if not await self._jobs.heartbeat(
+                        job.job_id, leaseOwner, QueueConfig['leaseSeconds'], progress.to_dict()
+                ):
+                    logger.error(f"Lost the lease of {job.owner}/{job.repo}, stopping its ingest")
+                    ingest.cancel()
+                    return False
+            except Exception as e:
+                # A missed heartbeat is fine as long as one succeeds before the lease expires
+                logger.warning(f"Failed to renew the lease of {job.owner}/{job.repo}, error: {e}")
+        return True
 
-        self._isProcessing = False
+    async def _processJob(self, workerId: int, leaseOwner: str, job: InsertJobData):
+        logger.info(f"[Worker {workerId}] Processing item: {job.owner}/{job.repo} (attempt {job.attempts})")
+        # folderPathMap and repoFileInfo are per-repository state, so every job gets its own service.
+        # It also gets its own provider so that the tokens it uses can be counted per job
+        progress = IngestProgress()
+        llmProvider = LLMFactory.create_provider(llm_config=self.llm_config)
+        repoService = InsertRepoService(
+            self._db,
+            llmProvider,
+            progress,
+            job.fetch_mode,
+            max_file_bytes=job.max_file_bytes,
+            path_rules=job.path_rules,
+            refresh=job.refresh
+        )
+        ingest = asyncio.create_task(repoService.insertRepository(job.owner, job.repo))
+        heartbeat = asyncio.create_task(self._heartbeat(job, leaseOwner, ingest, progress))
+        error = None
+        try:
+            await ingest
+        except asyncio.CancelledError:
+            if heartbeat.done() and not heartbeat.cancelled() and heartbeat.result() is False:
+                return
+            raise
+        except Exception as e:
+            logger.error(f"Failed to process item: {job.owner}/{job.repo}, error: {e}")
+            error = str(e) or type(e).__name__
+        finally:
+            heartbeat.cancel()
 
-    async def _processItem(self, item: InsertItem) -> Optional[RepositoryData]:
-        logger.info(f"Processing item: {item.owner}/{item.repo}")
-        self._processingTime = datetime.now(timezone.utc)
-        self._processingItem = item
-        result = None
         try:
-            result = await self._repoService.insertRepository(item.owner, item.repo)
+            await self._jobs.finish(job.job_id, leaseOwner, error)
         except Exception as e:
-            logger.error(f"Failed to process item: {item.owner}/{item.repo}, error: {e}")
-        self._processingItem = None
-        self._processingTime = None
-        return result
+            logger.error(f"Failed to mark job {job.owner}/{job.repo} as finished, error: {e}")
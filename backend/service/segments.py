@@ -0,0 +1,93 @@
+import asyncio
+from typing import List, Tuple, Callable, Awaitable, Optional
+
+from loguru import logger
+
+
+def split_lines(content: str, budget: int) -> List[Tuple[int, str]]:
+    """
+    Splits a file into consecutive segments of whole lines, each at most `budget` characters long.
+    A single line longer than the budget (e.g. minified code) is cut, its pieces keep its line number.
+
+    :return: (line number of the first line of the segment, segment) pairs covering the whole content
+    """
+    segments: List[Tuple[int, str]] = []
+    current: List[str] = []
+    size = 0
+    start = 1
+
+    def flush():
+        nonlocal current, size
+        if current:
+            segments.append((start, "".join(current)))
+        current, size = [], 0
+
+    for number, line in enumerate(content.splitlines(keepends=True), start=1):
+        while len(line) > budget:
+            flush()
+            segments.append((number, line[:budget]))
+            line = line[budget:]
+        if size + len(line) > budget:
+            flush()
+        if not current:
+            start = number
+        current.append(line)
+        size += len(line)
+    flush()
+    return segments
+
+
+def batch_by_budget(texts: List[str], budget: int, separator: str = "\n") -> List[List[str]]:
+    """
+    Groups consecutive texts into batches whose joined length fits the budget.
+    A text longer than the budget on its own is truncated to it, in a batch of its own.
+    """
+    batches: List[List[str]] = []
+    current: List[str] = []
+    size = 0
+    for text in texts:
+        text = text[:budget]
+        added = len(text) + (len(separator) if current else 0)
+        if current and size + added > budget:
+            batches.append(current)
+            current, size = [], 0
+            added = len(text)
+        current.append(text)
+        size += added
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def reduce_by_budget(
+        summaries: List[str],
+        budget: int,
+        reduce: Callable[[List[str]], Awaitable[Optional[str]]],
+        separator: str = "\n",
+) -> List[str]:
+    """
+    Map-reduce tier for summaries that do not fit in a single prompt: they are grouped into budget-sized
+    batches, each batch is summarized (concurrently), and so on with the batch summaries until they fit.
+    A batch whose reduce fails is kept as is, truncated to its share of the budget.
+
+    :param reduce: Summarizes a batch of summaries into one, None on failure
+    :return: Summaries whose joined length fits the budget
+    """
+    level = 0
+    while len(separator.join(summaries)) > budget and len(summaries) > 1:
+        batches = batch_by_budget(summaries, budget, separator)
+        if len(batches) >= len(summaries):
+            # Every summary fills a prompt on its own, reducing again would not make them shorter
+            break
+        level += 1
+        logger.info(f"\tReducing {len(summaries)} summaries in {len(batches)} batches (level {level})...")
+        reduced = await asyncio.gather(*[reduce(batch) for batch in batches])
+        summaries = [
+            summary if summary else separator.join(batch)[: budget // len(batches)]
+            for batch, summary in zip(batches, reduced)
+        ]
+    if len(separator.join(summaries)) > budget:
+        # Reducing could not get them under the budget, every summary keeps an equal share of it
+        share = max(budget // len(summaries) - len(separator), 0)
+        summaries = [summary[:share] for summary in summaries]
+    return summaries
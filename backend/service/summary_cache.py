@@ -0,0 +1,131 @@
+from typing import Optional, Dict
+
+from agent.schema_factory import FileSchema
+from db.model.summary_cache import SummaryCache, SummaryCacheData
+from db.utils.connector import AsyncDBConnector
+from service.config import SummaryCacheConfig
+
+from loguru import logger
+
+
+def rewrite_summary(cached: SummaryCacheData, repo_info: Dict[str, str], path: str) -> str:
+    """
+    Points the GitHub links of a cached summary to the repository, commit and path it is reused for.
+    The blob is identical, so the line numbers of the links stay valid.
+    """
+    old_repo = f"{cached.repo_owner}/{cached.repo_name}/blob/{cached.commit_sha}/"
+    new_repo = f"{repo_info['repo_owner']}/{repo_info['repo_name']}/blob/{repo_info['commit_sha']}/"
+    summary = cached.ai_summary.replace(old_repo + cached.path, new_repo + path)
+
+    # Links to other files: if the file moved (e.g. src/x.py vendored as lib/foo/x.py), its siblings moved too
+    old_dirs, new_dirs = cached.path.split("/")[:-1], path.split("/")[:-1]
+    while old_dirs and new_dirs and old_dirs[-1] == new_dirs[-1]:
+        old_dirs.pop()
+        new_dirs.pop()
+    old_dir = "".join(f"{d}/" for d in old_dirs)
+    new_dir = "".join(f"{d}/" for d in new_dirs)
+    # Links outside of that folder keep pointing to the source repository at its commit, which stays valid
+    return summary.replace(old_repo + old_dir, new_repo + new_dir)
+
+
+class FileSummaryCache:
+    """
+    Process-wide access to the SummaryCache table, with hit/miss counters and size-based eviction.
+    Summaries are keyed by (git blob SHA, prompt version, model name), so identical files in forks, vendored
+    copies or unrelated repositories are only summarized once.
+    """
+    _instance: Optional["FileSummaryCache"] = None
+
+    def __init__(self, db: AsyncDBConnector):
+        self._cache = SummaryCache(db)
+        self._enabled: bool = SummaryCacheConfig['enabled']
+        self._maxBytes: int = SummaryCacheConfig['maxBytes']
+        self._storedSinceEviction = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def getInstance(cls, db: AsyncDBConnector) -> "FileSummaryCache":
+        if cls._instance is None:
+            cls._instance = FileSummaryCache(db)
+        return cls._instance
+
+    async def get(
+            self,
+            blob_sha: str,
+            prompt_hash: str,
+            model_name: str,
+            repo_info: Dict[str, str],
+            path: str
+    ) -> Optional[FileSchema]:
+        """
+        Returns the cached summary of a blob, rewritten for the given repository, commit and path.
+        A failing cache only costs an LLM call, so errors are logged and reported as a miss.
+        """
+        if not self._enabled:
+            return None
+        try:
+            cached = await self._cache.lookup(blob_sha, prompt_hash, model_name)
+        except Exception as e:
+            logger.warning(f"\tFailed reading the summary cache for {path}, error: {e}")
+            cached = None
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return FileSchema(usage=cached.usage or "", summary=rewrite_summary(cached, repo_info, path))
+
+    async def put(
+            self,
+            blob_sha: str,
+            prompt_hash: str,
+            model_name: str,
+            repo_info: Dict[str, str],
+            path: str,
+            summary: FileSchema
+    ):
+        if not self._enabled:
+            return
+        try:
+            await self._cache.insert(
+                blob_sha,
+                prompt_hash,
+                model_name,
+                repo_info['repo_owner'],
+                repo_info['repo_name'],
+                repo_info['commit_sha'],
+                path,
+                summary.summary,
+                summary.usage,
+            )
+            self._storedSinceEviction += 1
+        except Exception as e:
+            logger.warning(f"\tFailed storing the summary of {path} in the cache, error: {e}")
+
+    async def evict(self):
+        """
+        Trims the cache back to its maximum size if summaries were stored since the last eviction.
+        """
+        if not self._enabled or not self._storedSinceEviction:
+            return
+        try:
+            evicted = await self._cache.evict(self._maxBytes)
+            self._storedSinceEviction = 0
+            self.evictions += evicted
+            if evicted:
+                logger.info(f"Evicted {evicted} summaries from the summary cache")
+        except Exception as e:
+            logger.warning(f"Failed evicting the summary cache, error: {e}")
+
+    async def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self._enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "max_bytes": self._maxBytes,
+            **(await self._cache.size() if self._enabled else {}),
+        }
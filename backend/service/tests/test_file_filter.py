@@ -0,0 +1,76 @@
+import random
+import string
+
+from github.fetch_repo import build_repo_tree
+from service.file_filter import apply_size_policy, content_skip_reason
+
+
+def _code(lines: int) -> str:
+    rng = random.Random(0)
+    words = ["def", "return", "self", "value", "items", "for", "in", "if", "None", "result", "index", "name"]
+    return "".join(
+        "    " + " ".join(rng.choice(words) for _ in range(6)) + f"  # {rng.randrange(10 ** 6)}\n" for _ in range(lines)
+    )
+
+
+def test_size_policy_skips_large_files_and_prunes_empty_folders():
+    tree = build_repo_tree([
+        {'path': 'small.py', 'type': 'blob', 'sha': 's1', 'size': 100},
+        {'path': 'data', 'type': 'tree', 'sha': ''},
+        {'path': 'data/dump.py', 'type': 'blob', 'sha': 's2', 'size': 5000},
+        {'path': 'src', 'type': 'tree', 'sha': ''},
+        {'path': 'src/app.py', 'type': 'blob', 'sha': 's3', 'size': 1000},
+        {'path': 'src/big.py', 'type': 'blob', 'sha': 's4', 'size': 1001},
+    ])
+    skipped = {}
+
+    kept = apply_size_policy(tree, 1000, skipped)
+
+    assert kept.files == ['small.py'] and kept.file_shas == {'small.py': 's1'}
+    assert [subdir.path for subdir in kept.subdirectories] == ['src']
+    assert kept.subdirectories[0].files == ['src/app.py']
+    assert kept.subdirectories[0].file_sizes == {'src/app.py': 1000}
+    assert skipped == {'data/dump.py': 'too large', 'src/big.py': 'too large'}
+
+
+def test_source_code_is_kept():
+    assert content_skip_reason(_code(300)) is None
+    assert content_skip_reason("") is None
+
+
+def test_binary():
+    assert content_skip_reason("PNG\x00\x01\x02" + _code(10)) == "binary"
+    assert content_skip_reason("\ufffd" * 50 + "abc") == "binary"
+
+
+def test_generated():
+    assert content_skip_reason("// Code generated by protoc-gen-go. DO NOT EDIT.\n" + _code(10)) == "generated"
+    assert content_skip_reason("/**\n * @generated by Relay\n */\n" + _code(10)) == "generated"
+    assert content_skip_reason("# This file is auto-generated, see Makefile\n" + _code(10)) == "generated"
+    # Only the top of the file is looked at
+    assert content_skip_reason(_code(300) + "# @generated\n") is None
+
+
+def test_mention_of_a_marker_is_not_generated():
+    # A generator writing the marker into its output, and a comment talking about generated files
+    assert content_skip_reason('HEADER = "// Code generated by gen.py. DO NOT EDIT."\n' + _code(10)) is None
+    assert content_skip_reason("# Parses files that say DO NOT EDIT or are auto-generated\n" + _code(10)) is None
+
+
+def test_minified():
+    bundle = "var a=1;" * 1000
+    assert content_skip_reason(bundle) == "minified"
+    assert content_skip_reason("\n".join(["x" * 400] * 20)) == "minified"
+
+
+def test_low_entropy():
+    table = "0, 0, 0, 1,\n" * 1000
+    assert content_skip_reason(table) == "low entropy"
+    # Too short for the entropy to tell anything
+    assert content_skip_reason("0, 0, 0, 1,\n" * 10) is None
+
+
+def test_random_text_is_not_low_entropy():
+    rng = random.Random(0)
+    text = "".join(rng.choice(string.ascii_letters + " \n") for _ in range(10000))
+    assert content_skip_reason(text) is None
@@ -0,0 +1,51 @@
+import pytest
+
+import service.progress as progress_module
+from service.progress import IngestProgress
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(progress_module.time, 'time', lambda: now[0])
+    return now
+
+
+def _progress(files: int, folders: int) -> IngestProgress:
+    progress = IngestProgress()
+    progress.files_total = files
+    progress.folders_total = folders
+    return progress
+
+
+def test_no_eta_before_the_first_file(clock):
+    progress = _progress(10, 5)
+    assert progress.eta_seconds() is None
+    progress.set_stage(7)
+    assert progress.eta_seconds() is None
+
+
+def test_eta_follows_the_wall_clock_rate_of_files(clock):
+    progress = _progress(100, 10)
+    progress.set_stage(7)
+    for _ in range(20):
+        progress.file_summarized(success=True)
+    clock[0] += 10
+
+    # 80 files left at 2 files per second, then 10 folders assumed to go at the same rate
+    assert progress.eta_seconds() == pytest.approx(40 + 5)
+
+
+def test_concurrent_folders_are_not_counted_one_after_the_other(clock):
+    progress = _progress(10, 100)
+    progress.set_stage(7)
+    for _ in range(10):
+        progress.file_summarized(success=True)
+    clock[0] += 10
+    progress.set_stage(8)
+    # 20 folders done in 4 seconds, whatever the time each of their LLM calls took
+    for _ in range(20):
+        progress.folder_summarized()
+    clock[0] += 4
+
+    assert progress.eta_seconds() == pytest.approx(80 * 0.2)
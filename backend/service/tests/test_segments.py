@@ -0,0 +1,65 @@
+import asyncio
+
+from service.segments import split_lines, batch_by_budget, reduce_by_budget
+
+
+def test_split_lines_keeps_whole_lines():
+    content = "a = 1\nb = 2\nc = 3\nd = 4\n"
+
+    segments = split_lines(content, 12)
+
+    assert segments == [(1, "a = 1\nb = 2\n"), (3, "c = 3\nd = 4\n")]
+    assert "".join(segment for _, segment in segments) == content
+
+
+def test_split_lines_cuts_a_line_longer_than_the_budget():
+    content = "short\n" + "x" * 25 + "\nend"
+
+    segments = split_lines(content, 10)
+
+    assert segments == [(1, "short\n"), (2, "x" * 10), (2, "x" * 10), (2, "xxxxx\nend")]
+    assert all(len(segment) <= 10 for _, segment in segments)
+    assert "".join(segment for _, segment in segments) == content
+
+
+def test_split_lines_of_empty_content():
+    assert split_lines("", 10) == []
+
+
+def test_batch_by_budget_counts_the_separator():
+    assert batch_by_budget(["aaaa", "bbbb", "cccc"], 9) == [["aaaa", "bbbb"], ["cccc"]]
+    assert batch_by_budget(["aaaa", "bbbb", "cccc"], 8) == [["aaaa"], ["bbbb"], ["cccc"]]
+
+
+def test_batch_by_budget_truncates_a_text_longer_than_the_budget():
+    assert batch_by_budget(["ab", "x" * 20, "cd"], 5) == [["ab"], ["x" * 5], ["cd"]]
+
+
+def test_reduce_by_budget_reduces_level_by_level():
+    calls = []
+
+    async def reduce(batch):
+        calls.append(len(batch))
+        return "s" * 5
+
+    summaries = asyncio.run(reduce_by_budget(["x" * 5] * 16, 17, reduce))
+
+    assert len("\n".join(summaries)) <= 17
+    # 16 summaries in batches of 3, then the 6 batch summaries in batches of 3
+    assert calls == [3, 3, 3, 3, 3, 1, 3, 3]
+
+
+def test_reduce_by_budget_keeps_a_failed_batch_truncated():
+    async def reduce(batch):
+        return None if batch[0].startswith("fail") else "ok"
+
+    summaries = asyncio.run(reduce_by_budget(["fail1", "fail2", "good1", "good2"], 12, reduce))
+
+    assert summaries == ["fail1\n", "ok"]
+
+
+def test_reduce_by_budget_leaves_fitting_summaries_alone():
+    async def reduce(batch):
+        raise AssertionError("nothing to reduce")
+
+    assert asyncio.run(reduce_by_budget(["a", "b"], 10, reduce)) == ["a", "b"]
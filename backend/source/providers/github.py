@@ -0,0 +1,56 @@
+from contextlib import aclosing
+from typing import AsyncIterator, Optional, Set, Tuple, Callable
+
+from github.fetch_repo import (
+    RepoDetails,
+    RepoTreeResult,
+    fetch_github_repo_metadata,
+    fetch_github_repo_details,
+    fetch_github_repo_tree,
+    fetch_github_repo_file,
+    fetch_github_repo_archive,
+    fetch_github_repo_files_graphql,
+)
+from github.ratelimit import check_rate_limit
+from source.repo_source import RepoSource
+
+
+class GithubSource(RepoSource):
+    """
+    Concrete class implementing a RepoSource over the GitHub REST API and raw.githubusercontent.com.
+    Bulk downloads extract the files from the tarball of the commit, or read them in batches through GraphQL.
+    """
+
+    async def fetch_metadata(self, owner: str, repo: str) -> Optional[dict]:
+        return await fetch_github_repo_metadata(owner, repo)
+
+    async def fetch_details(self, owner: str, repo: str) -> RepoDetails:
+        return await fetch_github_repo_details(owner, repo)
+
+    async def fetch_tree(
+            self,
+            owner: str,
+            repo: str,
+            sha: str,
+            prune: Optional[Callable[[str], bool]] = None
+    ) -> RepoTreeResult:
+        return await fetch_github_repo_tree(owner, repo, sha, prune)
+
+    async def fetch_file(self, owner: str, repo: str, sha: str, path: str) -> str:
+        return await fetch_github_repo_file(owner, repo, sha, path)
+
+    async def fetch_files(
+            self,
+            owner: str,
+            repo: str,
+            sha: str,
+            paths: Set[str],
+            method: str = 'archive'
+    ) -> AsyncIterator[Tuple[str, str]]:
+        fetch = fetch_github_repo_files_graphql if method == 'graphql' else fetch_github_repo_archive
+        async with aclosing(fetch(owner, repo, sha, paths)) as files:
+            async for path, content in files:
+                yield path, content
+
+    async def rate_limit(self) -> Optional[dict]:
+        return await check_rate_limit()
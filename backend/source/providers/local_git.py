@@ -0,0 +1,158 @@
+import asyncio
+import os
+import re
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Set, Tuple, Callable
+
+from github.fetch_repo import RepoDetails, RepoTreeResult, RepoNotFoundError, build_repo_tree
+from source.repo_source import RepoSource
+
+# Owner and repository names are used as path components, never let them leave the root
+_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+_OBJECT_TYPES = ('blob', 'tree', 'commit', 'tag')
+
+
+class LocalGitSource(RepoSource):
+    """
+    Concrete class implementing a RepoSource over git repositories on disk, e.g. internal mirrors or fixtures
+    for offline benchmarks. {root}/{owner}/{repo}.git (bare) or {root}/{owner}/{repo} (working copy) is read
+    with the git CLI at the commit of its HEAD, so no network is involved and ingests are only limited by the LLM.
+
+    Summaries still link to https://github.com/{owner}/{repo} (or url_base), as for a mirror of GitHub.
+    """
+
+    def __init__(self, root: str, url_base: str = 'https://github.com'):
+        """
+        :param root: Folder containing a folder per owner, each containing the repositories of that owner
+        :param url_base: Base of the url of the ingested repositories
+        """
+        self.root = root
+        self.url_base = url_base.rstrip('/')
+
+    def _repoPath(self, owner: str, repo: str) -> Optional[str]:
+        if not all(_NAME_PATTERN.match(name) and name not in ('.', '..') for name in (owner, repo)):
+            return None
+        for candidate in (f'{repo}.git', repo):
+            path = os.path.join(self.root, owner, candidate)
+            if os.path.isdir(path):
+                return path
+        return None
+
+    async def _git(self, owner: str, repo: str, *args: str) -> bytes:
+        path = self._repoPath(owner, repo)
+        if path is None:
+            raise RepoNotFoundError(f'Local repository not found: {owner}/{repo}')
+        process = await asyncio.create_subprocess_exec(
+            'git', '-C', path, *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise Exception(f'git {args[0]} failed for {owner}/{repo}: {stderr.decode(errors="replace").strip()}')
+        return stdout
+
+    async def fetch_metadata(self, owner: str, repo: str) -> Optional[dict]:
+        if self._repoPath(owner, repo) is None:
+            return None
+        try:
+            default_branch = (await self._git(owner, repo, 'symbolic-ref', '--short', 'HEAD')).decode().strip()
+        except Exception:
+            # Detached HEAD or empty repository
+            return None
+        return {'name': repo, 'default_branch': default_branch, 'language': None}
+
+    async def fetch_details(self, owner: str, repo: str) -> RepoDetails:
+        default_branch = (await self._git(owner, repo, 'symbolic-ref', '--short', 'HEAD')).decode().strip()
+        sha, timestamp = (await self._git(owner, repo, 'log', '-1', '--format=%H %ct', 'HEAD')).decode().split()
+        return RepoDetails(
+            repo_owner=owner,
+            repo_name=repo,
+            url=f'{self.url_base}/{owner}/{repo}',
+            topics=[],
+            language=None,
+            description=None,
+            stars=0,
+            forks=0,
+            default_branch=default_branch,
+            sha=sha,
+            # Naive UTC, like the dates of the GitHub API
+            commit_at=datetime.fromtimestamp(int(timestamp), timezone.utc).replace(tzinfo=None)
+        )
+
+    async def fetch_tree(
+            self,
+            owner: str,
+            repo: str,
+            sha: str,
+            prune: Optional[Callable[[str], bool]] = None
+    ) -> RepoTreeResult:
+        # A single local listing, nothing to gain from pruning
+        # -t lists the folders too, -l adds the size of the blobs, -z keeps unusual paths verbatim
+        output = await self._git(owner, repo, 'ls-tree', '-r', '-t', '-l', '-z', sha)
+        items = []
+        for entry in output.decode(errors='replace').split('\0'):
+            if not entry:
+                continue
+            info, _, path = entry.partition('\t')
+            _, item_type, item_sha, size = info.split()
+            items.append({
+                'path': path,
+                'type': item_type,
+                'sha': item_sha,
+                'size': int(size) if size.isdigit() else 0,
+            })
+        return build_repo_tree(items)
+
+    async def fetch_file(self, owner: str, repo: str, sha: str, path: str) -> str:
+        content = await self._git(owner, repo, 'cat-file', 'blob', f'{sha}:{path}')
+        return content.decode('utf-8', errors='replace')
+
+    async def fetch_files(
+            self,
+            owner: str,
+            repo: str,
+            sha: str,
+            paths: Set[str],
+            method: str = 'archive'
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Streams all the files out of a single `git cat-file --batch` process instead of one process per file,
+        whatever the method.
+        """
+        repo_path = self._repoPath(owner, repo)
+        if repo_path is None:
+            raise RepoNotFoundError(f'Local repository not found: {owner}/{repo}')
+        # cat-file reads one object name per line
+        requested: List[str] = sorted(path for path in paths if '\n' not in path)
+        process = await asyncio.create_subprocess_exec(
+            'git', '-C', repo_path, 'cat-file', '--batch',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+
+        async def write_requests():
+            for path in requested:
+                process.stdin.write(f'{sha}:{path}\n'.encode())
+                await process.stdin.drain()
+            process.stdin.close()
+
+        writer = asyncio.create_task(write_requests())
+        try:
+            for path in requested:
+                header = (await process.stdout.readline()).decode(errors='replace').rstrip('\n')
+                # "<object sha> <type> <size>", or "<name> missing" for paths that are not in the commit
+                parts = header.rsplit(' ', 2)
+                if len(parts) != 3 or parts[1] not in _OBJECT_TYPES or not parts[2].isdigit():
+                    continue
+                content = await process.stdout.readexactly(int(parts[2]))
+                await process.stdout.readexactly(1)  # newline after the content
+                if parts[1] == 'blob':
+                    yield path, content.decode('utf-8', errors='replace')
+            await writer
+        finally:
+            writer.cancel()
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
@@ -0,0 +1,73 @@
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional, Set, Tuple, Callable
+
+from github.fetch_repo import RepoDetails, RepoTreeResult
+
+
+class RepoSource(ABC):
+    """
+    Abstract class for the places repositories are ingested from (e.g. the GitHub API, local git repositories)
+    """
+
+    @abstractmethod
+    async def fetch_metadata(self, owner: str, repo: str) -> Optional[dict]:
+        """
+        Cheap existence check before a repository is queued.
+
+        :return: At least the 'default_branch' and 'language' of the repository, None if it does not exist
+        """
+        raise NotImplementedError("fetch_metadata() must be implemented")
+
+    @abstractmethod
+    async def fetch_details(self, owner: str, repo: str) -> RepoDetails:
+        """
+        :return: The details of the repository and the commit its default branch points to
+        """
+        raise NotImplementedError("fetch_details() must be implemented")
+
+    @abstractmethod
+    async def fetch_tree(
+            self,
+            owner: str,
+            repo: str,
+            sha: str,
+            prune: Optional[Callable[[str], bool]] = None
+    ) -> RepoTreeResult:
+        """
+        :param sha: Commit SHA or branch name
+        :param prune: Called with the path of a folder, True if what is below it will be filtered out anyway, so
+                      sources that list trees in several requests can skip it
+        :return: Every folder and file of the repository at that commit, with blob SHAs and sizes
+        """
+        raise NotImplementedError("fetch_tree() must be implemented")
+
+    @abstractmethod
+    async def fetch_file(self, owner: str, repo: str, sha: str, path: str) -> str:
+        """
+        :return: The content of a file at a commit
+        """
+        raise NotImplementedError("fetch_file() must be implemented")
+
+    async def fetch_files(
+            self,
+            owner: str,
+            repo: str,
+            sha: str,
+            paths: Set[str],
+            method: str = 'archive'
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Bulk download of many files at a commit, yields (path, content) as they arrive.
+        Files that cannot be provided are not yielded. By default, the files are fetched one by one.
+
+        :param method: archive or graphql, for sources with several ways of downloading many files
+        """
+        for path in paths:
+            yield path, await self.fetch_file(owner, repo, sha, path)
+
+    async def rate_limit(self) -> Optional[dict]:
+        """
+        :return: The remaining quota of the source ('remaining' requests until 'reset'), None if unlimited or
+                 unknown
+        """
+        return None
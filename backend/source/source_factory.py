@@ -0,0 +1,43 @@
+from typing import Optional
+
+from source.repo_source import RepoSource
+from source.providers.github import GithubSource
+from source.providers.local_git import LocalGitSource
+
+import os
+import dotenv
+
+dotenv.load_dotenv()
+
+SourceEnvConfig = {
+    "provider": os.getenv('SOURCE_PROVIDER', 'github'),
+    "localRoot": os.getenv('SOURCE_LOCAL_ROOT'),
+    "localUrlBase": os.getenv('SOURCE_LOCAL_URL_BASE', 'https://github.com'),
+}
+
+
+class SourceFactory:
+    _source: Optional[RepoSource] = None
+
+    @classmethod
+    def get_source(cls) -> RepoSource:
+        """
+        Returns the source every repository is ingested from, shared by the whole process.
+        """
+        if cls._source is None:
+            cls._source = cls._create_source()
+        return cls._source
+
+    @staticmethod
+    def _create_source() -> RepoSource:
+        match SourceEnvConfig.get('provider'):
+            case 'github':
+                return GithubSource()
+            case 'local':
+                if not SourceEnvConfig.get('localRoot'):
+                    raise Exception(
+                        'Local repositories folder is not specified. Please set SOURCE_LOCAL_ROOT in the environment'
+                        '\nExample: SOURCE_LOCAL_ROOT=/srv/git for /srv/git/{owner}/{repo}.git')
+                return LocalGitSource(SourceEnvConfig.get('localRoot'), SourceEnvConfig.get('localUrlBase'))
+            case _:
+                raise Exception('Unsupported repository source, SOURCE_PROVIDER should be github or local')
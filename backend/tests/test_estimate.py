@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime
+
+import aiohttp
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from github.fetch_repo import RepoNotFoundError, GithubApiError, RepoDetails, build_repo_tree
+from github.retry import RetriableError, CircuitOpenError
+from service.cost_estimator import estimate_repository, estimate_repository_cost
+from source.source_factory import SourceFactory
+
+
+def _estimate(monkeypatch, error: Exception):
+    async def estimate_repository(owner, repo, concurrency, seconds_per_call):
+        raise error
+
+    monkeypatch.setattr(main, 'estimate_repository', estimate_repository)
+    # Without the lifespan of the app, no database needed
+    client = TestClient(main.app, raise_server_exceptions=False)
+    return client.get('/api/estimate', params={'owner': 'o', 'repo': 'r'})
+
+
+def test_missing_repository_is_404(monkeypatch):
+    assert _estimate(monkeypatch, RepoNotFoundError('Repository o/r not found')).status_code == 404
+
+
+def test_rate_limit_is_429_with_retry_after(monkeypatch):
+    response = _estimate(monkeypatch, RetriableError('GitHub rate limit: 403', throttled=True))
+
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_open_circuit_is_503_with_retry_after(monkeypatch):
+    response = _estimate(monkeypatch, CircuitOpenError('Requests to api.github.com are paused', retry_after=12.3))
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '13'
+
+
+@pytest.mark.parametrize('error', [
+    RetriableError('GitHub server error: 502'),
+    GithubApiError('GitHub API Error: 401', 401),
+    aiohttp.ClientConnectionError(),
+    asyncio.TimeoutError(),
+])
+def test_upstream_failure_is_502(monkeypatch, error):
+    assert _estimate(monkeypatch, error).status_code == 502
+
+
+def test_bug_is_500(monkeypatch):
+    assert _estimate(monkeypatch, KeyError('default_branch')).status_code == 500
+
+
+class _Source:
+    """
+    A repository whose tree has files the path filters and the size policy leave out.
+    """
+
+    def __init__(self):
+        self.refs = []
+
+    async def fetch_details(self, owner, repo):
+        return RepoDetails(owner, repo, f'https://github.com/{owner}/{repo}', [], 'Python', None, 0, 0, 'main',
+                           'a' * 40, datetime.now())
+
+    async def fetch_tree(self, owner, repo, ref, prune=None):
+        self.refs.append(ref)
+        paths = {'src/app.py': 100, 'src/huge.py': 10 ** 9, 'docs/guide.md': 100, 'node_modules/x/index.js': 100}
+        items = [{'path': folder, 'type': 'tree', 'sha': ''} for folder in ('src', 'docs', 'node_modules', 'node_modules/x')]
+        items += [{'path': path, 'type': 'blob', 'sha': '', 'size': size} for path, size in paths.items()]
+        return build_repo_tree(items)
+
+
+def test_estimate_matches_the_queue_estimate(monkeypatch):
+    source = _Source()
+    monkeypatch.setattr(SourceFactory, '_source', source)
+
+    async def run():
+        return await estimate_repository('o', 'r', 4, None), await estimate_repository_cost('o', 'r', 'a' * 40)
+
+    estimate, cost = asyncio.run(run())
+
+    # Filtered by the classifier of the queue, at the commit of the default branch
+    assert source.refs == ['a' * 40, 'a' * 40]
+    assert (estimate['file_count'], estimate['folder_count'], estimate['total_bytes']) == (1, 2, 100)
+    assert (cost.file_count, cost.folder_count, cost.total_bytes) == (1, 2, 100)
@@ -3,16 +3,28 @@
 import { Card, CardHeader, CardTitle, CardContent } from "@/components/ui/card";
 import React, { useState, useEffect } from "react";
 
+interface IngestProgress {
+	stage: number;
+	stage_name: string | null;
+	files_total: number;
+	files_summarized: number;
+	folders_total: number;
+	folders_summarized: number;
+	eta_seconds: number | null;
+}
+
 interface ProcessingItemProps {
 	owner: string;
 	repo: string;
 	createdAt: string;
+	progress?: IngestProgress | null;
 }
 
 export default function ProcessingItem({
 	owner,
 	repo,
 	createdAt,
+	progress,
 }: ProcessingItemProps) {
 	const [elapsedTime, setElapsedTime] = useState(
 		calculateElapsedTime(createdAt),
@@ -38,6 +50,13 @@ export default function ProcessingItem({
 					<p className="text-sm text-muted-foreground mb-4">
 						Processing this item for: {elapsedTime}
 					</p>
+					{progress && (
+						<p className="text-sm text-muted-foreground">
+							Step {progress.stage}/8: {progress.stage_name} ({progress.files_summarized}/{progress.files_total} files,{" "}
+							{progress.folders_summarized}/{progress.folders_total} folders)
+							{progress.eta_seconds !== null && <> - about {formatDuration(progress.eta_seconds * 1000)} left</>}
+						</p>
+					)}
 				</CardContent>
 			</Card>
 		</div>
@@ -47,8 +66,10 @@ export default function ProcessingItem({
 function calculateElapsedTime(createdAt: string): string {
 	const now = Date.now();
 	const createdTime = new Date(createdAt).getTime();
-	const elapsedTime = now - createdTime;
+	return formatDuration(now - createdTime);
+}
 
+function formatDuration(elapsedTime: number): string {
 	const seconds = Math.floor(elapsedTime / 1000);
 	const minutes = Math.floor(seconds / 60);
 	const hours = Math.floor(minutes / 60);
@@ -9,8 +9,7 @@ import React from "react";
 
 export default function Page() {
     const [queue, setQueue] = useState([]);
-    const [processing, setProcessing] = useState(null);
-    const [processingTime, setProcessingTime] = useState("");
+    const [processing, setProcessing] = useState([]);
     const [isLoading, setIsLoading] = useState(true);
 
     useEffect(() => {
@@ -20,8 +19,7 @@ export default function Page() {
             if (response.ok) {
                 const data = await response.json();
                 setQueue(data.queue || []);
-                setProcessing(data.current || null);
-                setProcessingTime(data.time || "");
+                setProcessing(data.processing || []);
             }
             setIsLoading(false);
         };
@@ -38,8 +36,12 @@ export default function Page() {
     return (
         <div className="container mx-auto p-4 h-[calc(80vh-2rem)] flex flex-col space-y-4">
                         <h1>Currently Processing</h1>
-                        {processing ? (
-                            <ProcessingItem owner={processing.owner} repo={processing.repo} createdAt={processingTime} />
+                        {processing.length > 0 ? (
+                            <div className="space-y-2">
+                                {processing.map((item) => (
+                                    <ProcessingItem key={`${item.owner}/${item.repo}`} owner={item.owner} repo={item.repo} createdAt={item.time} progress={item.progress} />
+                                ))}
+                            </div>
                         ) : (
                             <div className="flex items-center justify-center h-full text-muted-foreground">
                                 <AlertCircle className="mr-2 h-4 w-4" />
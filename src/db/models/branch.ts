@@ -8,11 +8,18 @@ export interface BranchData {
     commit_at: Date
     created_at: Date
     ai_summary: string | null
+    status: 'ingesting' | 'done'
 }
 
 export class Branch {
     async select(repository_url: string): Promise<BranchData | null> {
-        const query = 'SELECT * FROM Branch WHERE repository_url = $1'
+        // Latest complete snapshot, a refresh in progress keeps showing the previous one
+        const query = `
+            SELECT * FROM Branch
+            WHERE repository_url = $1 AND status = 'done'
+            ORDER BY created_at DESC, branch_id DESC
+            LIMIT 1
+        `
         const values = [repository_url]
         const result = await dbConn.query(query, values)
         return result.rows[0] || null
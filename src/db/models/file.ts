@@ -8,6 +8,7 @@ export interface FileData {
     content: string
     ai_summary: string | null
     usage: string | null
+    sha: string | null
 }
 
 export class File {
@@ -44,8 +44,9 @@ export class FetchRepoService {
         if (!repositoryData) return null
 
         const branchData = await this.branch.select(repositoryData.url)
+        if (!branchData) return { repository: repositoryData, branch: null, folders: [] }
 
-        const allFolders = await this.folder.select(branchData!.branch_id)
+        const allFolders = await this.folder.select(branchData.branch_id)
         if (!allFolders) return null
 
         const folders: FullFolder[] = branchData